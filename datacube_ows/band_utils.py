@@ -5,6 +5,8 @@
 # SPDX-License-Identifier: Apache-2.0
 from __future__ import division
 
+from functools import wraps
+
 import numpy
 
 # Style index functions
@@ -20,6 +22,7 @@ def scale_data(imgband_data, scale_from, scale_to):
 
 
 def scalable(undecorated):
+    @wraps(undecorated)
     def decorated(*args, **kwargs):
         scale_from = kwargs.pop("scale_from", None)
         scale_to = kwargs.pop("scale_to", None)
@@ -34,6 +37,7 @@ def scalable(undecorated):
 
 
 def band_modulator(undecorated):
+    @wraps(undecorated)
     def decorated(data, *args, **kwargs):
         band_mapper = kwargs.get("band_mapper", None)
         mult_band = kwargs.pop("mult_band", None)
@@ -0,0 +1,192 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+In-memory cache of rendered capabilities documents (and WCS coverage descriptions).
+
+Capabilities documents are cached per worker process, keyed by service, version, base URL,
+requested sections and locale.  Coverage descriptions are keyed by service, version, coverages
+and locale.  Cached documents are discarded when the configuration object's
+cache generation changes (i.e. when the configuration is reloaded or layer ranges are updated).
+Capabilities are not cached if any layer has dynamic ranges that are reloaded on every access
+(i.e. dynamic layers without the background range refresher).
+
+Each document is identified by a hash of its content, which is used as both the HTTP ETag and
+the OGC updateSequence.  Because the hash depends only on the content, it is consistent
+between worker processes.
+
+Compressed (gzip/deflate) versions of each document are also cached, so documents are
+compressed at most once per encoding.  The total size of cached documents (including compressed
+versions) is bounded by $OWS_CAPABILITIES_CACHE_SIZE bytes: the least recently used documents
+are discarded first.
+"""
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Type, Union
+
+from flask import has_request_context, request
+from werkzeug.http import http_date, parse_etags
+
+from datacube_ows.http_compression import compress, negotiate_encoding
+from datacube_ows.ogc_exceptions import OGCException
+from datacube_ows.ogc_utils import cache_control_headers
+
+# Rendered into the updateSequence attribute, and replaced by the document hash.
+UPDATE_SEQUENCE_PLACEHOLDER = "ows-update-sequence-placeholder"
+
+# Default maximum total size of the cached documents of a worker process, in bytes.
+DEFAULT_CACHE_SIZE = 16 * 1024 * 1024
+
+
+class CachedDocument:
+    def __init__(self, cfg, generation: str, body: Union[str, bytes], content_type: str) -> None:
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.cfg = cfg
+        self.generation = generation
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.body = body.replace(UPDATE_SEQUENCE_PLACEHOLDER.encode("utf-8"), self.etag.encode("utf-8"))
+        self.content_type = content_type
+        self.last_modified = http_date(time())
+        self.encoded_bodies: Dict[str, bytes] = {}
+        self.cached = False
+
+    def encoded(self, encoding: Optional[str], level: int) -> bytes:
+        """
+        The document body, compressed with the given content encoding (compressed at most once).
+        """
+        if encoding is None:
+            return self.body
+        if encoding not in self.encoded_bodies:
+            self.encoded_bodies[encoding] = compress(self.body, encoding, level)
+            if self.cached:
+                with _cache_lock:
+                    evict(self.cfg.capabilities_cache_size)
+        return self.encoded_bodies[encoding]
+
+    @property
+    def size(self) -> int:
+        """
+        The size of the document in memory (including compressed versions), in bytes.
+        """
+        return len(self.body) + sum(len(b) for b in self.encoded_bodies.values())
+
+    def is_current(self, cfg) -> bool:
+        return self.cfg is cfg and self.generation == cfg.cache_generation
+
+
+_cache: "OrderedDict[Hashable, CachedDocument]" = OrderedDict()
+_cache_lock = Lock()
+
+
+def capabilities_cacheable(cfg) -> bool:
+    """
+    Capabilities can only be cached if no layer ranges are reloaded on every access.
+    """
+    if cfg.range_refresh_interval:
+        return True
+    return not any(lyr.dynamic for lyr in cfg.product_index.values())
+
+
+def request_locale(cfg) -> Optional[str]:
+    if cfg.internationalised and has_request_context():
+        from flask_babel import get_locale
+        return str(get_locale())
+    return None
+
+
+def request_etags():
+    if has_request_context():
+        return parse_etags(request.headers.get("If-None-Match"))
+    return parse_etags(None)
+
+
+def evict(max_size: int) -> None:
+    """
+    Discard the least recently used documents until the cache is within max_size bytes.
+
+    Must be called holding _cache_lock.
+    """
+    total = sum(doc.size for doc in _cache.values())
+    while _cache and total > max_size:
+        _, doc = _cache.popitem(last=False)
+        total -= doc.size
+
+
+def clear_capabilities_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def cached_document(cfg, key: Tuple, render: Callable[[str], Tuple[Any, str]]) -> CachedDocument:
+    """
+    Return a rendered capabilities document from the cache, rendering it if necessary.
+
+    :param cfg: The global OWSConfig object
+    :param key: A tuple identifying the document (service, version, base URL, sections)
+    :param render: A callable that renders the document.  Takes the updateSequence value to
+            embed in the document, and returns a tuple of document body and content type.
+    :return: A CachedDocument
+    """
+    key = key + (request_locale(cfg),)
+    cacheable = capabilities_cacheable(cfg)
+    if cacheable:
+        with _cache_lock:
+            doc = _cache.get(key)
+            if doc is not None and doc.is_current(cfg):
+                _cache.move_to_end(key)
+                return doc
+    # Read the generation before rendering, so a concurrent range update invalidates this document.
+    generation = cfg.cache_generation
+    body, content_type = render(UPDATE_SEQUENCE_PLACEHOLDER)
+    doc = CachedDocument(cfg, generation, body, content_type)
+    if cacheable and doc.size <= cfg.capabilities_cache_size:
+        doc.cached = True
+        with _cache_lock:
+            _cache[key] = doc
+            _cache.move_to_end(key)
+            evict(cfg.capabilities_cache_size)
+    return doc
+
+
+def capabilities_response(cfg, args, key: Tuple,
+                          render: Callable[[str], Tuple[Any, str]],
+                          exception_class: Type[OGCException]):
+    """
+    Build a (possibly cached) capabilities response.
+
+    Supports conditional requests (If-None-Match) and the OGC updatesequence parameter.
+    As the updateSequence is a content hash, a client-supplied value can only be compared
+    for equality: a matching value raises a CurrentUpdateSequence exception and any other
+    value returns the current document.
+
+    :param cfg: The global OWSConfig object
+    :param args: The (lower-cased) request arguments
+    :param key: A tuple identifying the document (see cached_document)
+    :param render: A callable that renders the document (see cached_document)
+    :param exception_class: The OGCException subclass for the service
+    :return: A Flask response tuple
+    """
+    doc = cached_document(cfg, key, render)
+    update_sequence = args.get("updatesequence")
+    if update_sequence and update_sequence == doc.etag:
+        raise exception_class("Capabilities document has not changed",
+                              code=exception_class.CURRENT_UPDATE_SEQUENCE,
+                              locator="updatesequence parameter")
+    encoding = negotiate_encoding(cfg, doc.content_type, len(doc.body))
+    etag = doc.etag if encoding is None else f"{doc.etag}-{encoding}"
+    headers = cache_control_headers(cfg.wms_cap_cache_age)
+    headers["Content-Type"] = doc.content_type
+    headers["ETag"] = f'"{etag}"'
+    headers["Last-Modified"] = doc.last_modified
+    headers["Vary"] = "Accept-Encoding"
+    etags = request_etags()
+    if etags.contains_weak(doc.etag) or etags.contains_weak(etag):
+        return ("", 304, cfg.response_headers(headers))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return (doc.encoded(encoding, cfg.compression_level), 200, cfg.response_headers(headers))
@@ -7,6 +7,7 @@
 
 import json
 import os
+import pickle
 import sys
 
 import click
@@ -15,8 +16,10 @@ from datacube import Datacube
 from deepdiff import DeepDiff
 
 from datacube_ows import __version__
+from datacube_ows.config_snapshot import config_hash, write_snapshot
 from datacube_ows.ows_configuration import (ConfigException, OWSConfig,
                                             OWSFolder, read_config)
+from datacube_ows.product_ranges import get_ranges_change_token
 
 
 @click.group(invoke_without_command=True)
@@ -161,6 +164,45 @@ def extract(path, cfg_only, msg_file):
     return 0
 
 
+@main.command()
+@click.option(
+    "-o",
+    "--output-file",
+    default="ows_cfg_snapshot.pickle",
+    help="Write the snapshot to this file. (Defaults to 'ows_cfg_snapshot.pickle')"
+)
+@click.argument("path", nargs=1, required=False)
+def snapshot(path, output_file):
+    """Write a snapshot of the fully initialised configuration, for fast worker startup.
+
+    Takes a configuration specification which is loaded as per the $DATACUBE_OWS_CFG environment variable.
+
+    If no specification is provided, the $DATACUBE_OWS_CFG environment variable is used.
+
+    Workers load the snapshot at startup if $DATACUBE_OWS_CFG_SNAPSHOT points to it, falling back to
+    parsing the configuration if the configuration or the ranges tables have changed since the snapshot
+    was written.
+    """
+    try:
+        raw_cfg = read_config(path)
+        cfg = OWSConfig(refresh=True, cfg=raw_cfg)
+        # Snapshots must be fully initialised.
+        cfg.lazy_layer_init = False
+        with Datacube() as dc:
+            ranges_token = get_ranges_change_token(dc)
+            cfg.make_ready(dc)
+    except ConfigException as e:
+        click.echo(f"Config exception for path {str(e)}")
+        sys.exit(1)
+    try:
+        write_snapshot(cfg, output_file, config_hash(raw_cfg), ranges_token)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        click.echo(f"Configuration cannot be written to a snapshot: {str(e)}")
+        sys.exit(1)
+    click.echo(f"Configuration snapshot {output_file} written ({cfg.root_layer_folder.layer_count()} layers)")
+    return 0
+
+
 @main.command()
 @click.option(
     "-n",
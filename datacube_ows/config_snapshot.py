@@ -0,0 +1,115 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Snapshots of fully initialised ("ready") configuration objects.
+
+A snapshot is a pickle of a ready OWSConfig object (including ODC products, band indexes, styles,
+ranges and tile matrix sets), preceded by a small header recording:
+
+* the snapshot format version and the datacube-ows version that wrote it,
+* a hash of the (expanded) raw configuration, and
+* a change token for the ranges tables.
+
+A worker can load a snapshot in a few milliseconds instead of parsing the configuration and
+initialising every layer against the database.  A snapshot is rejected as stale if any of the
+header values do not match the current environment.
+
+Snapshots are pickles: only load snapshot files from trusted locations.
+"""
+import hashlib
+import json
+import logging
+import pickle
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from datacube_ows import __version__
+from datacube_ows.cube_pool import cube
+from datacube_ows.ows_configuration import OWSConfig, read_config
+from datacube_ows.product_ranges import get_ranges_change_token
+
+_LOG = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def config_hash(raw_cfg: Any) -> str:
+    """
+    Calculate a stable hash of a raw (expanded) configuration.
+
+    :param raw_cfg: A raw configuration as returned by read_config
+    :return: A hex-digest string
+    """
+    return hashlib.sha256(
+        json.dumps(raw_cfg, sort_keys=True, default=repr).encode("utf-8")
+    ).hexdigest()
+
+
+def write_snapshot(cfg: OWSConfig, path: str, cfg_hash: str, ranges_token: str) -> None:
+    """
+    Write a snapshot of a ready configuration object.
+
+    :param cfg: A fully initialised OWSConfig object
+    :param path: The file path to write the snapshot to.
+    :param cfg_hash: The hash of the raw configuration the config object was built from (see config_hash)
+    :param ranges_token: The ranges table change token at the time the config object was made ready.
+    """
+    header = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "ows_version": __version__,
+        "config_hash": cfg_hash,
+        "ranges_token": ranges_token,
+        "created": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(path, "wb") as fp:
+        pickle.dump(header, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(cfg, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_snapshot(path: str,
+                  cfg_hash: Optional[str] = None,
+                  ranges_token: Optional[str] = None) -> Optional[OWSConfig]:
+    """
+    Load a configuration snapshot, if it is not stale.
+
+    The loaded configuration object becomes the global configuration object (i.e. is returned by get_config()).
+
+    :param path: The file path of the snapshot
+    :param cfg_hash: The hash of the current raw configuration.  (Not checked if None)
+    :param ranges_token: The current ranges table change token.  (Not checked if None)
+    :return: The loaded OWSConfig object, or None if the snapshot is stale or was written by an incompatible version.
+    """
+    with open(path, "rb") as fp:
+        header = pickle.load(fp)
+        if header.get("format_version") != SNAPSHOT_FORMAT_VERSION or header.get("ows_version") != __version__:
+            _LOG.warning("Configuration snapshot %s was written by a different version of datacube-ows", path)
+            return None
+        if cfg_hash is not None and header.get("config_hash") != cfg_hash:
+            _LOG.warning("Configuration snapshot %s is stale: configuration has changed", path)
+            return None
+        if ranges_token is not None and header.get("ranges_token") != ranges_token:
+            _LOG.warning("Configuration snapshot %s is stale: ranges have been updated", path)
+            return None
+        cfg = pickle.load(fp)
+    OWSConfig._instance = cfg  # pylint: disable=protected-access
+    return cfg
+
+
+def load_config_snapshot(path: str) -> Optional[OWSConfig]:
+    """
+    Load a configuration snapshot for a worker, checking it against the current configuration and ranges tables.
+
+    :param path: The file path of the snapshot
+    :return: The loaded OWSConfig object, or None if the snapshot could not be used.
+    """
+    try:
+        cfg_hash = config_hash(read_config())
+        with cube() as dc:
+            ranges_token = get_ranges_change_token(dc)
+        return read_snapshot(path, cfg_hash, ranges_token)
+    except Exception as e:  # pylint: disable=broad-except
+        _LOG.warning("Could not load configuration snapshot %s: %s", path, str(e))
+        return None
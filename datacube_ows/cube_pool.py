@@ -4,14 +4,26 @@
 # Copyright (c) 2017-2023 OWS Contributors
 # SPDX-License-Identifier: Apache-2.0
 import logging
+import os
 from contextlib import contextmanager
 from threading import Lock
-from typing import Generator, MutableMapping, Optional
+from time import monotonic
+from typing import Any, Callable, Generator, Mapping, MutableMapping, Optional
 
 from datacube import Datacube
+from sqlalchemy import event
+from sqlalchemy.pool import Pool, QueuePool
+
+from datacube_ows.ogc_utils import ConfigException
+from datacube_ows.ows_metrics import (db_checkout_wait_seconds,
+                                      db_connections_checked_out,
+                                      db_connections_waiting)
 
 _LOG: logging.Logger = logging.getLogger(__name__)
 
+# Default connection recycle time in seconds (the ODC default db_connection_timeout)
+DEFAULT_POOL_RECYCLE = 60
+
 
 class ODCInitException(Exception):
     def __init__(self, e: Exception):
@@ -22,10 +34,130 @@ class ODCInitException(Exception):
         return "ODC initialisation failed:" + str(self.cause)
 
 
+class OWSQueuePool(QueuePool):
+    """
+    A SQLAlchemy QueuePool that records connection checkout waits in Prometheus metrics.
+    """
+    def _do_get(self):
+        db_connections_waiting.inc()
+        start = monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            db_connections_waiting.dec()
+            db_checkout_wait_seconds.observe(monotonic() - start)
+
+
+def _env_number(name: str, default: Any, typ: type) -> Any:
+    val = os.environ.get(name)
+    if val is None or val == "":
+        return default
+    try:
+        return typ(val)
+    except ValueError:
+        raise ConfigException(f"${name} must be a number: {val}")
+
+
+def pool_settings() -> Mapping[str, Any]:
+    """
+    Database connection pool settings, from environment variables.
+
+    :return: A dictionary of QueuePool keyword arguments.
+    """
+    settings = {
+        "pool_size": _env_number("OWS_DB_POOL_SIZE", 5, int),
+        "max_overflow": _env_number("OWS_DB_POOL_MAX_OVERFLOW", 10, int),
+        "timeout": _env_number("OWS_DB_POOL_TIMEOUT", 30.0, float),
+        "recycle": _env_number("OWS_DB_POOL_RECYCLE", DEFAULT_POOL_RECYCLE, int),
+        "pre_ping": os.environ.get("OWS_DB_POOL_PRE_PING", "yes").lower() not in ("no", "false", "f", "n", "0"),
+    }
+    if settings["pool_size"] < 1:
+        raise ConfigException("$OWS_DB_POOL_SIZE must be at least 1")
+    if settings["max_overflow"] < 0:
+        raise ConfigException("$OWS_DB_POOL_MAX_OVERFLOW must not be negative")
+    return settings
+
+
+def _on_checkout(dbapi_conn, conn_record, conn_proxy) -> None:
+    db_connections_checked_out.inc()
+
+
+def _on_checkin(dbapi_conn, conn_record) -> None:
+    # Also called for connections invalidated while checked out.
+    db_connections_checked_out.dec()
+
+
+def _on_detach(dbapi_conn, conn_record) -> None:
+    # Detached connections are closed directly, without being checked in.
+    db_connections_checked_out.dec()
+
+
+def _engine(dc: Datacube):
+    # The SQLAlchemy engine of a Datacube object's index (or None for non-SQL index drivers)
+    # pylint: disable=protected-access
+    return getattr(getattr(dc.index, "_db", None), "_engine", None)
+
+
+def _connection_factory(pool: Pool) -> Callable[[], Any]:
+    """
+    A pool creator function that opens new DBAPI connections through an existing pool.
+
+    Each connection is checked out of the existing pool and detached from it, so the existing
+    pool's connect arguments and "connect" event handlers (e.g. ODC's isolation level and IAM
+    authentication) still apply, but the connection is then managed by the new pool.
+    """
+    def creator():
+        fairy = pool.connect()
+        fairy.detach()
+        return fairy.dbapi_connection
+    return creator
+
+
+def configure_pool(dc: Datacube, settings: Optional[Mapping[str, Any]] = None) -> None:
+    """
+    Replace the connection pool of a Datacube object's database engine with a bounded,
+    instrumented OWSQueuePool.
+
+    Datacube objects (and their SQLAlchemy engines) are thread-safe, so a single Datacube
+    object per app is shared by all threads, and concurrent database access is bounded by
+    the engine's connection pool.
+
+    :param dc: A Datacube object
+    :param settings: Pool settings (defaults to pool_settings())
+    """
+    engine = _engine(dc)
+    if engine is None:
+        _LOG.warning("Cannot configure database connection pool for index driver %s", type(dc.index).__name__)
+        return
+    if settings is None:
+        settings = pool_settings()
+    old = engine.pool
+    engine.pool = OWSQueuePool(
+        _connection_factory(old),
+        pool_size=settings["pool_size"],
+        max_overflow=settings["max_overflow"],
+        timeout=settings["timeout"],
+        recycle=settings["recycle"],
+        pre_ping=settings["pre_ping"],
+        echo=old.echo,
+        logging_name=old.logging_name,
+        dialect=engine.dialect,
+    )
+    event.listen(engine.pool, "checkout", _on_checkout)
+    event.listen(engine.pool, "checkin", _on_checkin)
+    event.listen(engine.pool, "detach", _on_detach)
+    # Close the old pool's idle connections: it is only used to open new connections from now on.
+    old.dispose()
+
+
 # CubePool class
 class CubePool:
     """
     A Cube pool is a thread-safe resource pool for managing Datacube objects (which map to database connections).
+
+    Each app has a single, thread-safe Datacube object whose database engine uses a bounded
+    connection pool (see configure_pool), so database access scales with request threads
+    up to the configured pool size and overflow.
     """
     # _instances, global mapping of CubePools by app name
     _instances: MutableMapping[str, "CubePool"] = {}
@@ -34,6 +166,8 @@ class CubePool:
 
     _instance: Optional[Datacube] = None
 
+    _pid: Optional[int] = None
+
     def __new__(cls, app: str) -> "CubePool":
         """
         Construction of CubePools is managed. Constructing a cubepool for an app string that already has a cubepool
@@ -56,7 +190,8 @@ class CubePool:
 
     def get_cube(self) -> Optional[Datacube]:
         """
-        Return a Datacube object.  Either generating a new Datacube, or recycling an unassigned one already in the pool.
+        Return the app's Datacube object, creating it on first use (and replacing its connection pool
+        after a fork).
 
         :return:  a Datacube object (or None on error).
         """
@@ -64,6 +199,14 @@ class CubePool:
         try:
             if self._instance is None:
                 self._instance = self._new_cube()
+                self._pid = os.getpid()
+            elif self._pid != os.getpid():
+                # Database connections must not be shared with the parent process after a fork.
+                # Replace the pool without closing the parent's connections.
+                engine = _engine(self._instance)
+                if engine is not None:
+                    engine.pool = engine.pool.recreate()
+                self._pid = os.getpid()
         # pylint: disable=broad-except
         except Exception as e:
             _LOG.error("ODC initialisation failed: %s", str(e))
@@ -73,7 +216,9 @@ class CubePool:
         return self._instance
 
     def _new_cube(self) -> Datacube:
-        return Datacube(app=self.app)
+        dc = Datacube(app=self.app)
+        configure_pool(dc)
+        return dc
 
 
 # Lowlevel CubePool API
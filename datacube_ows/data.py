@@ -3,10 +3,13 @@
 #
 # Copyright (c) 2017-2023 OWS Contributors
 # SPDX-License-Identifier: Apache-2.0
+import csv
+import io
 import json
 import logging
 import re
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 from itertools import chain
 
@@ -23,21 +26,28 @@ from rasterio.io import MemoryFile
 from rasterio.warp import Resampling
 
 from datacube_ows.cube_pool import cube
+from datacube_ows.etags import NotModified, check_not_modified, dataset_etag
 from datacube_ows.mv_index import MVSelectOpts, mv_search
 from datacube_ows.ogc_exceptions import WMSException
 from datacube_ows.ogc_utils import (ConfigException, dataset_center_time,
                                     solar_date, tz_for_geometry,
                                     xarray_image_as_png)
 from datacube_ows.ows_configuration import get_config
-from datacube_ows.query_profiler import QueryProfiler
+from datacube_ows.query_profiler import (QueryProfiler, in_request_context,
+                                         profile_span)
+from datacube_ows.request_profiling import cprofile_active
 from datacube_ows.resource_limits import ResourceLimited
 from datacube_ows.startup_utils import CredentialManager
 from datacube_ows.utils import default_to_utc, log_call
 from datacube_ows.wms_utils import (GetFeatureInfoParameters, GetMapParameters,
+                                    GetTimeSeriesParameters,
                                     img_coords_to_geopoint, solar_correct_data)
 
 _LOG = logging.getLogger(__name__)
 
+# Maximum number of time slices read concurrently by a GetTimeSeries request.
+TIME_SERIES_MAX_WORKERS = 8
+
 
 class ProductBandQuery:
     def __init__(self, products, bands, main=False, manual_merge=False, ignore_time=False, fuse_func=None):
@@ -196,11 +206,14 @@ class DataStacker:
                 qry_times = None
             else:
                 qry_times = times
-            result = mv_search(index,
-                               sel=mode,
-                               times=qry_times,
-                               geom=geom,
-                               products=query.products)
+            with profile_span("mv_search", mode=mode.name,
+                              products=",".join(p.name for p in query.products)):
+                result = mv_search(index,
+                                   sel=mode,
+                                   times=qry_times,
+                                   geom=geom,
+                                   products=query.products,
+                                   time_resolution=self._product.time_resolution)
             if mode == MVSelectOpts.DATASETS:
                 result = datacube.Datacube.group_datasets(result, self.group_by)
                 if all_time:
@@ -244,10 +257,12 @@ class DataStacker:
                 continue
             measurements = pbq.products[0].lookup_measurements(pbq.bands)
             fuse_func = pbq.fuse_func
-            if pbq.manual_merge:
-                qry_result = self.manual_data_stack(datasets, measurements, pbq.bands, skip_corrections, fuse_func=fuse_func)
-            else:
-                qry_result = self.read_data(datasets, measurements, self._geobox, resampling=self._resampling, fuse_func=fuse_func)
+            with profile_span("load-query", products=",".join(p.name for p in pbq.products),
+                              bands=",".join(pbq.bands), manual_merge=pbq.manual_merge):
+                if pbq.manual_merge:
+                    qry_result = self.manual_data_stack(datasets, measurements, pbq.bands, skip_corrections, fuse_func=fuse_func)
+                else:
+                    qry_result = self.read_data(datasets, measurements, self._geobox, resampling=self._resampling, fuse_func=fuse_func)
             if data is None:
                 data = qry_result
                 continue
@@ -300,7 +315,8 @@ class DataStacker:
             tds = datasets.sel(time=dt)
             merged = None
             for ds in tds.values.item():
-                d = self.read_data_for_single_dataset(ds, measurements, self._geobox, fuse_func=fuse_func)
+                with profile_span("load-dataset", id=ds.id):
+                    d = self.read_data_for_single_dataset(ds, measurements, self._geobox, fuse_func=fuse_func)
                 extent_mask = None
                 for band in non_flag_bands:
                     for f in self._product.extent_mask_func:
@@ -428,7 +444,7 @@ def get_map(args):
     # pylint: disable=too-many-nested-blocks, too-many-branches, too-many-statements, too-many-locals
     # Parse GET parameters
     params = GetMapParameters(args)
-    qprof = QueryProfiler(params.ows_stats)
+    qprof = QueryProfiler(params.ows_stats, "GetMap", params.product.name)
     n_dates = len(params.times)
     if n_dates == 1:
         mdh = None
@@ -445,6 +461,7 @@ def get_map(args):
             # Tiling.
             stacker = DataStacker(params.product, params.geobox, params.times, params.resampling, style=params.style)
             qprof["zoom_factor"] = params.zf
+            qprof["n_pixels"] = params.geobox.width * params.geobox.height
             qprof.start_event("count-datasets")
             n_datasets = stacker.datasets(dc.index, mode=MVSelectOpts.COUNT)
             qprof.end_event("count-datasets")
@@ -456,6 +473,7 @@ def get_map(args):
             except ResourceLimited as e:
                 stacker.resource_limited = True
                 qprof["resource_limited"] = str(e)
+            headers = dict(params.product.resource_limits.wms_cache_rules.cache_headers(n_datasets))
             if qprof.active:
                 q_ds_dict = stacker.datasets(dc.index, mode=MVSelectOpts.DATASETS)
                 qprof["datasets"] = []
@@ -496,6 +514,11 @@ def get_map(args):
                     qprof.end_event("count-summary-datasets")
                 qprof.start_event("fetch-datasets")
                 datasets = stacker.datasets(dc.index)
+                ids_by_query = etag_dataset_ids(params.product, datasets, qprof)
+                if ids_by_query is not None:
+                    etag = dataset_etag(params.product, params.style, args, ids_by_query, stacker.resource_limited)
+                    headers["ETag"] = f'"{etag}"'
+                    check_not_modified(etag, params.product.global_cfg.response_headers(headers))
                 for flagband, dss in datasets.items():
                     if not dss.any():
                         _LOG.warning("Flag band %s returned no data", str(flagband))
@@ -559,11 +582,32 @@ def get_map(args):
             qprof.start_event("write")
             body = _write_empty(params.geobox)
             qprof.end_event("write")
+        except NotModified as e:
+            return e.response()
 
     if params.ows_stats:
         return json_response(qprof.profile())
     else:
-        return png_response(body, extra_headers=params.product.resource_limits.wms_cache_rules.cache_headers(n_datasets))
+        return png_response(body, extra_headers=headers)
+
+
+def etag_dataset_ids(layer, datasets, qprof):
+    """
+    The dataset ids of a data request, for calculating a dataset ETag.
+
+    The ids are taken from the datasets already fetched for the request, so no extra index query is needed.
+
+    :param layer: The OWSNamedLayer being requested
+    :param datasets: The datasets by query, as returned by DataStacker.datasets
+    :param qprof: The request's QueryProfiler
+    :return: The dataset ids by query, or None if dataset ETags are disabled or the request is being profiled.
+    """
+    if not layer.global_cfg.dataset_etags or qprof.active:
+        return None
+    return {
+        query: [ds.id for tdss in dss.values for ds in tdss]
+        for query, dss in datasets.items()
+    }
 
 
 def png_response(body, cfg=None, extra_headers=None):
@@ -764,6 +808,22 @@ def geobox_is_point(geobox):
     return geobox.height == 1 and geobox.width == 1
 
 
+def point_geobox(params):
+    """
+    Shrink the geobox of a GetFeatureInfo-style request to the requested pixel.
+
+    :param params: A GetFeatureInfoParameters (or subclass) object.
+    :return: Tuple of the point geometry and a single pixel geobox containing it.
+    """
+    geo_point = img_coords_to_geopoint(params.geobox, params.i, params.j)
+    if geobox_is_point(params.geobox):
+        geo_point_geobox = params.geobox
+    else:
+        geo_point_geobox = datacube.utils.geometry.GeoBox.from_geopolygon(
+            geo_point, params.geobox.resolution, crs=params.geobox.crs)
+    return geo_point, geo_point_geobox
+
+
 @log_call
 def feature_info(args):
     # pylint: disable=too-many-nested-blocks, too-many-branches, too-many-statements, too-many-locals
@@ -771,14 +831,9 @@ def feature_info(args):
     params = GetFeatureInfoParameters(args)
     feature_json = {}
 
-    geo_point = img_coords_to_geopoint(params.geobox, params.i, params.j)
     # shrink geobox to point
     # Prepare to extract feature info
-    if geobox_is_point(params.geobox):
-        geo_point_geobox = params.geobox
-    else:
-        geo_point_geobox = datacube.utils.geometry.GeoBox.from_geopolygon(
-            geo_point, params.geobox.resolution, crs=params.geobox.crs)
+    geo_point, geo_point_geobox = point_geobox(params)
     tz = tz_for_geometry(geo_point_geobox.geographic_extent)
     stacker = DataStacker(params.product, geo_point_geobox, params.times)
     # --- Begin code section requiring datacube.
@@ -786,7 +841,8 @@ def feature_info(args):
     with cube() as dc:
         if not dc:
             raise WMSException("Database connectivity failure")
-        all_time_datasets = stacker.datasets(dc.index, all_time=True, point=geo_point)
+        # Distinct group dates of all datasets with a footprint containing the point, resolved in the database.
+        all_time_dates = stacker.datasets(dc.index, all_time=True, point=geo_point, mode=MVSelectOpts.DATES)
 
         # Taking the data as a single point so our indexes into the data should be 0,0
         h_coord = cfg.published_CRSs[params.crsid]["horizontal_coord"]
@@ -797,7 +853,7 @@ def feature_info(args):
             h_coord: 0,
             v_coord: 0
         }
-        if any(all_time_datasets):
+        if all_time_dates:
             # Group datasets by time, load only datasets that match the idx_date
             global_info_written = False
             feature_json["data"] = []
@@ -891,28 +947,16 @@ def feature_info(args):
                             # * a multi-date single pixel (1x1xn) multiband xarray Dataset,
                             date_info[k] = f(data)
                         feature_json["data"].append(date_info)
-            feature_json["data_available_for_dates"] = []
-            pt_native = None
-            for d in all_time_datasets.coords["time"].values:
-                dt_datasets = all_time_datasets.sel(time=d)
-                for ds in dt_datasets.values.item():
-                    if pt_native is None:
-                        pt_native = geo_point.to_crs(ds.crs)
-                    elif pt_native.crs != ds.crs:
-                        pt_native = geo_point.to_crs(ds.crs)
-                    if ds.extent and ds.extent.contains(pt_native):
-                        # convert numpy datetime64 to a python datatime
-                        dt = Timestamp(stacker.group_by.group_by_func(ds)).to_pydatetime()
-                        if params.product.time_resolution.is_subday():
-                            feature_json["data_available_for_dates"].append(dt.isoformat())
-                        else:
-                            feature_json["data_available_for_dates"].append(dt.strftime("%Y-%m-%d"))
-                        break
+            if params.product.time_resolution.is_subday():
+                feature_json["data_available_for_dates"] = [dt.isoformat() for dt in all_time_dates]
+            else:
+                feature_json["data_available_for_dates"] = [dt.strftime("%Y-%m-%d") for dt in all_time_dates]
             if time_datasets:
-                feature_json["data_links"] = sorted(get_s3_browser_uris(time_datasets, pt_native, s3_url, s3_bucket))
+                feature_json["data_links"] = sorted(get_s3_browser_uris(time_datasets, geo_point, s3_url, s3_bucket))
             else:
                 feature_json["data_links"] = []
             if params.product.feature_info_include_utc_dates:
+                all_time_datasets = stacker.datasets(dc.index, all_time=True, point=geo_point)
                 unsorted_dates = []
                 for tds in all_time_datasets:
                     for ds in tds.values.item():
@@ -945,6 +989,120 @@ def feature_info(args):
         return json_response(result, cfg)
 
 
+def _time_series_date(product, ds, tz):
+    if product.time_resolution.is_subday():
+        return dataset_center_time(ds).isoformat()
+    if product.time_resolution.is_solar():
+        return solar_date(dataset_center_time(ds), tz).strftime("%Y-%m-%d")
+    return ds.time.begin.strftime("%Y-%m-%d")
+
+
+def _pixel_values(band_data, nodata):
+    values = []
+    for val in band_data.values.tolist():
+        if val is None or val == nodata or (isinstance(val, float) and numpy.isnan(val)):
+            values.append(None)
+        else:
+            values.append(val)
+    return values
+
+
+@log_call
+def time_series(args):
+    # pylint: disable=too-many-locals
+    """
+    Extract the values of a single pixel over a range of times.
+
+    The datasets for all requested times are found with a single index search, and the
+    per-date reads are then performed concurrently (or serially, if the request is being
+    run under cProfile).
+    """
+    params = GetTimeSeriesParameters(args)
+    qprof = QueryProfiler(params.ows_stats, "GetTimeSeries", params.product.name)
+    geo_point, geo_point_geobox = point_geobox(params)
+    tz = tz_for_geometry(geo_point_geobox.geographic_extent)
+    stacker = DataStacker(params.product, geo_point_geobox, params.times, bands=params.bands)
+    qprof["n_dates"] = len(params.times)
+    cfg = get_config()
+    h_coord = cfg.published_CRSs[params.crsid]["horizontal_coord"]
+    v_coord = cfg.published_CRSs[params.crsid]["vertical_coord"]
+    isel_kwargs = {
+        h_coord: 0,
+        v_coord: 0
+    }
+    dates = []
+    values = {b: [] for b in params.bands}
+    with cube() as dc:
+        if not dc:
+            raise WMSException("Database connectivity failure")
+        qprof.start_event("count-datasets")
+        n_datasets = stacker.datasets(dc.index, point=geo_point, mode=MVSelectOpts.COUNT)
+        qprof.end_event("count-datasets")
+        qprof["n_datasets"] = n_datasets
+        try:
+            params.product.resource_limits.check_time_series(n_datasets)
+        except ResourceLimited as e:
+            raise WMSException(f"This request processes too much data to be served in a reasonable amount of time. ({e}) "
+                               + "Please reduce the time range or number of bands requested.")
+        if n_datasets > 0:
+            qprof.start_event("fetch-datasets")
+            datasets = stacker.datasets(dc.index, point=geo_point)
+            qprof.end_event("fetch-datasets")
+            main_dss = None
+            for pbq, dss in datasets.items():
+                if pbq.main or main_dss is None:
+                    main_dss = dss
+            slices = [
+                OrderedDict(
+                    (pbq, dss if pbq.ignore_time else dss.isel(time=slice(i, i + 1)))
+                    for pbq, dss in datasets.items()
+                )
+                for i in range(len(main_dss.time))
+            ]
+            qprof["n_reads"] = len(slices)
+            qprof.start_event("load-data")
+            if cprofile_active():
+                # cProfile only sees the calling thread, so read serially.
+                slice_data = [stacker.data(s) for s in slices]
+            else:
+                with ThreadPoolExecutor(max_workers=min(TIME_SERIES_MAX_WORKERS, len(slices))) as executor:
+                    slice_data = list(executor.map(in_request_context(stacker.data), slices))
+            qprof.end_event("load-data")
+            qprof.start_event("extract-values")
+            for dss, data in zip(main_dss.values, slice_data):
+                if data is None or len(data.time) == 0:
+                    continue
+                dates.append(_time_series_date(params.product, dss[0], tz))
+                pixel = data.isel(**isel_kwargs)
+                for band in params.bands:
+                    values[band].extend(_pixel_values(pixel[band],
+                                                      params.product.band_idx.nodata_val(band)))
+            qprof.end_event("extract-values")
+
+    if params.ows_stats:
+        return json_response(qprof.profile(), cfg)
+    labels = [params.product.band_idx.band_label(b) for b in params.bands]
+    if params.format == "text/csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["time"] + labels)
+        for i, dt in enumerate(dates):
+            writer.writerow([dt] + ["" if values[b][i] is None else values[b][i] for b in params.bands])
+        return buf.getvalue(), 200, cfg.response_headers({"Content-Type": "text/csv"})
+    lon, lat = geo_point.to_crs("EPSG:4326").coords[0]
+    return json_response({
+        "layer": params.product.name,
+        "lon": lon,
+        "lat": lat,
+        "bands": labels,
+        "times": dates,
+        "values": {
+            label: values[b]
+            for label, b in zip(labels, params.bands)
+        }
+    }, cfg)
+
+
 def json_response(result, cfg=None):
     if not cfg:
         cfg = get_config()
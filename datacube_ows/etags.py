@@ -0,0 +1,106 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Dataset-aware ETags for data requests (GetMap, GetTile and GetCoverage).
+
+The ETag of a data response is a hash of:
+
+* the datacube-ows version,
+* the layer and style definitions,
+* the (normalised) request parameters, and
+* the ids of the datasets matching the request.
+
+The dataset ids are taken from the datasets already fetched for the request, so a conditional
+request whose If-None-Match header matches can be answered with 304 Not Modified before any
+data is loaded, without any extra index queries.
+The hash depends only on the above, so ETags are consistent between worker processes.
+"""
+import hashlib
+import json
+from functools import lru_cache
+from typing import Any, Iterable, Mapping, Optional
+
+from flask import has_request_context, request
+from werkzeug.http import parse_etags
+
+from datacube_ows import __version__
+
+# Request arguments that do not affect the response body
+IGNORED_ARGS = ("requestid", "url_root", "host", "referer", "origin", "ows_stats")
+
+
+class NotModified(Exception):
+    """
+    Raised when the ETag of a data response matches the request's If-None-Match header.
+    """
+    def __init__(self, headers: Mapping[str, str]) -> None:
+        super().__init__("Not Modified")
+        self.headers = headers
+
+    def response(self):
+        return ("", 304, self.headers)
+
+
+def _json_default(obj: Any) -> str:
+    # Functions in configuration are identified by name - repr includes a (process-specific) memory address.
+    if callable(obj):
+        return f"{getattr(obj, '__module__', '')}.{getattr(obj, '__qualname__', repr(obj))}"
+    return repr(obj)
+
+
+@lru_cache(maxsize=1024)
+def definition_hash(cfg_entry) -> str:
+    """
+    A hash of the raw configuration of a configuration entry (e.g. a layer or a style).
+
+    :param cfg_entry: An OWSConfigEntry object
+    :return: A hex-digest string
+    """
+    # pylint: disable=protected-access
+    return hashlib.sha256(
+        json.dumps(cfg_entry._raw_cfg, sort_keys=True, default=_json_default).encode("utf-8")
+    ).hexdigest()
+
+
+def dataset_etag(layer, style, args: Mapping[str, Any], ids_by_query: Mapping[Any, Iterable[Any]],
+                 resource_limited: bool = False) -> str:
+    """
+    Calculate a strong ETag for a data response.
+
+    :param layer: The OWSNamedLayer being requested
+    :param style: The StyleDef being applied (or None)
+    :param args: The request arguments
+    :param ids_by_query: Matching dataset ids, by ProductBandQuery (see datacube_ows.data.etag_dataset_ids)
+    :param resource_limited: Whether the request is resource limited
+    :return: The ETag value (unquoted)
+    """
+    h = hashlib.sha256()
+    h.update(__version__.encode("utf-8"))
+    h.update(definition_hash(layer).encode("utf-8"))
+    if style is not None:
+        h.update(definition_hash(style).encode("utf-8"))
+    for k in sorted(args):
+        if k not in IGNORED_ARGS:
+            h.update(f"\n{k}={args[k]}".encode("utf-8"))
+    h.update(b"\nresource_limited" if resource_limited else b"\n")
+    for query, ids in ids_by_query.items():
+        h.update(f"\n{query.key}:".encode("utf-8"))
+        for ds_id in sorted(str(i) for i in ids):
+            h.update(ds_id.encode("utf-8"))
+    return h.hexdigest()
+
+
+def check_not_modified(etag: Optional[str], headers: Mapping[str, str]) -> None:
+    """
+    Raise NotModified if the ETag matches the request's If-None-Match header.
+
+    :param etag: The ETag of the response (or None if ETags are disabled)
+    :param headers: Headers to return with the 304 response (including the ETag)
+    """
+    if etag is None or not has_request_context():
+        return
+    if parse_etags(request.headers.get("If-None-Match")).contains_weak(etag):
+        raise NotModified(headers)
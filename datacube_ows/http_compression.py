@@ -0,0 +1,85 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+HTTP response compression (gzip or deflate) for text (XML, JSON, HTML, CSV) responses.
+
+The compression level ($OWS_COMPRESSION_LEVEL) and size threshold ($OWS_COMPRESSION_MIN_SIZE)
+are read by the global configuration object.  Image and coverage formats are already compressed
+and are never re-compressed.
+"""
+import gzip
+import zlib
+from typing import Optional
+
+from flask import has_request_context, request
+
+ENCODINGS = ("gzip", "deflate")
+
+COMPRESSIBLE_TYPES = ("application/xml", "application/json", "application/javascript")
+
+
+def compressible_type(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return False
+    mime = content_type.split(";")[0].strip().lower()
+    return (mime.startswith("text/")
+            or mime in COMPRESSIBLE_TYPES
+            or mime.endswith("+xml")
+            or mime.endswith("+json"))
+
+
+def negotiate_encoding(cfg, content_type: Optional[str], size: int) -> Optional[str]:
+    """
+    Choose a content encoding for a response, based on the request's Accept-Encoding header.
+
+    :param cfg: The global OWSConfig object
+    :param content_type: The Content-Type of the response
+    :param size: The size of the uncompressed response body, in bytes
+    :return: "gzip", "deflate" or None (do not compress)
+    """
+    if not cfg.compression_level or size < cfg.compression_min_size:
+        return None
+    if not compressible_type(content_type) or not has_request_context():
+        return None
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "gzip":
+        # Fixed mtime, so identical documents compress identically.
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == "deflate":
+        # HTTP "deflate" is the zlib format.
+        return zlib.compress(data, level)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def compress_response(response, cfg):
+    """
+    Compress a Flask response in place, if it is compressible and the client accepts compression.
+
+    Responses that are already encoded, streamed or passed through from files are left untouched.
+
+    :param response: A Flask response object
+    :param cfg: The global OWSConfig object
+    :return: The response object
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or not compressible_type(response.content_type)):
+        return response
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    encoding = negotiate_encoding(cfg, response.content_type, len(data))
+    if encoding is None:
+        return response
+    response.set_data(compress(data, encoding, cfg.compression_level))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
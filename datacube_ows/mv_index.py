@@ -45,12 +45,14 @@ class MVSelectOpts(Enum):
     DATASETS: return list of ODC dataset objects
     COUNT: return a count of matching datasets
     EXTENT: return full extent of query result as a Geometry
+    DATES: return sorted list of distinct dataset group dates (requires a time resolution)
     """
     ALL = 0
     IDS = 1
     COUNT = 2
     EXTENT = 3
     DATASETS = 4
+    DATES = 5
     INVALID = 9999
 
     def sel(self, stv: Table) -> Iterable["sqlalchemy.sql.elements.ClauseElement"]:
@@ -64,6 +66,34 @@ class MVSelectOpts(Enum):
             return [text("ST_AsGeoJSON(ST_Union(spatial_extent))")]
         assert False
 
+
+def group_date_expr(stv: Table, time_resolution: "datacube_ows.ows_configuration.TimeRes") -> "sqlalchemy.sql.elements.ColumnElement":
+    """
+    SQL expression for the date a dataset is grouped under, matching the OWS dataset group_by functions.
+
+    Subday: the begin time (UTC).
+    Solar: the local solar date of the dataset's centre time, offset by the longitude midpoint of the footprint.
+    Summary: the begin date (UTC).
+
+    :param stv: The space_time_view table
+    :param time_resolution: The time resolution of the layer
+    :return: An SQLAlchemy column expression
+    """
+    lower = func.lower(stv.c.temporal_extent)
+    if time_resolution.is_subday():
+        return func.timezone("UTC", lower)
+    if time_resolution.is_solar():
+        upper = func.upper(stv.c.temporal_extent)
+        centre = func.timezone("UTC", lower + (upper - lower) / 2)
+        # Matches datacube.api.query.solar_day(): 240 seconds offset per degree of longitude, truncated,
+        # at the midpoint of the dataset's longitude range (i.e. of the footprint's bounding box, not its
+        # centroid, which differs for irregular footprints).
+        mid_lon = (func.ST_XMin(stv.c.spatial_extent) + func.ST_XMax(stv.c.spatial_extent)) / 2
+        offset = func.make_interval(0, 0, 0, 0, 0, 0, func.trunc(mid_lon * 240))
+        return func.date(centre + offset)
+    return func.date(func.timezone("UTC", lower))
+
+
 TimeSearchTerm = Union[
     Tuple[datetime.datetime, datetime.datetime],
     datetime.datetime,
@@ -73,10 +103,12 @@ def mv_search(index: "datacube.index.Index",
               sel: MVSelectOpts = MVSelectOpts.IDS,
               times: Optional[Iterable[TimeSearchTerm]] = None,
               geom: Optional[ODCGeom] = None,
-              products: Optional[Iterable["datacube.model.DatasetType"]] = None) -> Union[
+              products: Optional[Iterable["datacube.model.DatasetType"]] = None,
+              time_resolution: Optional["datacube_ows.ows_configuration.TimeRes"] = None) -> Union[
         Iterable[Iterable[Any]],
         Iterable[str],
         Iterable["datacube.model.Dataset"],
+        Iterable[Union[datetime.date, datetime.datetime]],
         int,
         None,
         ODCGeom]:
@@ -89,6 +121,7 @@ def mv_search(index: "datacube.index.Index",
     :param sel: Selection mode - a MVSelectOpts enum. Defaults to IDS.
     :param times: A list of pairs of datetimes (with time zone)
     :param geom: A datacube.utils.geometry.Geometry object
+    :param time_resolution: The layer time resolution (required for DATES mode, ignored otherwise)
 
     :return: See MVSelectOpts doc
     """
@@ -98,7 +131,13 @@ def mv_search(index: "datacube.index.Index",
         raise Exception("Must filter by product/layer")
     prod_ids = [p.id for p in products]
 
-    s = select(*sel.sel(stv)).where(stv.c.dataset_type_ref.in_(prod_ids))
+    if sel == MVSelectOpts.DATES:
+        if time_resolution is None:
+            raise Exception("Must supply a time resolution to search for dates")
+        s = select(group_date_expr(stv, time_resolution)).distinct()
+    else:
+        s = select(*sel.sel(stv))
+    s = s.where(stv.c.dataset_type_ref.in_(prod_ids))
     if times is not None:
         or_clauses = []
         for t in times:
@@ -141,6 +180,8 @@ def mv_search(index: "datacube.index.Index",
             return conn.execute(s)
         if sel == MVSelectOpts.IDS:
             return [r[0] for r in conn.execute(s)]
+        if sel == MVSelectOpts.DATES:
+            return sorted(r[0] for r in conn.execute(s))
         if sel in (MVSelectOpts.COUNT, MVSelectOpts.EXTENT):
             for r in conn.execute(s):
                 if sel == MVSelectOpts.COUNT:
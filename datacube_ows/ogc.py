@@ -12,12 +12,14 @@ from sqlalchemy import text
 
 from datacube_ows import __version__
 from datacube_ows.cube_pool import cube
+from datacube_ows.http_compression import compress_response
 from datacube_ows.legend_generator import create_legend_for_style
 from datacube_ows.ogc_exceptions import OGCException, WMSException
 from datacube_ows.ogc_utils import (capture_headers, get_service_base_url,
                                     lower_get_args, resp_headers)
 from datacube_ows.ows_configuration import get_config
 from datacube_ows.protocol_versions import supported_versions
+from datacube_ows.request_profiling import profiled_request
 from datacube_ows.startup_utils import *  # pylint: disable=wildcard-import,unused-wildcard-import
 from datacube_ows.wcs1 import WCS_REQUESTS
 from datacube_ows.wms import WMS_REQUESTS
@@ -71,6 +73,7 @@ prometheus_ows_ogc_metric = metrics.histogram(
 
 @app.route('/')
 @prometheus_ows_ogc_metric
+@profiled_request
 def ogc_impl():
     #pylint: disable=too-many-branches
     nocase_args = lower_get_args()
@@ -160,18 +163,21 @@ def ogc_svc_impl(svc):
 
 @app.route('/wms')
 @prometheus_ows_ogc_metric
+@profiled_request
 def ogc_wms_impl():
     return ogc_svc_impl("wms")
 
 
 @app.route('/wmts')
 @prometheus_ows_ogc_metric
+@profiled_request
 def ogc_wmts_impl():
     return ogc_svc_impl("wmts")
 
 
 @app.route('/wcs')
 @prometheus_ows_ogc_metric
+@profiled_request
 def ogc_wcs_impl():
     return ogc_svc_impl("wcs")
 
@@ -208,6 +214,7 @@ def legend(layer, style, dates=None):
     product = cfg.product_index.get(layer)
     if not product:
         return ("Unknown Layer", 404, resp_headers({"Content-Type": "text/plain"}))
+    product.ensure_ready()
     if dates is None:
         args = lower_get_args()
         ndates = int(args.get("ndates", 0))
@@ -246,3 +253,13 @@ def log_time_and_request_response(response):
         ip = 'Not found'
     _LOG.info("ip: %s request: %s returned status: %d and took: %d ms", ip, request.url, response.status_code, time_taken)
     return response
+
+
+@app.after_request
+def compress_text_response(response):
+    # pylint: disable=redefined-outer-name
+    try:
+        cfg = get_config()
+    except Exception:  # pylint: disable=broad-except
+        return response
+    return compress_response(response, cfg)
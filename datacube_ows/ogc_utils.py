@@ -333,13 +333,15 @@ class FunctionWrapper:
                     self.band_mapper = b_idx.band
                 else:
                     # Style
-                    style = cast("datacube_ows.styles.StyleDef", product_or_style_cfg)
-                    b_idx = style.product.band_idx
-                    delocaliser = style.local_band
-                    self.band_mapper = lambda b: b_idx.band(delocaliser(b))
+                    self.band_mapper = self._style_band_mapper
             else:
                 self.band_mapper = None
 
+    def _style_band_mapper(self, band: str) -> str:
+        # A method rather than a lambda, so that wrappers can be pickled.
+        style = cast("datacube_ows.styles.StyleDef", self.style_or_layer_cfg)
+        return style.product.band_idx.band(style.local_band(band))
+
     def __call__(self, *args, **kwargs) -> Any:
         if args and self._args:
             calling_args = chain(args, self._args)
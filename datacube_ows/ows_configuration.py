@@ -12,14 +12,19 @@
 #  Refer to the documentation for information on how to configure datacube_ows.
 #
 import datetime
+import hashlib
 import json
 import logging
 import math
 import os
+import uuid
 from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from importlib import import_module
-from typing import Optional, Sequence
+from threading import Lock
+from time import monotonic
+from typing import Any, NamedTuple, Optional, Sequence
 
 import numpy
 from babel.messages.catalog import Catalog
@@ -28,6 +33,7 @@ from datacube.utils import geometry
 from ows import Version
 from slugify import slugify
 
+from datacube_ows.capabilities_cache import DEFAULT_CACHE_SIZE
 from datacube_ows.config_utils import (FlagProductBands, OWSConfigEntry,
                                        OWSEntryNotFound,
                                        OWSExtensibleConfigEntry, OWSFlagBand,
@@ -37,10 +43,14 @@ from datacube_ows.config_utils import (FlagProductBands, OWSConfigEntry,
 from datacube_ows.cube_pool import ODCInitException, cube, get_cube
 from datacube_ows.ogc_utils import (ConfigException, FunctionWrapper,
                                     create_geobox, local_solar_date_range)
+from datacube_ows.ows_metrics import (config_ready_seconds, layer_ready,
+                                      layer_ready_seconds)
 from datacube_ows.resource_limits import (OWSResourceManagementRules,
                                           parse_cache_age)
 from datacube_ows.styles import StyleDef
+from datacube_ows.tile_cache import DEFAULT_MAX_SIZE
 from datacube_ows.tile_matrix_sets import TileMatrixSet
+from datacube_ows.time_index import TimeIndex
 from datacube_ows.utils import (group_by_begin_datetime, group_by_mosaic,
                                 group_by_solar)
 
@@ -306,11 +316,27 @@ class OWSFolder(OWSLayer):
     def layer_count(self):
         return sum([l.layer_count() for l in self.child_layers])
 
+    def named_layers(self):
+        """
+        Iterate over the (not yet ready) named layers in this folder and its sub-folders, in configuration order.
+        """
+        for lyr in self.unready_layers:
+            if lyr.named:
+                yield lyr
+            else:
+                yield from lyr.named_layers()
+
     def make_ready(self, dc, *args, **kwargs):
         still_unready = []
+        init_errors = self.global_cfg.layer_init_errors
         for lyr in self.unready_layers:
             try:
-                lyr.make_ready(dc, *args, **kwargs)
+                if lyr.named and init_errors is not None:
+                    # Layer has already been initialised on the thread pool - see OWSConfig.make_layers_ready()
+                    if init_errors.get(lyr.name):
+                        raise init_errors[lyr.name]
+                else:
+                    lyr.make_ready(dc, *args, **kwargs)
                 self.child_layers.append(lyr)
             except ConfigException as e:
                 _LOG.error("Could not load layer %s: %s", lyr.title, str(e))
@@ -379,6 +405,19 @@ class TimeRes(Enum):
         else:
             return group_by_begin_datetime(product_names)
 
+class RangeState(NamedTuple):
+    """
+    The ranges of a named layer, and the attributes derived from them.
+
+    Replaced as a whole (see OWSNamedLayer.set_ranges), so requests running concurrently with a
+    background range refresh never see a mix of old and new values.
+    """
+    ranges: Optional[dict] = None
+    version: Optional[str] = None
+    bboxes: dict = {}
+    default_time: Any = None
+
+
 DEF_TIME_LATEST = "latest"
 DEF_TIME_EARLIEST = "earliest"
 
@@ -395,6 +434,11 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
         self.name = name
         cfg = self._raw_cfg
         self.hide = False
+        self.metadata_ready = False
+        self.data_ready = False
+        # Error message, if lazy initialisation has failed (see ensure_ready())
+        self.init_error: Optional[str] = None
+        self._ready_lock = Lock()
         try:
             self.parse_product_names(cfg)
             if len(self.low_res_product_names) not in (0, len(self.product_names)):
@@ -469,9 +513,7 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
 
         self.dynamic = cfg.get("dynamic", False)
 
-        self.declare_unready("default_time")
-        self.declare_unready("_ranges")
-        self.declare_unready("bboxes")
+        self.declare_unready("_range_state")
         # TODO: sub-ranges
         self.band_idx = BandIndex(self, cfg.get("bands"))
         self.cfg_native_resolution = cfg.get("native_resolution")
@@ -531,6 +573,20 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
 
     # pylint: disable=attribute-defined-outside-init
     def make_ready(self, dc, *args, **kwargs):
+        self.make_metadata_ready(dc)
+        if self.global_cfg.lazy_layer_init:
+            # Remaining initialisation is deferred until the layer is first used.  (See ensure_ready())
+            return
+        self.make_data_ready(dc, *args, **kwargs)
+
+    # pylint: disable=attribute-defined-outside-init
+    def make_metadata_ready(self, dc):
+        """
+        First stage of database initialisation: enough to advertise the layer in capabilities documents.
+
+        Looks up the layer's ODC products and loads the layer's extents from the ranges table.
+        """
+        start = monotonic()
         self.products = []
         self.low_res_products = []
         for i, prod_name in enumerate(self.product_names):
@@ -538,18 +594,28 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
                 low_res_prod_name = self.low_res_product_names[i]
             else:
                 low_res_prod_name = None
-            product = dc.index.products.get_by_name(prod_name)
+            product = self.global_cfg.odc_product(dc, prod_name)
             if not product:
                 raise ConfigException(f"Could not find product {prod_name} in datacube for layer {self.name}")
             self.products.append(product)
             if low_res_prod_name:
-                product = dc.index.products.get_by_name(low_res_prod_name)
+                product = self.global_cfg.odc_product(dc, low_res_prod_name)
                 if not product:
                     raise ConfigException(f"Could not find product {low_res_prod_name} in datacube for layer {self.name}")
                 self.low_res_products.append(product)
         self.product = self.products[0]
         self.definition = self.product.definition
         self.force_range_update(dc)
+        self.metadata_ready = True
+        layer_ready_seconds.labels(self.name, "metadata").observe(monotonic() - start)
+        layer_ready.labels(self.name).set(0)
+
+    # pylint: disable=attribute-defined-outside-init
+    def make_data_ready(self, dc, *args, **kwargs):
+        """
+        Second stage of database initialisation: everything else required to serve data requests.
+        """
+        start = monotonic()
         self.band_idx.make_ready(dc)
         self.resource_limits.make_ready(dc)
         self.all_flag_band_names = set()
@@ -566,11 +632,66 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
             style.make_ready(dc, *args, **kwargs)
         for fpb in self.allflag_productbands:
             fpb.make_ready(dc, *args, **kwargs)
-        if not self.multi_product:
-            self.global_cfg.native_product_index[self.product_name] = self
+        self.data_ready = True
 
         if not self.hide:
             super().make_ready(dc, *args, **kwargs)
+        layer_ready_seconds.labels(self.name, "data").observe(monotonic() - start)
+        layer_ready.labels(self.name).set(1)
+
+    def __getstate__(self):
+        # Locks cannot be pickled (see datacube_ows.config_snapshot)
+        state = self.__dict__.copy()
+        del state["_ready_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._ready_lock = Lock()
+
+    def ensure_ready(self):
+        """
+        Complete initialisation of a lazily initialised layer before it is used to serve data.
+
+        Does nothing if the layer is already fully initialised.  Safe to call from concurrent
+        requests: initialisation is performed at most once, under a per-layer lock.  If
+        initialisation fails, the failure is recorded and later calls fail immediately.
+
+        :raises: ConfigException if the layer cannot be initialised.
+        """
+        if self.data_ready:
+            return
+        with self._ready_lock:
+            if self.data_ready:
+                return
+            if self.init_error is not None:
+                raise ConfigException(f"Layer {self.name} is not available: {self.init_error}")
+            if not self.global_cfg.lazy_layer_init or not self.metadata_ready:
+                # Failed (or never attempted) at startup - not retried per request.
+                raise ConfigException(f"Layer {self.name} is not available")
+            with cube() as dc:
+                try:
+                    self.make_data_ready(dc)
+                except ConfigException as e:
+                    _LOG.error("Could not load layer %s: %s", self.name, str(e))
+                    self.init_error = str(e)
+                    # Stop advertising the layer.
+                    self.metadata_ready = False
+                    self.global_cfg.invalidate_caches()
+                    raise
+            # Capabilities cached before initialisation may be stale (e.g. hide, native CRS and default bands).
+            self.global_cfg.invalidate_caches()
+
+    @property
+    def capabilities_ready(self):
+        """
+        True if the layer may be advertised in capabilities documents.
+
+        With lazy layer initialisation, layers are advertised once metadata is ready.
+        """
+        if self.global_cfg.lazy_layer_init:
+            return self.metadata_ready
+        return self.ready
 
     # pylint: disable=attribute-defined-outside-init
     def parse_image_processing(self, cfg):
@@ -848,35 +969,95 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
             dc = ext_dc
         else:
             dc = get_cube()
-        self.hide = False
-        self._ranges = None
         try:
-            from datacube_ows.product_ranges import get_ranges
-            self._ranges = get_ranges(dc, self)
-            if self._ranges is None:
+            preloaded = self.global_cfg.preloaded_ranges
+            if preloaded is not None and self.name in preloaded:
+                ranges = preloaded[self.name]
+            else:
+                from datacube_ows.product_ranges import get_ranges
+                ranges = get_ranges(dc, self)
+        # pylint: disable=broad-except
+        except Exception as a:
+            self.range_update_failed(a)
+            return
+        self.set_ranges(ranges)
+
+    def set_ranges(self, ranges):
+        """
+        Update the layer with newly loaded ranges.
+
+        The bounding boxes, default time and version are derived from the new ranges, then
+        published together as a single RangeState, so concurrent requests see either the old
+        or the new values, never a mix.  The layer is hidden if ranges is None.
+
+        :param ranges: A ranges dictionary, as returned by get_ranges (or None)
+        """
+        try:
+            if ranges is None:
                 raise Exception("Null product range")
-            self.bboxes = self.extract_bboxes()
+            bboxes = self.extract_bboxes(ranges)
             if self.default_time_rule == DEF_TIME_EARLIEST:
-                self.default_time = self._ranges["start_time"]
+                default_time = ranges["start_time"]
             elif isinstance(self.default_time_rule,
-                            datetime.date) and self.default_time_rule in self._ranges["time_set"]:
-                self.default_time = self.default_time_rule
+                            datetime.date) and self.default_time_rule in ranges["time_set"]:
+                default_time = self.default_time_rule
             elif isinstance(self.default_time_rule, datetime.date):
                 _LOG.warning("default_time for named_layer %s is explicit date (%s) that is "
                              " not available for the layer. Using most recent available date instead.",
                                     self.name,
                                     self.default_time_rule.isoformat()
                 )
-                self.default_time = self._ranges["end_time"]
+                default_time = ranges["end_time"]
             else:
-                self.default_time = self._ranges["end_time"]
-
+                default_time = ranges["end_time"]
         # pylint: disable=broad-except
         except Exception as a:
-            if not self.global_cfg.called_from_update_ranges:
-                _LOG.warning("get_ranges failed for layer %s: %s", self.name, str(a))
-            self.hide = True
-            self.bboxes = {}
+            self.range_update_failed(a)
+            return
+        times = ranges["times"]
+        # Packed dates are much cheaper to hash than the repr of a long list of dates.
+        h = hashlib.sha1(times.packed() if isinstance(times, TimeIndex) else repr(list(times)).encode("utf-8"))
+        h.update(repr(sorted(ranges["bboxes"].items())).encode("utf-8"))
+        # Publish the new state with a single assignment.
+        self._range_state = RangeState(ranges, h.hexdigest(), bboxes, default_time)
+        self.hide = False
+
+    def range_update_failed(self, e):
+        if not self.global_cfg.called_from_update_ranges:
+            _LOG.warning("get_ranges failed for layer %s: %s", self.name, str(e))
+        self.hide = True
+        # Keep the previous default time (if any)
+        default_time = self._range_state.default_time if "_range_state" not in self._unready_attributes else None
+        self._range_state = RangeState(default_time=default_time)
+
+    @property
+    def _ranges(self):
+        return self._range_state.ranges
+
+    @property
+    def ranges_version(self) -> Optional[str]:
+        """
+        A hash of the layer's times and bounding boxes, which changes when the ranges are updated.
+        """
+        return self._range_state.version
+
+    @property
+    def bboxes(self):
+        return self._range_state.bboxes
+
+    @property
+    def default_time(self):
+        return self._range_state.default_time
+
+    @property
+    def time_index(self) -> TimeIndex:
+        """
+        The available times of the layer, as a TimeIndex.
+        """
+        times = self.ranges["times"]
+        if not isinstance(times, TimeIndex):
+            times = TimeIndex.from_dates(times, self.time_resolution.is_subday())
+        return times
 
     def time_range(self, ranges=None):
         if ranges is None:
@@ -893,15 +1074,18 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
 
     @property
     def ranges(self):
-        if self.dynamic:
+        # Dynamic layers are reloaded by the background range refresher, if enabled.
+        if self.dynamic and not self.global_cfg.range_refresh_interval:
             self.force_range_update()
         return self._ranges
 
-    def extract_bboxes(self):
-        if self._ranges is None:
+    def extract_bboxes(self, ranges=None):
+        if ranges is None:
+            ranges = self._ranges
+        if ranges is None:
             return {}
         bboxes = {}
-        for crs_id, bbox in self._ranges["bboxes"].items():
+        for crs_id, bbox in ranges["bboxes"].items():
             if crs_id in self.global_cfg.published_CRSs:
                 # Assume we've already handled coordinate swapping for
                 # Vertical-coord first CRSs.   Top is top, left is left.
@@ -1081,30 +1265,30 @@ class WCSFormat:
         return self.renderers[version]
 
 
+class ContactAddress(OWSConfigEntry):
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        self.type = cfg.get("type")
+        self.address = cfg.get("address")
+        self.city = cfg.get("city")
+        self.state = cfg.get("state")
+        self.postcode = cfg.get("postcode")
+        self.country = cfg.get("country")
+
+    @classmethod
+    def parse(cls, cfg):
+        if not cfg:
+            return None
+        else:
+            return cls(cfg)
+
+
 class ContactInfo(OWSConfigEntry):
     def __init__(self, cfg, global_cfg):
         super().__init__(cfg)
         self.global_cfg = global_cfg
         self.person = cfg.get("person")
-
-        class Address(OWSConfigEntry):
-            def __init__(self, cfg):
-                super().__init__(cfg)
-                self.type = cfg.get("type")
-                self.address = cfg.get("address")
-                self.city = cfg.get("city")
-                self.state = cfg.get("state")
-                self.postcode = cfg.get("postcode")
-                self.country = cfg.get("country")
-
-            @classmethod
-            def parse(cls, cfg):
-                if not cfg:
-                    return None
-                else:
-                    return cls(cfg)
-
-        self.address = Address.parse(cfg.get("address"))
+        self.address = ContactAddress.parse(cfg.get("address"))
         self.telephone = cfg.get("telephone")
         self.fax = cfg.get("fax")
         self.email = cfg.get("email")
@@ -1152,10 +1336,85 @@ class OWSConfig(OWSMetadataConfig):
     def active_product_index(self):
         return {prod.name: prod for prod in self.active_products}
 
+    # Settings read from the environment of the current process (see read_runtime_settings).
+    # These are not saved in configuration snapshots.
+    RUNTIME_SETTINGS = (
+        "range_refresh_interval", "compression_level", "compression_min_size",
+        "tile_cache_url", "tile_cache_max_size", "capabilities_cache_size",
+        "request_coalescing", "request_lock_dir", "dataset_etags", "range_refresh_always",
+        "profile_dir", "profile_secret", "profile_sample_rate",
+    )
+
+    def read_runtime_settings(self):
+        """
+        Read the runtime settings of the current process from environment variables.
+
+        :raises: ConfigException if an environment variable is invalid.
+        """
+        if self.called_from_update_ranges:
+            self.range_refresh_interval = 0.0
+        else:
+            try:
+                self.range_refresh_interval = float(os.environ.get("OWS_RANGE_REFRESH_INTERVAL", "0"))
+            except ValueError:
+                raise ConfigException("$OWS_RANGE_REFRESH_INTERVAL must be a number")
+        try:
+            self.compression_level = int(os.environ.get("OWS_COMPRESSION_LEVEL", "6"))
+            self.compression_min_size = int(os.environ.get("OWS_COMPRESSION_MIN_SIZE", "1024"))
+        except ValueError:
+            raise ConfigException("$OWS_COMPRESSION_LEVEL and $OWS_COMPRESSION_MIN_SIZE must be integers")
+        if not 0 <= self.compression_level <= 9:
+            raise ConfigException("$OWS_COMPRESSION_LEVEL must be between 0 (no compression) and 9")
+        self.tile_cache_url = os.environ.get("OWS_TILE_CACHE")
+        try:
+            self.tile_cache_max_size = int(os.environ.get("OWS_TILE_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE))
+        except ValueError:
+            raise ConfigException("$OWS_TILE_CACHE_MAX_SIZE must be an integer (bytes)")
+        try:
+            self.capabilities_cache_size = int(os.environ.get("OWS_CAPABILITIES_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        except ValueError:
+            raise ConfigException("$OWS_CAPABILITIES_CACHE_SIZE must be an integer (bytes)")
+        self.request_coalescing = os.environ.get("OWS_REQUEST_COALESCING", "yes").lower() not in ("no", "false", "f", "n", "0")
+        self.request_lock_dir = os.environ.get("OWS_REQUEST_LOCK_DIR")
+        self.dataset_etags = os.environ.get("OWS_DATASET_ETAGS", "yes").lower() not in ("no", "false", "f", "n", "0")
+        self.range_refresh_always = os.environ.get("OWS_RANGE_REFRESH_ALWAYS", "").lower() in ("y", "t", "yes", "true", "1")
+        self.profile_dir = os.environ.get("OWS_PROFILE_DIR")
+        self.profile_secret = os.environ.get("OWS_PROFILE_SECRET")
+        try:
+            self.profile_sample_rate = float(os.environ.get("OWS_PROFILE_SAMPLE_RATE", "0"))
+        except ValueError:
+            raise ConfigException("$OWS_PROFILE_SAMPLE_RATE must be a number")
+        if not 0.0 <= self.profile_sample_rate <= 1.0:
+            raise ConfigException("$OWS_PROFILE_SAMPLE_RATE must be between 0 and 1")
+        if self.profile_sample_rate and not self.profile_dir:
+            raise ConfigException("$OWS_PROFILE_SAMPLE_RATE requires $OWS_PROFILE_DIR to be set")
+    def __getstate__(self):
+        # Runtime settings belong to the process that loads a snapshot (and may include secrets).
+        # See datacube_ows.config_snapshot
+        state = self.__dict__.copy()
+        for name in self.RUNTIME_SETTINGS:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.read_runtime_settings()
+
     def __init__(self, refresh=False, cfg=None, ignore_msgfile=False, called_from_update_ranges=False):
         self.called_from_update_ranges = called_from_update_ranges
         if not self.initialised or refresh:
             self.msgfile = None
+            self.lazy_layer_init = (not called_from_update_ranges
+                                    and os.environ.get("OWS_LAZY_LAYER_INIT", "").lower() in ("y", "t", "yes", "true", "1"))
+            self._odc_products = None
+            self.preloaded_ranges = None
+            try:
+                self.layer_init_threads = int(os.environ.get("OWS_LAYER_INIT_THREADS", "1"))
+            except ValueError:
+                raise ConfigException("$OWS_LAYER_INIT_THREADS must be an integer")
+            self.read_runtime_settings()
+            self.layer_init_errors = None
+            self.cache_generation = uuid.uuid4().hex
             if not cfg:
                 cfg = read_config()
             super().__init__(cfg)
@@ -1207,9 +1466,114 @@ class OWSConfig(OWSMetadataConfig):
                 _LOG.warning("Message file %s does not exist - using metadata from config file", self.msg_file_name)
         else:
             self.set_msg_src(None)
+        start = monotonic()
         self.native_product_index = {}
-        self.root_layer_folder.make_ready(dc, *args, **kwargs)
+        if self.lazy_layer_init:
+            # Look up all ODC products in a single query, rather than one query per layer product.
+            self._odc_products = {p.name: p for p in dc.index.products.get_all()}
+        if not self.called_from_update_ranges:
+            # Load the ranges for all layers up front, rather than one query per layer.
+            from datacube_ows.product_ranges import get_all_ranges
+            try:
+                self.preloaded_ranges = get_all_ranges(dc, self.product_index.values())
+            except Exception as e:  # pylint: disable=broad-except
+                _LOG.warning("Bulk range load failed, loading ranges per layer: %s", str(e))
+        try:
+            if self.layer_init_threads > 1:
+                self.make_layers_ready(dc, *args, **kwargs)
+            self.root_layer_folder.make_ready(dc, *args, **kwargs)
+        finally:
+            self._odc_products = None
+            self.preloaded_ranges = None
+            self.layer_init_errors = None
+        # Build the native product index in configuration order, regardless of the order layers became ready.
+        for lyr in self.product_index.values():
+            if lyr.multi_product:
+                continue
+            if lyr.data_ready or (self.lazy_layer_init and lyr.metadata_ready):
+                self.native_product_index[lyr.product_name] = lyr
         super().make_ready(dc, *args, **kwargs)
+        self.invalidate_caches()
+        elapsed = monotonic() - start
+        config_ready_seconds.set(elapsed)
+        _LOG.info("Configuration ready: %d layers initialised in %.2fs%s",
+                  self.root_layer_folder.layer_count(),
+                  elapsed,
+                  " (lazy layer initialisation)" if self.lazy_layer_init else "")
+
+    def make_layers_ready(self, dc, *args, **kwargs):
+        """
+        Initialise all named layers concurrently on a thread pool.
+
+        The number of threads ($OWS_LAYER_INIT_THREADS) also bounds the number of database connections
+        in use at any one time.  Configuration errors are collected per layer in layer_init_errors, and
+        reported by the folders in the usual way.  Any other errors are logged and the first is re-raised.
+
+        :param dc: A Datacube object
+        """
+        layers = list(self.root_layer_folder.named_layers())
+
+        def make_layer_ready(lyr):
+            try:
+                lyr.make_ready(dc, *args, **kwargs)
+            except Exception as e:  # pylint: disable=broad-except
+                return e
+            return None
+
+        with ThreadPoolExecutor(max_workers=self.layer_init_threads,
+                                thread_name_prefix="ows_layer_init") as executor:
+            errors = list(executor.map(make_layer_ready, layers))
+        self.layer_init_errors = {
+            lyr.name: err
+            for lyr, err in zip(layers, errors)
+        }
+        unexpected = [
+            (lyr, err)
+            for lyr, err in zip(layers, errors)
+            if err is not None and not isinstance(err, ConfigException)
+        ]
+        n_failed = sum(1 for err in errors if err is not None)
+        if n_failed:
+            _LOG.error("%d of %d layers could not be initialised", n_failed, len(layers))
+        for lyr, err in unexpected:
+            _LOG.error("Unexpected error initialising layer %s: %s", lyr.name, repr(err))
+        if unexpected:
+            raise unexpected[0][1]
+
+    def refresh_ranges(self, dc, layers=None):
+        """
+        Reload the ranges for every named layer in one go.
+
+        The ranges for all layers are loaded before any layer is updated.
+
+        :param dc: A Datacube object
+        :param layers: The named layers to reload (defaults to all named layers)
+        """
+        from datacube_ows.product_ranges import get_all_ranges
+        if layers is None:
+            layers = list(self.product_index.values())
+        all_ranges = get_all_ranges(dc, layers)
+        for lyr in layers:
+            lyr.set_ranges(all_ranges[lyr.name])
+        self.invalidate_caches()
+
+    def invalidate_caches(self):
+        """
+        Invalidate any cached documents derived from the configuration or layer ranges (e.g. capabilities)
+        """
+        self.cache_generation = uuid.uuid4().hex
+
+    def odc_product(self, dc, name):
+        """
+        Look up an ODC product by name.
+
+        :param dc: A Datacube object
+        :param name: The ODC product name
+        :return: The ODC product, or None if it does not exist.
+        """
+        if self._odc_products is not None:
+            return self._odc_products.get(name)
+        return dc.index.products.get_by_name(name)
 
     def export_metadata(self):
         if self.catalog is None:
@@ -1442,4 +1806,7 @@ def get_config(refresh=False, called_from_update_ranges=False):
                 cfg.make_ready(dc)
         except ODCInitException:
             pass
+    if cfg.ready and cfg.range_refresh_interval:
+        from datacube_ows.range_refresher import start_range_refresher
+        start_range_refresher(cfg)
     return cfg
@@ -0,0 +1,85 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Prometheus metrics that are recorded outside of the Flask request wrappers in ogc.py.
+
+Metrics are registered against the default prometheus_client registry, which is exported
+by prometheus_flask_exporter when Prometheus metrics are enabled (see initialise_prometheus).
+Recording metrics when Prometheus is not enabled is harmless.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+# Configuration start-up and layer readiness
+config_ready_seconds = Gauge(
+    "ows_config_ready_seconds",
+    "Time taken to make the OWS configuration ready (database initialisation of all layers)",
+    multiprocess_mode="liveall",
+)
+
+layer_ready_seconds = Histogram(
+    "ows_layer_ready_seconds",
+    "Time taken to initialise a layer, by initialisation stage",
+    labelnames=["layer", "stage"],
+)
+
+layer_ready = Gauge(
+    "ows_layer_ready",
+    "Layer initialisation state: 0 = metadata only (lazy initialisation pending), 1 = fully initialised",
+    labelnames=["layer"],
+    multiprocess_mode="liveall",
+)
+
+# Background range refresh (see range_refresher.py)
+ranges_refreshed = Gauge(
+    "ows_ranges_refreshed_timestamp_seconds",
+    "Time at which the ranges of dynamic layers were last reloaded by the background range refresher",
+    multiprocess_mode="liveall",
+)
+
+# Request coalescing (see request_coalescing.py)
+coalesced_requests = Counter(
+    "ows_coalesced_requests",
+    "Data requests that shared the response of an identical concurrent request",
+)
+
+# Database connection pool (see cube_pool.py)
+db_connections_checked_out = Gauge(
+    "ows_db_connections_checked_out",
+    "Database connections currently checked out of the connection pool",
+    multiprocess_mode="livesum",
+)
+
+db_connections_waiting = Gauge(
+    "ows_db_connections_waiting",
+    "Threads currently waiting to check out a database connection",
+    multiprocess_mode="livesum",
+)
+
+db_checkout_wait_seconds = Histogram(
+    "ows_db_checkout_wait_seconds",
+    "Time taken to check out a database connection from the connection pool",
+)
+
+# Data request stages (see query_profiler.py)
+request_stage_seconds = Histogram(
+    "ows_request_stage_seconds",
+    "Time taken by each stage of a data request (e.g. count-datasets, load-data, write), by operation and layer",
+    labelnames=["operation", "layer", "stage"],
+)
+
+request_datasets = Histogram(
+    "ows_request_datasets",
+    "Number of datasets matching a data request, by operation and layer",
+    labelnames=["operation", "layer"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf")),
+)
+
+request_pixels = Histogram(
+    "ows_request_pixels",
+    "Number of pixels in the output of a data request (per date), by operation and layer",
+    labelnames=["operation", "layer"],
+    buckets=tuple(float(4 ** n) for n in range(4, 14)) + (float("inf"),),
+)
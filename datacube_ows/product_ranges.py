@@ -7,15 +7,24 @@
 #pylint: skip-file
 
 import math
-from datetime import datetime, timezone
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
 
 import datacube
+import numpy
 from psycopg2.extras import Json
-from sqlalchemy import text
+from sqlalchemy import func, select, text
 
+from datacube_ows.mv_index import group_date_expr, st_view
 from datacube_ows.ows_configuration import get_config
+from datacube_ows.time_index import TimeIndex
 from datacube_ows.utils import get_sqlconn
 
+# Incremental range updates re-scan datasets added up to this long before the high-water mark.
+# Datasets in indexing transactions that ran for longer than this across a range update are missed.
+INCREMENTAL_OVERLAP = timedelta(hours=1)
+
 
 def get_crsids(cfg=None):
     if not cfg:
@@ -100,13 +109,18 @@ def create_multiprod_range_entry(dc, product, crses):
         for d in r[0]:
             dates.add(d)
     dates = sorted(dates)
-    conn.execute(text("""
+    if "dates_packed" in range_table_columns(conn, "multiproduct_ranges"):
+        set_packed = ", dates_packed = :packed"
+    else:
+        set_packed = ""
+    conn.execute(text(f"""
            UPDATE wms.multiproduct_ranges
-           SET dates = :dates
+           SET dates = :dates{set_packed}
            WHERE wms_product_name= :p_id
       """),
          {
              "dates": Json(dates),
+             "packed": pack_dates(product.time_resolution, dates),
              "p_id": wms_name
          }
     )
@@ -146,13 +160,105 @@ def create_multiprod_range_entry(dc, product, crses):
     return
 
 
-def create_range_entry(dc, product, crses, time_resolution):
+def range_table_columns(conn, table):
+  """
+  The columns of a wms ranges table.
+
+  Columns added by newer versions of the schema (e.g. the high-water mark and packed dates)
+  are missing until ``datacube-ows-update --schema`` is re-run after upgrading, and are not
+  written until then.
+  """
+  results = conn.execute(text("""
+    SELECT column_name
+    FROM information_schema.columns
+    WHERE table_schema = 'wms'
+    AND table_name = :table
+    """),
+    {"table": table})
+  return set(r[0] for r in results)
+
+
+def archived_count(conn, prodid):
+  # Number of archived datasets for an ODC product
+  results = conn.execute(text("""
+    SELECT count(*)
+    FROM agdc.dataset
+    WHERE dataset_type_ref = :p_id
+    AND archived IS NOT NULL
+    """),
+    {"p_id": prodid})
+  return list(results)[0][0]
+
+
+def high_water_mark(conn, prodid, n_archived):
+  """
+  The high-water mark for an incremental range update of an ODC product.
+
+  :return: The latest "added" timestamp of the datasets in the current ranges, or None if
+      an incremental update is not possible (no existing ranges, or datasets have been archived
+      since the last update).
+  """
+  results = list(conn.execute(text("""
+    SELECT max_added, n_archived
+    FROM wms.product_ranges
+    WHERE id = :p_id
+    """),
+    {"p_id": prodid}))
+  if not results:
+    return None
+  max_added, prev_archived = results[0]
+  if max_added is None or prev_archived != n_archived:
+    return None
+  return max_added
+
+
+def product_dates(conn, prodid, time_resolution, since=None):
+  """
+  The distinct dates of an ODC product's datasets (optionally only datasets added after since).
+
+  Solar dates are calculated in the database (as for mv_search DATES queries), so only distinct
+  dates are returned, rather than a row per dataset.
+  """
+  if time_resolution.is_solar():
+    date_expr = group_date_expr(st_view, time_resolution)
+  else:
+    date_expr = func.lower(st_view.c.temporal_extent)
+  s = select(date_expr).distinct().where(st_view.c.dataset_type_ref == prodid)
+  if since is not None:
+    s = s.where(st_view.c.id.in_(
+        text("SELECT ds.id FROM agdc.dataset ds WHERE ds.added > :since").bindparams(since=since)
+    ))
+  return set(r[0] for r in conn.execute(s))
+
+
+def create_range_entry(dc, product, crses, time_resolution, incremental=False):
   print("Updating range for ODC product %s..." % product.name)
   # NB. product is an ODC product
   conn = get_sqlconn(dc)
   txn = conn.begin()
   prodid = product.id
 
+  # Set default timezone
+  conn.execute(text("""set timezone to 'Etc/UTC'"""))
+
+  columns = range_table_columns(conn, "product_ranges")
+  has_hwm = "max_added" in columns and "n_archived" in columns
+  if not has_hwm or "dates_packed" not in columns:
+    print("The range tables are from an older version of OWS - run datacube-ows-update --schema to upgrade them")
+  n_archived = archived_count(conn, prodid) if has_hwm else None
+  since = None
+  if incremental and not has_hwm:
+    print("No high-water mark columns: full update for ODC product", product.name)
+  elif incremental:
+    since = high_water_mark(conn, prodid, n_archived)
+    if since is None:
+      print("No high-water mark or datasets archived since last update: full update for ODC product", product.name)
+    else:
+      # Re-scan an overlap before the high-water mark, to catch datasets whose indexing
+      # transaction started before the last update but committed after it.
+      since = since - INCREMENTAL_OVERLAP
+      print("Merging datasets added since", since.isoformat())
+
   # insert empty row if one does not already exist
   conn.execute(text("""
     INSERT INTO wms.product_ranges
@@ -163,73 +269,77 @@ def create_range_entry(dc, product, crses, time_resolution):
     """),
     {"p_id": prodid, "empty": Json("")})
 
-
-  # Update min/max lat/longs
-  conn.execute(text(
-      """
-      UPDATE wms.product_ranges pr
-      SET lat_min = st_ymin(subq.bbox),
-          lat_max = st_ymax(subq.bbox),
-          lon_min = st_xmin(subq.bbox),
-          lon_max = st_xmax(subq.bbox)
-      FROM (
-        SELECT st_extent(stv.spatial_extent) as bbox
-        FROM public.space_time_view stv
-        WHERE stv.dataset_type_ref = :p_id
-      ) as subq
-      WHERE pr.id = :p_id
-      """),
-      {"p_id": prodid})
-
-  # Set default timezone
-  conn.execute(text("""set timezone to 'Etc/UTC'"""))
-
-  # Loop over dates
-  dates = set()
-  if time_resolution.is_solar():
-      results = conn.execute(text(
-          """
-          select
-                lower(temporal_extent), upper(temporal_extent),
-                ST_X(ST_Centroid(spatial_extent))
-          from public.space_time_view
-          WHERE dataset_type_ref = :p_id
-          """),
-          {"p_id": prodid})
-      for result in results:
-          dt1, dt2, lon = result
-          dt = dt1 + (dt2 - dt1) / 2
-          dt = dt.astimezone(timezone.utc)
-
-          solar_day = datacube.api.query._convert_to_solar_time(dt, lon).date()
-          dates.add(solar_day)
+  # Update min/max lat/longs and the high-water mark
+  if since is None:
+    if has_hwm:
+      set_hwm = """,
+            max_added = subq.max_added,
+            n_archived = :n_archived"""
+    else:
+      set_hwm = ""
+    conn.execute(text(
+        f"""
+        UPDATE wms.product_ranges pr
+        SET lat_min = st_ymin(subq.bbox),
+            lat_max = st_ymax(subq.bbox),
+            lon_min = st_xmin(subq.bbox),
+            lon_max = st_xmax(subq.bbox){set_hwm}
+        FROM (
+          SELECT st_extent(stv.spatial_extent) as bbox, max(ds.added) as max_added
+          FROM public.space_time_view stv
+          JOIN agdc.dataset ds ON ds.id = stv.id
+          WHERE stv.dataset_type_ref = :p_id
+        ) as subq
+        WHERE pr.id = :p_id
+        """),
+        {"p_id": prodid, "n_archived": n_archived})
   else:
-      results = conn.execute(text(
-          """
-          select
-                array_agg(temporal_extent)
-          from public.space_time_view
-          WHERE dataset_type_ref = :p_id
-          """),
-          {"p_id": prodid}
-      )
-      for result in results:
-          for dat_ran in result[0]:
-              dates.add(dat_ran.lower)
+    # Merge the extent of new datasets (least/greatest ignore nulls, i.e. no new datasets)
+    conn.execute(text(
+        """
+        UPDATE wms.product_ranges pr
+        SET lat_min = least(pr.lat_min, st_ymin(subq.bbox)),
+            lat_max = greatest(pr.lat_max, st_ymax(subq.bbox)),
+            lon_min = least(pr.lon_min, st_xmin(subq.bbox)),
+            lon_max = greatest(pr.lon_max, st_xmax(subq.bbox)),
+            max_added = greatest(pr.max_added, subq.max_added)
+        FROM (
+          SELECT st_extent(stv.spatial_extent) as bbox, max(ds.added) as max_added
+          FROM public.space_time_view stv
+          JOIN agdc.dataset ds ON ds.id = stv.id
+          WHERE stv.dataset_type_ref = :p_id
+          AND ds.added > :since
+        ) as subq
+        WHERE pr.id = :p_id
+        """),
+        {"p_id": prodid, "since": since})
+
+  dates = product_dates(conn, prodid, time_resolution, since)
 
   if time_resolution.is_subday():
       date_formatter = lambda d: d.isoformat()
   else:
       date_formatter = lambda d: d.strftime("%Y-%m-%d")
 
+  dates = set(map(date_formatter, dates))
+  if since is not None:
+    results = list(conn.execute(text("""
+      SELECT dates
+      FROM wms.product_ranges
+      WHERE id = :p_id
+      """),
+      {"p_id": prodid}))
+    dates.update(results[0][0])
   dates = sorted(dates)
-  conn.execute(text("""
+  set_packed = ", dates_packed = :packed" if "dates_packed" in columns else ""
+  conn.execute(text(f"""
        UPDATE wms.product_ranges
-       SET dates = :dates
+       SET dates = :dates{set_packed}
        WHERE id= :p_id
   """),
                {
-                   "dates": Json(list(map(date_formatter, dates))),
+                   "dates": Json(dates),
+                   "packed": pack_dates(time_resolution, dates),
                    "p_id": prodid
                }
   )
@@ -311,7 +421,49 @@ def datasets_exist(dc, product_name):
   return list(results)[0][0] > 0
 
 
-def add_ranges(dc, product_names, merge_only=False):
+_worker_dc = None
+
+
+def _init_range_worker():
+    global _worker_dc
+    _worker_dc = datacube.Datacube(app="ows_update_ranges")
+    get_config(called_from_update_ranges=True)
+
+
+def _update_product_range(pname, time_resolution, incremental=False):
+    # Runs in a worker process, with its own database connection and transaction.
+    dc_product = _worker_dc.index.products.get_by_name(pname)
+    create_range_entry(_worker_dc, dc_product, get_crses(), time_resolution, incremental)
+    return pname
+
+
+def update_product_ranges(dc, tasks, jobs=1, incremental=False):
+    """
+    Update the ranges of ODC products, optionally in parallel.
+
+    :param dc: A Datacube object (used if jobs is 1)
+    :param tasks: A list of (ODC product name, time resolution) tuples
+    :param jobs: The number of products to update concurrently, each in a separate worker process
+    :param incremental: Only merge datasets added since the last update, where possible
+    """
+    if jobs <= 1 or len(tasks) <= 1:
+        for pname, time_resolution in tasks:
+            create_range_entry(dc, dc.index.products.get_by_name(pname), get_crses(), time_resolution,
+                               incremental)
+        return
+    # Spawn (rather than fork) so worker processes do not share the parent's database connections.
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)),
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_range_worker) as executor:
+        futures = [
+            executor.submit(_update_product_range, pname, time_resolution, incremental)
+            for pname, time_resolution in tasks
+        ]
+        for future in as_completed(futures):
+            print("Finished updating range for ODC product", future.result())
+
+
+def add_ranges(dc, product_names, merge_only=False, jobs=1, incremental=False):
     odc_products = {}
     ows_multiproducts = []
     errors = False
@@ -349,6 +501,7 @@ def add_ranges(dc, product_names, merge_only=False):
     if ows_multiproducts and merge_only:
         print("Merge-only: Skipping range update of products:", repr(list(odc_products.keys())))
     else:
+        tasks = []
         for pname, ows_prods in odc_products.items():
             dc_product = dc.index.products.get_by_name(pname)
             if dc_product is None:
@@ -371,11 +524,13 @@ def add_ranges(dc, product_names, merge_only=False):
                             break
                         time_resolution = new_tr
                 if time_resolution is not None:
-                    create_range_entry(dc, dc_product, get_crses(), time_resolution)
+                    tasks.append((dc_product.name, time_resolution))
                 else:
                     print("Could not determine time_resolution for product: ", pname)
             else:
                 print("Could not find any datasets for: ", pname)
+        update_product_ranges(dc, tasks, jobs, incremental)
+    # Multi-product merges run after all their constituent products have been updated.
     for mp in ows_multiproducts:
         create_multiprod_range_entry(dc, mp, get_crses())
 
@@ -418,26 +573,129 @@ def get_ranges(dc, product, path=None, is_dc_product=False):
                                   )
     for result in results:
         conn.close()
-        if product.time_resolution.is_subday():
-            dt_parser = lambda dts: datetime.fromisoformat(dts)
-        else:
-            dt_parser = lambda dts: datetime.strptime(dts, "%Y-%m-%d").date()
-        times = [dt_parser(d) for d in result["dates"] if d is not None]
-        if not times:
-            return None
-        return {
-            "lat": {
-                "min": float(result["lat_min"]),
-                "max": float(result["lat_max"]),
-            },
-            "lon": {
-                "min": float(result["lon_min"]),
-                "max": float(result["lon_max"]),
-            },
-            "times": times,
-            "start_time": times[0],
-            "end_time": times[-1],
-            "time_set": set(times),
-            "bboxes": cfg.alias_bboxes(result["bboxes"])
-        }
+        return parse_ranges_row(cfg, product.time_resolution, result)
     return None
+
+
+def parse_dates(time_resolution, dates):
+    """
+    Parse the dates column of a ranges table row.
+
+    Day (or coarser) resolution dates are parsed in a single numpy call.
+    Sub-day resolution dates are timezone-aware ISO timestamps and are parsed individually.
+
+    :param time_resolution: The TimeRes of the layer
+    :param dates: The list of date strings from the ranges table
+    :return: A list of datetime.date or datetime.datetime objects
+    """
+    dates = [d for d in dates if d is not None]
+    if time_resolution.is_subday():
+        return [datetime.fromisoformat(d) for d in dates]
+    return numpy.array(dates, dtype="datetime64[D]").tolist()
+
+
+def pack_dates(time_resolution, dates):
+    """
+    Pack the dates column of a ranges table row for the dates_packed column.
+
+    :param time_resolution: The TimeRes of the layer
+    :param dates: The list of date strings for the ranges table
+    :return: bytes, as returned by TimeIndex.packed()
+    """
+    return TimeIndex.from_dates(parse_dates(time_resolution, dates), time_resolution.is_subday()).packed()
+
+
+def parse_ranges_row(cfg, time_resolution, result):
+    # The packed dates are read without parsing individual dates, if available.
+    packed = result["dates_packed"] if "dates_packed" in result.keys() else None
+    if packed is not None:
+        times = TimeIndex.from_packed(packed, time_resolution.is_subday())
+    else:
+        times = TimeIndex.from_dates(parse_dates(time_resolution, result["dates"]), time_resolution.is_subday())
+    if not times:
+        return None
+    return {
+        "lat": {
+            "min": float(result["lat_min"]),
+            "max": float(result["lat_max"]),
+        },
+        "lon": {
+            "min": float(result["lon_min"]),
+            "max": float(result["lon_max"]),
+        },
+        "times": times,
+        "start_time": times[0],
+        "end_time": times[-1],
+        # A TimeIndex supports efficient membership tests.
+        "time_set": times,
+        "bboxes": cfg.alias_bboxes(result["bboxes"])
+    }
+
+
+def get_all_ranges(dc, layers):
+    """
+    Load the ranges for many layers at once.
+
+    Ranges for all single-product layers are read in one query, and ranges for all multi-product
+    layers in a second query.
+
+    :param dc: A Datacube object
+    :param layers: An iterable of OWSNamedLayer objects
+    :return: A dictionary mapping layer names to ranges dictionaries (as returned by get_ranges).
+            Layers with no ranges (e.g. not yet added by update_ranges) map to None.
+    """
+    layers = list(layers)
+    all_ranges = {lyr.name: None for lyr in layers}
+    if not layers:
+        return all_ranges
+    cfg = layers[0].global_cfg
+    single = [lyr for lyr in layers if not lyr.multi_product]
+    multi = [lyr for lyr in layers if lyr.multi_product]
+    conn = get_sqlconn(dc)
+    if single:
+        results = conn.execute(text("""
+            SELECT p.name AS odc_product_name, r.*
+            FROM wms.product_ranges r, agdc.dataset_type p
+            WHERE r.id = p.id
+            AND p.name = ANY(:pnames)"""),
+                               {"pnames": list(set(lyr.product_names[0] for lyr in single))}
+                              )
+        rows = {result["odc_product_name"]: result for result in results}
+        for lyr in single:
+            row = rows.get(lyr.product_names[0])
+            if row is not None:
+                all_ranges[lyr.name] = parse_ranges_row(cfg, lyr.time_resolution, row)
+    if multi:
+        results = conn.execute(text("""
+            SELECT *
+            FROM wms.multiproduct_ranges
+            WHERE wms_product_name = ANY(:pnames)"""),
+                               {"pnames": [lyr.name for lyr in multi]}
+                              )
+        rows = {result["wms_product_name"]: result for result in results}
+        for lyr in multi:
+            row = rows.get(lyr.name)
+            if row is not None:
+                all_ranges[lyr.name] = parse_ranges_row(cfg, lyr.time_resolution, row)
+    conn.close()
+    return all_ranges
+
+
+def get_ranges_change_token(dc):
+    """
+    Return a cheap token that changes whenever the contents of the ranges tables change.
+
+    The token is built from row counts and row versions (xmin), so the (potentially large) dates
+    columns are not read.
+    """
+    conn = get_sqlconn(dc)
+    results = conn.execute(text("""
+        SELECT 'product', count(*), coalesce(sum(xmin::text::bigint), 0)
+        FROM wms.product_ranges
+        UNION ALL
+        SELECT 'multiproduct', count(*), coalesce(sum(xmin::text::bigint), 0)
+        FROM wms.multiproduct_ranges
+        ORDER BY 1"""))
+    token = ";".join(f"{tbl}:{count}:{xmin_sum}" for tbl, count, xmin_sum in results)
+    conn.close()
+    return token
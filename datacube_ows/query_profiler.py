@@ -3,41 +3,232 @@
 #
 # Copyright (c) 2017-2023 OWS Contributors
 # SPDX-License-Identifier: Apache-2.0
-from time import time
+"""
+Per-request profiling of data requests.
+
+A profile is a tree of timed spans.  Request stages (e.g. count-datasets, load-data, write)
+are marked with start_event/end_event.  Finer-grained spans (e.g. one per index query, or
+per dataset load) are marked with the profile_span context manager, which attaches spans to
+the active profiler of the current request (if any), so the profiler need not be passed down.
+
+Stage timings are always recorded (and exported as Prometheus histograms, labelled by
+operation and layer, if an operation is supplied), but finer-grained spans are only recorded,
+and the profile is only returned to the client, for active (ows_stats) requests.
+
+The profile returned for ows_stats requests is also a Chrome trace-event format document,
+so it can be opened directly in a trace viewer (e.g. chrome://tracing or https://ui.perfetto.dev).
+If Python memory allocation tracing is enabled (e.g. PYTHONTRACEMALLOC=1), each span also
+records the net memory allocated during the span.
+"""
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from flask import current_app, g, has_app_context
+
+from datacube_ows.ows_metrics import (request_datasets, request_pixels,
+                                      request_stage_seconds)
+
+# Request stats that are also exported as Prometheus histograms
+STAT_HISTOGRAMS = {
+    "n_datasets": request_datasets,
+    "n_pixels": request_pixels,
+}
+
+
+class Span:
+    """
+    A timed section of a request, with attributes and child spans.
+    """
+    __slots__ = ("name", "attrs", "children", "start_ns", "end_ns", "thread_id", "stage", "mem_start")
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None, stage: bool = False) -> None:
+        self.name = name
+        self.attrs = attrs or {}
+        self.children: List["Span"] = []
+        self.thread_id = threading.get_ident()
+        self.stage = stage
+        self.mem_start = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.end_ns: Optional[int] = None
+        self.start_ns = perf_counter_ns()
+
+    def end(self) -> None:
+        self.end_ns = perf_counter_ns()
+        if self.mem_start is not None and tracemalloc.is_tracing():
+            self.attrs["alloc_bytes"] = tracemalloc.get_traced_memory()[0] - self.mem_start
+
+    @property
+    def duration(self) -> float:
+        """
+        The duration of the (ended) span, in seconds.
+        """
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def walk(self) -> Iterator["Span"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
 
 
 class QueryProfiler:
-    def __init__(self, active):
+    def __init__(self, active, operation=None, layer=None):
+        """
+        :param active: True if the profile is to be returned to the client (ows_stats)
+        :param operation: The request operation (e.g. GetMap) for Prometheus metrics, or None for no metrics
+        :param layer: The name of the requested layer
+        """
         self.active = active
-        self._events = {}
+        self.operation = operation
+        self.layer = layer or ""
         self._stats = {}
-        if active:
-            self.start_event("query")
+        self._lock = threading.Lock()
+        self._open_spans = threading.local()
+        self.root = Span("query", {"operation": operation, "layer": layer} if operation else None)
+        if active and has_app_context():
+            g.ows_query_profiler = self
+
+    def _stack(self) -> List[Span]:
+        # Open spans of the current thread.  Spans in other threads are children of the root span.
+        stack = getattr(self._open_spans, "stack", None)
+        if stack is None:
+            stack = self._open_spans.stack = [self.root]
+        return stack
+
+    def _open(self, name: str, attrs: Optional[Dict[str, Any]] = None, stage: bool = False) -> Span:
+        stack = self._stack()
+        span = Span(name, attrs, stage)
+        with self._lock:
+            stack[-1].children.append(span)
+        stack.append(span)
+        return span
+
+    def _close(self, span: Span) -> None:
+        span.end()
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+        if span.stage and self.operation:
+            request_stage_seconds.labels(self.operation, self.layer, span.name).observe(span.duration)
 
     def start_event(self, name):
-        if self.active:
-            self._events[name] = [time(), None]
+        self._open(name, stage=True)
+
+    def end_event(self, name):
+        # Close the most recently started open span of that name (if any).
+        for span in reversed(self._stack()):
+            if span.name == name and span is not self.root:
+                self._close(span)
+                return
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+        """
+        A context manager that records a (possibly nested or repeated) span of an active profile.
+
+        :param name: The span name
+        :param attrs: Attributes of the span (included in the trace)
+        :return: The Span, or None if the profiler is not active
+        """
+        if not self.active:
+            yield None
+            return
+        span = self._open(name, attrs)
+        try:
+            yield span
+        finally:
+            self._close(span)
 
     def __setitem__(self, name, val):
         self._stats[name] = val
+        if self.operation and name in STAT_HISTOGRAMS:
+            STAT_HISTOGRAMS[name].labels(self.operation, self.layer).observe(val)
 
     def __getitem__(self, name):
         return self._stats[name]
 
-    def end_event(self, name):
-        if self.active:
-            if name in self._events:
-                self._events[name][1] = time()
-            else:
-                self._events[name] = [None, time()]
+    def trace_events(self) -> List[Dict[str, Any]]:
+        """
+        The ended spans of the profile, as Chrome trace-event format "complete" events.
+
+        Timestamps are in microseconds, relative to the start of the request.
+        """
+        pid = os.getpid()
+        return [
+            {
+                "name": span.name,
+                "ph": "X",
+                "ts": (span.start_ns - self.root.start_ns) / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {k: v if isinstance(v, (int, float, bool)) else str(v) for k, v in span.attrs.items()},
+            }
+            for span in self.root.walk()
+            if span.end_ns is not None
+        ]
 
     def profile(self):
         result = {}
         if self.active:
-            self.end_event("query")
+            if self.root.end_ns is None:
+                self.root.end()
+            # Total time per span name (repeated spans are summed)
             result["profile"] = {}
-            for name, rng in self._events.items():
-                if rng[0] and rng[1]:
-                    result["profile"][name] = rng[1] - rng[0]
+            for span in self.root.walk():
+                if span.end_ns is not None:
+                    result["profile"][span.name] = result["profile"].get(span.name, 0.0) + span.duration
             result["info"] = self._stats
+            result["traceEvents"] = self.trace_events()
+            result["displayTimeUnit"] = "ms"
         return result
+
+
+def current_profiler() -> Optional[QueryProfiler]:
+    """
+    The active QueryProfiler of the current request, if any.
+    """
+    if has_app_context():
+        return g.get("ows_query_profiler")
+    return None
+
+
+@contextmanager
+def profile_span(name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+    """
+    Record a span in the active profile of the current request (a no-op if the request is not being profiled).
+
+    :param name: The span name
+    :param attrs: Attributes of the span (included in the trace)
+    """
+    qprof = current_profiler()
+    if qprof is None:
+        yield None
+        return
+    with qprof.span(name, **attrs) as span:
+        yield span
+
+
+def in_request_context(func: Callable) -> Callable:
+    """
+    Wrap a function to be run in worker threads, so that it runs in the app context of the current
+    request, with the current request's active profiler (so spans in worker threads are recorded).
+
+    :param func: The function to wrap
+    :return: The wrapped function (or func unchanged, outside an app context)
+    """
+    if not has_app_context():
+        return func
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+    qprof = current_profiler()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            if qprof is not None:
+                g.ows_query_profiler = qprof
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,107 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Background reloading of the ranges of dynamic layers.
+
+By default, the ranges of a dynamic layer are reloaded from the database every time they
+are accessed.  If $OWS_RANGE_REFRESH_INTERVAL is set, each worker process instead runs a
+background thread that reloads the ranges of all dynamic layers in bulk, and request
+handling only ever reads the ranges held in memory.
+
+The thread polls the (cheap) ranges table change token every interval and only reloads when
+it has changed, unless $OWS_RANGE_REFRESH_ALWAYS is set.  New ranges are fully loaded and
+parsed before any layer is updated, and each layer's ranges dictionary is replaced, never
+modified in place.
+"""
+import logging
+import os
+from threading import Event, Lock, Thread
+from typing import Optional
+
+from datacube_ows.cube_pool import cube
+from datacube_ows.ows_metrics import ranges_refreshed
+from datacube_ows.product_ranges import get_ranges_change_token
+
+_LOG = logging.getLogger(__name__)
+
+
+class RangeRefresher(Thread):
+    def __init__(self, cfg, interval: float, always: bool = False) -> None:
+        super().__init__(name="ows_range_refresher", daemon=True)
+        self.cfg = cfg
+        self.interval = interval
+        self.always = always
+        self.token: Optional[str] = None
+        self.pid = os.getpid()
+        self.stop_event = Event()
+
+    def dynamic_layers(self):
+        return [lyr for lyr in self.cfg.product_index.values() if lyr.dynamic]
+
+    def refresh(self) -> bool:
+        """
+        Reload the ranges of all dynamic layers, if required.
+
+        :return: True if ranges were reloaded.
+        """
+        layers = self.dynamic_layers()
+        if not layers:
+            return False
+        with cube() as dc:
+            token = get_ranges_change_token(dc)
+            if not self.always and token == self.token:
+                return False
+            self.cfg.refresh_ranges(dc, layers)
+        self.token = token
+        ranges_refreshed.set_to_current_time()
+        _LOG.debug("Reloaded ranges for %d dynamic layers", len(layers))
+        return True
+
+    def run(self) -> None:
+        try:
+            with cube() as dc:
+                self.token = get_ranges_change_token(dc)
+        except Exception as e:  # pylint: disable=broad-except
+            _LOG.warning("Could not read ranges change token: %s", str(e))
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:  # pylint: disable=broad-except
+                _LOG.warning("Background range refresh failed: %s", str(e))
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+
+_refresher: Optional[RangeRefresher] = None
+_refresher_lock = Lock()
+
+
+def start_range_refresher(cfg) -> Optional[RangeRefresher]:
+    """
+    Start the background range refresher for this process, if enabled and not already running.
+
+    Threads do not survive a fork, so a refresher started in a parent process is replaced
+    in each worker process.
+
+    :param cfg: A ready OWSConfig object
+    :return: The running RangeRefresher, or None if background refreshing is disabled.
+    """
+    global _refresher  # pylint: disable=global-statement
+    if not cfg.range_refresh_interval:
+        return None
+    if _refresher is not None and _refresher.cfg is cfg and _refresher.pid == os.getpid():
+        return _refresher
+    with _refresher_lock:
+        if _refresher is not None and _refresher.cfg is cfg and _refresher.pid == os.getpid():
+            return _refresher
+        if _refresher is not None and _refresher.pid == os.getpid():
+            # The configuration has been reloaded.
+            _refresher.stop()
+        _refresher = RangeRefresher(cfg, cfg.range_refresh_interval, cfg.range_refresh_always)
+        _refresher.start()
+        _LOG.info("Started background range refresher (interval %ss)", cfg.range_refresh_interval)
+        return _refresher
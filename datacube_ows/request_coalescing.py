@@ -0,0 +1,118 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Coalescing of identical concurrent GetMap and GetTile requests ("single-flight").
+
+When several threads of a worker process handle identical requests at the same time, only the
+first renders the response.  The others wait for it to finish and share its result: the same
+body, status and headers, or the same exception.
+
+Requests are identical if their normalised parameters match (ignoring parameters that do not
+affect the response, such as the request id), and they have the same If-None-Match header.
+
+Coalescing is enabled by default, and can be disabled with $OWS_REQUEST_COALESCING.  Across
+worker processes, tile-cached requests can also be coordinated with lock files (see
+$OWS_REQUEST_LOCK_DIR and tile_cache.py).
+"""
+import logging
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, Mapping, Optional
+
+from flask import has_request_context, request
+
+from datacube_ows.etags import IGNORED_ARGS
+from datacube_ows.ows_metrics import coalesced_requests
+
+_LOG = logging.getLogger(__name__)
+
+
+class Flight:
+    """
+    A single in-progress request, and its eventual result.
+    """
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time, sharing the result with concurrent callers.
+    """
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._flights: Dict[Hashable, Flight] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Call fn, unless a call with the same key is already in progress, in which case
+        wait for and return (or raise) its result.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self._flights[key] = flight
+            else:
+                flight.waiters += 1
+        if not leader:
+            coalesced_requests.inc()
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy_response(flight.result)
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+            if flight.waiters:
+                _LOG.debug("Shared response with %d identical concurrent requests", flight.waiters)
+
+
+def copy_response(resp: Any) -> Any:
+    # Flask response tuples are shared between threads - give each waiter its own headers.
+    if isinstance(resp, tuple) and len(resp) == 3 and isinstance(resp[2], Mapping):
+        return (resp[0], resp[1], dict(resp[2]))
+    return resp
+
+
+def coalescing_key(args: Mapping[str, Any]) -> Hashable:
+    """
+    A hashable key identifying a request by its normalised parameters and If-None-Match header.
+    """
+    params = tuple(sorted(
+        (k, str(v)) for k, v in args.items() if k not in IGNORED_ARGS and v is not None
+    ))
+    if_none_match = request.headers.get("If-None-Match") if has_request_context() else None
+    return params, if_none_match
+
+
+_single_flight = SingleFlight()
+
+
+def coalesced(cfg, args: Mapping[str, Any], fn: Callable[[Mapping[str, Any]], Any]) -> Any:
+    """
+    Handle a data request, sharing the response with identical concurrent requests.
+
+    Profiled (ows_stats) requests are never coalesced.
+
+    :param cfg: The global OWSConfig object
+    :param args: The (lower-cased) request arguments
+    :param fn: The request handler, called with args
+    :return: The (possibly shared) response of fn
+    """
+    if not cfg.request_coalescing or args.get("ows_stats"):
+        return fn(args)
+    return _single_flight.do(coalescing_key(args), lambda: fn(args))
@@ -0,0 +1,171 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Opt-in CPU profiling of individual requests, for use in production deployments.
+
+A request is run under the (deterministic) cProfile profiler if either:
+
+1. It carries a valid, unexpired signed ``ows_profile`` parameter (an HMAC-SHA256 of the other
+   request parameters, including the ``ows_profile_expires`` expiry time, keyed by
+   ``$OWS_PROFILE_SECRET``), or
+2. It is randomly sampled (a fraction ``$OWS_PROFILE_SAMPLE_RATE`` of all requests).
+
+Profiles are saved in pstats format to ``$OWS_PROFILE_DIR`` (if set).  Signed requests with
+``ows_profile_return=yes`` receive a plain text summary of the profile instead of the normal
+response, in the same way as ``ows_stats``.
+"""
+import cProfile
+import hashlib
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import uuid
+from functools import wraps
+from time import strftime, time
+from typing import Callable, Mapping
+
+from flask import g, has_app_context
+
+from datacube_ows.ogc_utils import lower_get_args
+from datacube_ows.ows_configuration import get_config
+
+_LOG = logging.getLogger(__name__)
+
+# Request parameters that control profiling (and are excluded from the signature)
+PROFILE_ARGS = ("ows_profile", "ows_profile_return")
+
+# Request parameter for the expiry time of a signature (unix seconds, included in the signature)
+EXPIRES_ARG = "ows_profile_expires"
+
+# Number of functions included in returned profile summaries
+SUMMARY_LENGTH = 50
+
+# Only one cProfile profiler can be active at a time in a process.
+_profiler_lock = threading.Lock()
+
+
+def profile_signature(secret: str, args: Mapping[str, str], expires: int) -> str:
+    """
+    Calculate the ows_profile signature for a request.
+
+    The request must also carry the expiry time as the ows_profile_expires parameter.
+
+    :param secret: The profiling secret ($OWS_PROFILE_SECRET)
+    :param args: The request parameters (names are case-insensitive, profiling parameters are ignored)
+    :param expires: The expiry time of the signature (unix seconds)
+    :return: A hex HMAC-SHA256 digest of the sorted request parameters and expiry time
+    """
+    signed = {k.lower(): v for k, v in args.items() if k.lower() not in PROFILE_ARGS}
+    signed[EXPIRES_ARG] = str(int(expires))
+    canonical = "&".join(f"{k}={v}" for k, v in sorted(signed.items()))
+    return hmac.new(secret.encode("utf-8"), canonical.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def signed_profile_request(cfg, args: Mapping[str, str]) -> bool:
+    """
+    Check whether a request carries a valid ows_profile signature.
+
+    :param cfg: The OWSConfig object
+    :param args: The request parameters (with lower-case names)
+    """
+    signature = args.get("ows_profile")
+    if not signature or not cfg.profile_secret:
+        return False
+    try:
+        expires = int(args.get(EXPIRES_ARG, ""))
+    except ValueError:
+        _LOG.warning("Ignoring ows_profile parameter without a valid %s parameter", EXPIRES_ARG)
+        return False
+    if not hmac.compare_digest(signature, profile_signature(cfg.profile_secret, args, expires)):
+        _LOG.warning("Ignoring ows_profile parameter with invalid signature")
+        return False
+    if expires < time():
+        _LOG.warning("Ignoring ows_profile parameter with expired signature")
+        return False
+    return True
+
+
+def sampled_request(cfg) -> bool:
+    """
+    Randomly select a request for profiling, at the configured sample rate.
+
+    :param cfg: The OWSConfig object
+    """
+    return bool(cfg.profile_dir) and cfg.profile_sample_rate > 0 and random.random() < cfg.profile_sample_rate
+
+
+def cprofile_active() -> bool:
+    """
+    True if the current request is being run under the cProfile profiler.
+
+    cProfile only profiles the calling thread, so work that should appear in the profile
+    must not be handed off to worker threads.
+    """
+    return has_app_context() and bool(g.get("ows_cprofile"))
+
+
+def profile_filename(args: Mapping[str, str]) -> str:
+    operation = args.get("request", "none").lower()
+    layer = (args.get("query_layers") or args.get("layers") or args.get("layer")
+             or args.get("coverage") or args.get("coverageid") or "none")
+    # Layer names are restricted to safe characters in the config, but the request parameter is not.
+    layer = "".join(c if c.isalnum() or c in "-_" else "_" for c in layer)[:64]
+    return f"{strftime('%Y%m%dT%H%M%S')}-{operation}-{layer}-{os.getpid()}-{uuid.uuid4().hex[:8]}.prof"
+
+
+def profile_summary(profiler: cProfile.Profile) -> str:
+    """
+    A plain text summary of a profile: the functions with the highest cumulative time.
+    """
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(SUMMARY_LENGTH)
+    return out.getvalue()
+
+
+def profiled_request(view: Callable) -> Callable:
+    """
+    Decorator for Flask views that profiles signed or sampled requests.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            cfg = get_config()
+        except Exception:  # pylint: disable=broad-except
+            return view(*args, **kwargs)
+        req_args = lower_get_args()
+        signed = signed_profile_request(cfg, req_args)
+        if not signed and not sampled_request(cfg):
+            return view(*args, **kwargs)
+        if not _profiler_lock.acquire(blocking=False):
+            _LOG.info("Another request is being profiled - not profiling request")
+            return view(*args, **kwargs)
+        try:
+            profiler = cProfile.Profile()
+            g.ows_cprofile = True
+            profiler.enable()
+            try:
+                response = view(*args, **kwargs)
+            finally:
+                profiler.disable()
+                g.pop("ows_cprofile", None)
+        finally:
+            _profiler_lock.release()
+        if cfg.profile_dir:
+            path = os.path.join(cfg.profile_dir, profile_filename(req_args))
+            try:
+                profiler.dump_stats(path)
+                _LOG.info("Request profile saved to %s", path)
+            except OSError as e:
+                _LOG.error("Could not save request profile to %s: %s", path, str(e))
+        if signed and req_args.get("ows_profile_return", "").lower() in ("y", "t", "yes", "true", "1"):
+            return (profile_summary(profiler), 200, cfg.response_headers({"Content-Type": "text/plain"}))
+        return response
+    return wrapper
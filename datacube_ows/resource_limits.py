@@ -227,6 +227,7 @@ class OWSResourceManagementRules(OWSConfigEntry):
         self.min_zoom = cast(Optional[float], wms_cfg.get("min_zoom_factor"))
         self.min_zoom_lvl = cast(Optional[Union[int, float]], wms_cfg.get("min_zoom_level"))
         self.max_datasets_wms = cast(int, wms_cfg.get("max_datasets", 0))
+        self.max_datasets_time_series = cast(int, wms_cfg.get("max_time_series_datasets", 0))
         self.max_datasets_wcs = cast(int, wcs_cfg.get("max_datasets", 0))
         self.max_image_size_wcs = cast(int, wcs_cfg.get("max_image_size", 0))
         self.wms_cache_rules = CacheControlRules(wms_cfg.get("dataset_cache_rules"), context, self.max_datasets_wms)
@@ -260,6 +261,18 @@ class OWSResourceManagementRules(OWSConfigEntry):
         if limits_exceeded:
             raise ResourceLimited(limits_exceeded)
 
+    def check_time_series(self, n_datasets: int) -> None:
+        """
+        Check whether a WMS GetTimeSeries request exceeds the configured resource limits.
+
+        :param n_datasets: The number of datasets for the query
+        :raises: ResourceLimited if any limits are exceeded.
+        """
+        if self.max_datasets_time_series > 0 and n_datasets > self.max_datasets_time_series:
+            raise ResourceLimited([
+                f"too many datasets ({n_datasets}: maximum={self.max_datasets_time_series})"
+            ])
+
     def check_wcs(self, n_datasets: int,
                   height: int, width: int,
                   pixel_size: int,
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Pre-render (seed) tiles into the server-side tile cache.
+
+Tiles are rendered in-process (without the HTTP stack) across a pool of worker processes,
+and written directly into the tile cache configured by $OWS_TILE_CACHE.  Tiles with no
+matching datasets are skipped after a single COUNT query.
+"""
+import logging
+import multiprocessing
+import os
+import sys
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from time import monotonic
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import click
+from datacube.utils import geometry
+
+from datacube_ows import __version__
+from datacube_ows.cube_pool import cube
+from datacube_ows.data import DataStacker
+from datacube_ows.mv_index import MVSelectOpts
+from datacube_ows.ogc_exceptions import OGCException
+from datacube_ows.ows_configuration import get_config
+from datacube_ows.startup_utils import initialise_debugging
+from datacube_ows.tile_cache import (get_tile_cache, store_tile, tile_key,
+                                     tile_time)
+from datacube_ows.wms_utils import GetMapParameters
+from datacube_ows.wmts import render_tile, tile_coords, wmts_args_to_wms
+
+_LOG = logging.getLogger(__name__)
+
+# Number of tiles sent to a worker process at a time.
+BATCH_SIZE = 32
+
+# Seconds between progress reports.
+REPORT_INTERVAL = 10.0
+
+# Tile seeding outcomes
+RENDERED = "rendered"
+CACHED = "cached"
+EMPTY = "empty"
+UNCACHEABLE = "uncacheable"
+ERROR = "error"
+
+
+class SeedTile(NamedTuple):
+    layer: str
+    style: str
+    tile_matrix_set: str
+    tile_matrix: int
+    row: int
+    col: int
+    time: str
+
+    def wmts_args(self):
+        return {
+            "layer": self.layer,
+            "style": self.style,
+            "tilematrixset": self.tile_matrix_set,
+            "tilematrix": str(self.tile_matrix),
+            "tilerow": str(self.row),
+            "tilecol": str(self.col),
+            "time": self.time,
+            "format": "image/png",
+            "requestid": "seed",
+        }
+
+
+def parse_zoom_levels(zoom: str, tms) -> range:
+    """
+    Parse a zoom level ("3") or inclusive range of zoom levels ("0-8") for a tile matrix set.
+    """
+    try:
+        if "-" in zoom:
+            low, high = (int(z) for z in zoom.split("-", 1))
+        else:
+            low = high = int(zoom)
+    except ValueError:
+        raise click.BadParameter(f"Invalid zoom level or range: {zoom}")
+    if low < 0 or high >= len(tms.scale_set) or low > high:
+        raise click.BadParameter(
+            f"Zoom levels must be between 0 and {len(tms.scale_set) - 1} for tile matrix set {tms.identifier}"
+        )
+    return range(low, high + 1)
+
+
+def seed_extent(layer, tms, bbox: Optional[str], bbox_crs: str) -> Optional[Tuple[float, float, float, float]]:
+    """
+    The extent to seed (left, bottom, right, top), in the CRS of the tile matrix set.
+
+    :param layer: The OWSNamedLayer
+    :param tms: The TileMatrixSet
+    :param bbox: A user-supplied bounding box ("minx,miny,maxx,maxy"), or None to use the layer extent
+    :param bbox_crs: The CRS of the user-supplied bounding box
+    :return: The extent, or None if the layer has no extent.
+    """
+    if bbox:
+        try:
+            left, bottom, right, top = (float(c) for c in bbox.split(","))
+        except ValueError:
+            raise click.BadParameter(f"Invalid bounding box: {bbox}")
+        geom = geometry.box(left, bottom, right, top, geometry.CRS(bbox_crs))
+    elif tms.crs_name in layer.bboxes:
+        lbbox = layer.bboxes[tms.crs_name]
+        return lbbox["left"], lbbox["bottom"], lbbox["right"], lbbox["top"]
+    elif layer.bboxes:
+        crs_id, lbbox = next(iter(layer.bboxes.items()))
+        geom = geometry.box(lbbox["left"], lbbox["bottom"], lbbox["right"], lbbox["top"], geometry.CRS(crs_id))
+    else:
+        return None
+    return tuple(geom.to_crs(tms.crs_name).boundingbox)
+
+
+def seed_tiles_for_layer(layer, styles: Iterable[str], tms, zoom_levels: Iterable[int],
+                         extent: Tuple[float, float, float, float], times: Iterable[str]) -> Iterator[SeedTile]:
+    for tile_matrix in zoom_levels:
+        tiles = tms.tile_range(tile_matrix, *extent)
+        if tiles is None:
+            continue
+        min_row, max_row, min_col, max_col = tiles
+        # Tiles are generated metatile by metatile, so the tiles of a metatile are usually
+        # seeded by the same worker, from the cache after the first tile renders the metatile.
+        step = tms.metatile_size
+        for t in times:
+            for style in styles:
+                for meta_row in range(min_row - min_row % step, max_row + 1, step):
+                    for meta_col in range(min_col - min_col % step, max_col + 1, step):
+                        for row in range(max(meta_row, min_row), min(meta_row + step, max_row + 1)):
+                            for col in range(max(meta_col, min_col), min(meta_col + step, max_col + 1)):
+                                yield SeedTile(layer.name, style, tms.identifier, tile_matrix, row, col, t)
+
+
+def batched(iterable: Iterable[SeedTile], size: int) -> Iterator[List[SeedTile]]:
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def init_worker() -> None:
+    # Load the configuration and open the tile cache once per worker process.
+    get_tile_cache(get_config())
+
+
+def seed_tile(cfg, cache, tile: SeedTile, force: bool = False, forced_metatiles: Optional[set] = None) -> str:
+    """
+    Render a single tile and write it to the tile cache.
+
+    :param force: Re-render the tile even if it is already cached
+    :param forced_metatiles: If forcing, the metatiles already re-rendered (updated by this function),
+            so the other tiles of a metatile are not re-rendered again.
+    :return: The outcome (RENDERED, CACHED, EMPTY, UNCACHEABLE or ERROR)
+    """
+    wmts_args = tile.wmts_args()
+    try:
+        wms_args = wmts_args_to_wms(wmts_args, cfg)
+        tms, tile_matrix, row, col = tile_coords(wmts_args, cfg)
+        layer = cfg.product_index[tile.layer]
+        key = tile_key(layer, tile.style, tms, tile_matrix, row, col, tile.time, wms_args["format"])
+        if force and forced_metatiles is not None:
+            metatile = (key._replace(row=0, col=0), tms.metatile_range(tile_matrix, row, col))
+            if metatile in forced_metatiles:
+                force = False
+            else:
+                forced_metatiles.add(metatile)
+        if not force and cache.get(key) is not None:
+            return CACHED
+        params = GetMapParameters(wms_args)
+        stacker = DataStacker(params.product, params.geobox, params.times, params.resampling, style=params.style)
+        with cube() as dc:
+            if stacker.datasets(dc.index, mode=MVSelectOpts.COUNT) == 0:
+                return EMPTY
+        if store_tile(cache, key, render_tile(cfg, tms, key, wms_args)):
+            return RENDERED
+        return UNCACHEABLE
+    except OGCException as e:
+        _LOG.warning("Could not seed tile %s: %s", str(tile), str(e))
+        return ERROR
+
+
+def seed_batch(batch: List[SeedTile], force: bool = False) -> Counter:
+    cfg = get_config()
+    cache = get_tile_cache(cfg)
+    forced_metatiles: set = set()
+    return Counter(seed_tile(cfg, cache, tile, force, forced_metatiles) for tile in batch)
+
+
+class SeedProgress:
+    def __init__(self) -> None:
+        self.counts: Counter = Counter()
+        self.start = monotonic()
+        self.last_report = self.start
+
+    def update(self, counts: Counter) -> None:
+        self.counts.update(counts)
+        if monotonic() - self.last_report >= REPORT_INTERVAL:
+            self.report()
+
+    def report(self) -> None:
+        self.last_report = monotonic()
+        elapsed = self.last_report - self.start
+        total = sum(self.counts.values())
+        rendered = self.counts[RENDERED] + self.counts[UNCACHEABLE]
+        click.echo(
+            f"{total} tiles in {elapsed:.1f}s ({total / elapsed if elapsed else 0.0:.1f} tiles/s, "
+            f"{rendered / elapsed if elapsed else 0.0:.1f} rendered/s): "
+            f"{self.counts[RENDERED]} rendered, {self.counts[CACHED]} already cached, "
+            f"{self.counts[EMPTY]} empty, {self.counts[UNCACHEABLE]} uncacheable, {self.counts[ERROR]} errors"
+        )
+
+
+def run_seed(tiles: Iterable[SeedTile], jobs: int, force: bool = False) -> SeedProgress:
+    """
+    Seed tiles across a pool of worker processes.
+
+    Worker processes are spawned (not forked) so that they do not share the parent's
+    database connections, and only a bounded number of batches are queued at a time.
+    """
+    progress = SeedProgress()
+    batches = batched(tiles, BATCH_SIZE)
+    with ProcessPoolExecutor(max_workers=jobs,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_worker) as executor:
+        pending = set()
+        for batch in batches:
+            pending.add(executor.submit(seed_batch, batch, force))
+            if len(pending) >= jobs * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    progress.update(fut.result())
+        for fut in wait(pending).done:
+            progress.update(fut.result())
+    progress.report()
+    return progress
+
+
+@click.command()
+@click.option("-s", "--style", "styles", multiple=True,
+              help="Style to seed (may be repeated). Defaults to each layer's default style.")
+@click.option("-t", "--tile-matrix-set", default="WholeWorld_WebMercator", show_default=True,
+              help="Identifier of the tile matrix set to seed.")
+@click.option("-z", "--zoom", default="0-6", show_default=True,
+              help="Zoom level (tile matrix) or inclusive range of zoom levels, e.g. 3 or 0-8.")
+@click.option("-b", "--bbox", default=None,
+              help="Bounding box to seed, as minx,miny,maxx,maxy. Defaults to the extent of each layer.")
+@click.option("--bbox-crs", default="EPSG:4326", show_default=True, help="CRS of the --bbox option.")
+@click.option("-T", "--time", "times", multiple=True,
+              help="Time to seed (may be repeated). Defaults to the time served for requests without a time parameter (the latest time).")
+@click.option("-j", "--jobs", type=int, default=None,
+              help="Number of worker processes. Defaults to the number of CPUs.")
+@click.option("--force", is_flag=True, default=False, help="Re-render tiles that are already cached.")
+@click.option("--version", is_flag=True, default=False, help="Print version string and exit")
+@click.argument("layers", nargs=-1)
+def main(layers, styles, tile_matrix_set, zoom, bbox, bbox_crs, times, jobs, force, version):
+    """Pre-render tiles into the server-side tile cache.
+
+    Renders tiles for the specified LAYERS in the nominated tile matrix set, zoom levels,
+    bounding box, styles and times, and writes them to the tile cache configured by the
+    OWS_TILE_CACHE environment variable.  Tiles with no matching datasets are skipped.
+
+    Tiles are only cached for layers with WMS dataset_cache_rules, for the max-age allowed
+    by those rules.
+
+    Uses the DATACUBE_OWS_CFG environment variable to find the OWS config file.
+    """
+    if version:
+        print("Open Data Cube Open Web Services (datacube-ows) version",
+              __version__
+               )
+        sys.exit(0)
+    if not layers:
+        print("Sorry, no layers specified.")
+        sys.exit(1)
+
+    initialise_debugging()
+    cfg = get_config()
+    if get_tile_cache(cfg) is None:
+        print("Sorry, no tile cache configured.  Set the OWS_TILE_CACHE environment variable.")
+        sys.exit(1)
+    tms = cfg.tile_matrix_sets.get(tile_matrix_set)
+    if tms is None:
+        print(f"Sorry, unknown tile matrix set: {tile_matrix_set}")
+        sys.exit(1)
+    zoom_levels = parse_zoom_levels(zoom, tms)
+
+    def tiles():
+        for layer_name in layers:
+            layer = cfg.product_index.get(layer_name)
+            if layer is None:
+                click.echo(f"Skipping unknown layer: {layer_name}")
+                continue
+            if not layer.resource_limits.wms_cache_rules.use_caching:
+                click.echo(f"Skipping layer {layer_name}: no dataset_cache_rules, tiles cannot be cached")
+                continue
+            extent = seed_extent(layer, tms, bbox, bbox_crs)
+            if extent is None:
+                click.echo(f"Skipping layer {layer_name}: no extent (run datacube-ows-update?)")
+                continue
+            layer_styles = styles or (layer.default_style.name,)
+            # Seed the tiles served for requests without a time parameter by default
+            layer_times = times or (tile_time(layer, None),)
+            yield from seed_tiles_for_layer(layer, layer_styles, tms, zoom_levels, extent, layer_times)
+
+    progress = run_seed(tiles(), jobs or os.cpu_count() or 1, force)
+    if progress.counts[ERROR]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
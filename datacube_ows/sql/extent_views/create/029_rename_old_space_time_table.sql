@@ -0,0 +1,9 @@
+-- Renaming old incrementally maintained spacetime table, if any (OWS down)
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = 'space_time_view') THEN
+    ALTER TABLE space_time_view RENAME TO space_time_view_old_table;
+  END IF;
+END
+$$
@@ -0,0 +1,3 @@
+-- Dropping OLD incrementally maintained spacetime table (and indexes)
+
+DROP TABLE IF EXISTS space_time_view_old_table
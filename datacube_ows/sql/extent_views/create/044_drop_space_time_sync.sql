@@ -0,0 +1,3 @@
+-- Dropping spacetime table high-water marks
+
+DROP TABLE IF EXISTS space_time_view_sync
@@ -0,0 +1,3 @@
+-- Dropping spacetime table extraction function
+
+DROP FUNCTION IF EXISTS space_time_extract(timestamp with time zone)
@@ -0,0 +1,143 @@
+-- Creating space-time extraction function
+
+-- Extracts the space-time extents of (unarchived) datasets added after "since",
+-- using the same rules as the materialised views (eo, eo3 and landsat scene metadata)
+
+CREATE OR REPLACE FUNCTION space_time_extract(since timestamp with time zone)
+RETURNS TABLE (id uuid, dataset_type_ref smallint, spatial_extent geometry, temporal_extent tstzrange)
+LANGUAGE sql STABLE
+AS $$
+with
+-- Crib metadata to use as for string matching various types
+metadata_lookup as (
+  select id,name from agdc.metadata_type
+),
+new_datasets as (
+  select id, dataset_type_ref, metadata_type_ref, metadata
+  from agdc.dataset
+  where added > since
+  and archived is null
+),
+time_extents as (
+  -- This is the eodataset variant of the temporal extent (from/to variant)
+  select
+    dataset_type_ref, id,
+    case
+      when metadata -> 'extent' ->> 'from_dt' is null then
+        tstzrange(
+          (metadata -> 'extent' ->> 'center_dt') :: timestamp,
+          (metadata -> 'extent' ->> 'center_dt') :: timestamp,
+          '[]'
+        )
+      else
+        tstzrange(
+          (metadata -> 'extent' ->> 'from_dt') :: timestamp,
+          (metadata -> 'extent' ->> 'to_dt') :: timestamp,
+          '[]'
+        )
+    end as temporal_extent
+  from new_datasets where
+    metadata_type_ref in (select id from metadata_lookup where name in ('eo','eo_s2_nrt', 'gqa_eo','eo_plus'))
+  UNION
+  -- This is the eo3 variant of the temporal extent (singleton or start/end timestamps)
+  select
+    dataset_type_ref, id,tstzrange(
+      coalesce(metadata->'properties'->>'dtr:start_datetime', metadata->'properties'->>'datetime'):: timestamp,
+      coalesce((metadata->'properties'->>'dtr:end_datetime'):: timestamp,(metadata->'properties'->>'datetime'):: timestamp),
+      '[]'
+     ) as temporal_extent
+  from new_datasets where
+      metadata_type_ref in (select id from metadata_lookup where name like 'eo3%')
+),
+-- This is eo3 spatial
+eo3_ranges as
+(select id,
+  (metadata #>> '{extent, lat, begin}') as lat_begin,
+  (metadata #>> '{extent, lat, end}') as lat_end,
+  (metadata #>> '{extent, lon, begin}') as lon_begin,
+  (metadata #>> '{extent, lon, end}') as lon_end,
+  ST_Transform(
+    ST_SetSRID(
+      ST_GeomFromGeoJSON(
+        metadata #>> '{geometry}'),
+        substr(
+          metadata #>> '{crs}',6)::integer
+        ),
+        4326
+      ) as valid_geom
+   from new_datasets where
+      metadata_type_ref in (select id from metadata_lookup where name='eo3')
+      and upper(substr(metadata #>> '{crs}', 1, 5)) = 'EPSG:'
+  ),
+-- This is eo spatial
+eo_corners as
+(select id,
+  (metadata #>> '{extent, coord, ll, lat}') as ll_lat,
+  (metadata #>> '{extent, coord, ll, lon}') as ll_lon,
+  (metadata #>> '{extent, coord, lr, lat}') as lr_lat,
+  (metadata #>> '{extent, coord, lr, lon}') as lr_lon,
+  (metadata #>> '{extent, coord, ul, lat}') as ul_lat,
+  (metadata #>> '{extent, coord, ul, lon}') as ul_lon,
+  (metadata #>> '{extent, coord, ur, lat}') as ur_lat,
+  (metadata #>> '{extent, coord, ur, lon}') as ur_lon
+   from new_datasets
+   where metadata_type_ref in (select id from metadata_lookup where name in ('eo','eo_s2_nrt','gqa_eo','eo_plus', 'boku'))
+   and (metadata #>> '{grid_spatial, projection, valid_data}' is null
+       or
+        upper(substr(metadata #>> '{grid_spatial, projection, spatial_reference}', 1, 5)) <> 'EPSG:'
+   )
+),
+eo_geoms as
+(select id,
+  ST_Transform(
+    ST_SetSRID(
+      ST_GeomFromGeoJSON(
+        metadata #>> '{grid_spatial, projection, valid_data}'),
+        substr(
+          metadata #>> '{grid_spatial, projection, spatial_reference}',6)::integer
+        ),
+        4326
+      ) as valid_data
+   from new_datasets where
+        metadata_type_ref in (select id from metadata_lookup where name in ('eo','eo_s2_nrt','gqa_eo','eo_plus', 'boku'))
+        and metadata #>> '{grid_spatial, projection, valid_data}' is not null
+        and upper(substr(metadata #>> '{grid_spatial, projection, spatial_reference}', 1, 5)) = 'EPSG:'
+),
+space_extents as (
+  select id,format('POLYGON(( %s %s, %s %s, %s %s, %s %s, %s %s))',
+                   lon_begin, lat_begin, lon_end, lat_begin,  lon_end, lat_end,
+                   lon_begin, lat_end, lon_begin, lat_begin)::geometry
+  as spatial_extent
+  from eo3_ranges
+  where valid_geom is null
+  UNION
+  select id,valid_geom as spatial_extent
+  from eo3_ranges
+  where valid_geom is not null
+  UNION
+  select id,format('POLYGON(( %s %s, %s %s, %s %s, %s %s, %s %s))',
+                   ll_lon, ll_lat, lr_lon, lr_lat,  ur_lon, ur_lat,
+                   ul_lon, ul_lat, ll_lon, ll_lat)::geometry as spatial_extent
+  from eo_corners
+  UNION
+  select id, valid_data as spatial_extent
+  from eo_geoms
+  UNION
+  -- This is landsat_scene and landsat_l1_scene with geometries
+  select id,
+    ST_Transform(
+      ST_SetSRID(
+        ST_GeomFromGeoJSON(
+          metadata #>> '{geometry}'),
+          substr(
+            metadata #>> '{crs}',6)::integer
+          ),
+          4326
+        ) as spatial_extent
+   from new_datasets where
+          metadata_type_ref in (select id from metadata_lookup where name like 'eo3_%')
+          and upper(substr(metadata #>> '{grid_spatial, projection, spatial_reference}', 1, 5)) = 'EPSG:'
+)
+select space_extents.id, time_extents.dataset_type_ref, space_extents.spatial_extent, time_extents.temporal_extent
+from space_extents join time_extents on space_extents.id=time_extents.id
+$$
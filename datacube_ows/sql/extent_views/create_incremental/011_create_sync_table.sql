@@ -0,0 +1,10 @@
+-- Creating space-time table high-water mark table
+
+-- last_*: datasets added/archived up to these times have been applied to space_time_view
+-- next_*: the marks the refresh in progress will advance to
+CREATE TABLE IF NOT EXISTS space_time_view_sync (
+    last_added timestamp with time zone,
+    last_archived timestamp with time zone,
+    next_added timestamp with time zone,
+    next_archived timestamp with time zone
+)
@@ -0,0 +1,3 @@
+-- Clearing space-time table high-water marks
+
+DELETE FROM space_time_view_sync
@@ -0,0 +1,9 @@
+-- Initialising space-time table high-water marks (before extraction, so nothing is missed)
+
+INSERT INTO space_time_view_sync (last_added, last_archived, next_added, next_archived)
+SELECT
+    coalesce(max(added), '-infinity'),
+    coalesce(max(archived), '-infinity'),
+    coalesce(max(added), '-infinity'),
+    coalesce(max(archived), '-infinity')
+FROM agdc.dataset
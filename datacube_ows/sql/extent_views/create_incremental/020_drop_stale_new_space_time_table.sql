@@ -0,0 +1,3 @@
+-- Dropping NEW SPACE-TIME table left by an earlier failed run
+
+DROP TABLE IF EXISTS space_time_view_new
@@ -0,0 +1,8 @@
+-- Creating NEW SPACE-TIME table (start of hard work)
+
+CREATE TABLE space_time_view_new (
+    id uuid not null,
+    dataset_type_ref smallint not null,
+    spatial_extent geometry,
+    temporal_extent tstzrange
+)
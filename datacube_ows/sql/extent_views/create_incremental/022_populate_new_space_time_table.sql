@@ -0,0 +1,4 @@
+-- Populating NEW SPACE-TIME table (Slowest step!)
+
+INSERT INTO space_time_view_new
+SELECT * FROM space_time_extract('-infinity')
@@ -0,0 +1,11 @@
+-- Renaming old spacetime view or table (OWS down)
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = 'public' AND matviewname = 'space_time_view') THEN
+    ALTER MATERIALIZED VIEW space_time_view RENAME TO space_time_view_old;
+  ELSIF EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = 'space_time_view') THEN
+    ALTER TABLE space_time_view RENAME TO space_time_view_old;
+  END IF;
+END
+$$
@@ -0,0 +1,4 @@
+-- Renaming new table to space_time_view (OWS back up)
+
+ALTER TABLE space_time_view_new
+RENAME to space_time_view
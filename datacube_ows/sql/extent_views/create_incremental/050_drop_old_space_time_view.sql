@@ -0,0 +1,11 @@
+-- Dropping OLD spacetime view or table (and indexes)
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = 'public' AND matviewname = 'space_time_view_old') THEN
+    DROP MATERIALIZED VIEW space_time_view_old;
+  ELSE
+    DROP TABLE IF EXISTS space_time_view_old;
+  END IF;
+END
+$$
@@ -0,0 +1,3 @@
+-- Dropping OLD time view (not used by the space-time table)
+
+DROP MATERIALIZED VIEW IF EXISTS time_view
@@ -0,0 +1,3 @@
+-- Dropping OLD space view (not used by the space-time table)
+
+DROP MATERIALIZED VIEW IF EXISTS space_view
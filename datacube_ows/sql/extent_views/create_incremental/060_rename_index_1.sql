@@ -0,0 +1,4 @@
+-- Renaming NEW SPACE-TIME table Index 1/4
+
+ALTER INDEX space_time_view_geom_idx_new
+  RENAME TO space_time_view_geom_idx
@@ -0,0 +1,4 @@
+-- Renaming NEW SPACE-TIME table Index 3/4
+
+ALTER INDEX space_time_view_ds_idx_new
+  RENAME TO space_time_view_ds_idx
@@ -0,0 +1,4 @@
+-- Renaming NEW SPACE-TIME table Index 4/4
+
+ALTER INDEX space_time_view_idx_new
+  RENAME TO space_time_view_idx
@@ -0,0 +1,5 @@
+-- Recording new space-time table high-water marks
+
+UPDATE space_time_view_sync
+SET next_added = coalesce((SELECT max(added) FROM agdc.dataset), '-infinity'),
+    next_archived = coalesce((SELECT max(archived) FROM agdc.dataset), '-infinity')
@@ -0,0 +1,8 @@
+-- Removing newly archived datasets from space-time table
+
+-- Archive times are transaction start times: re-scan an hour before the high-water mark,
+-- to catch archiving transactions that committed after the last refresh.
+DELETE FROM space_time_view stv
+USING agdc.dataset ds, space_time_view_sync sync
+WHERE ds.id = stv.id
+AND ds.archived > sync.last_archived - interval '1 hour'
@@ -0,0 +1,7 @@
+-- Adding newly indexed datasets to space-time table
+
+-- Added times are transaction start times: re-scan an hour before the high-water mark,
+-- to catch indexing transactions that committed after the last refresh.
+INSERT INTO space_time_view
+SELECT * FROM space_time_extract((SELECT last_added - interval '1 hour' FROM space_time_view_sync))
+ON CONFLICT (id) DO NOTHING
@@ -0,0 +1,5 @@
+-- Advancing space-time table high-water marks
+
+UPDATE space_time_view_sync
+SET last_added = next_added,
+    last_archived = next_archived
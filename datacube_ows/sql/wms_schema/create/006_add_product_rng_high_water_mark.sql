@@ -0,0 +1,5 @@
+-- Adding high-water mark columns for incremental range updates
+
+alter table wms.product_ranges
+    add column if not exists max_added timestamp with time zone,
+    add column if not exists n_archived integer;
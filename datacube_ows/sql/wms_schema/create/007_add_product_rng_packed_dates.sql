@@ -0,0 +1,4 @@
+-- Adding packed dates column to product ranges table
+
+alter table wms.product_ranges
+    add column if not exists dates_packed bytea;
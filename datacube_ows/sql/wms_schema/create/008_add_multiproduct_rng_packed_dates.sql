@@ -0,0 +1,4 @@
+-- Adding packed dates column to multi-product ranges table
+
+alter table wms.multiproduct_ranges
+    add column if not exists dates_packed bytea;
@@ -12,6 +12,7 @@ from datacube.utils.aws import configure_s3_access
 from flask import Flask, request
 from rasterio.errors import NotGeoreferencedWarning
 
+from datacube_ows.config_snapshot import load_config_snapshot
 from datacube_ows.ows_configuration import get_config
 
 __all__ = [
@@ -172,7 +173,13 @@ def parse_config_file(log=None):
     # (unless deferring to first request)
     cfg = None
     if not os.environ.get("DEFER_CFG_PARSE"):
-        cfg = get_config()
+        snapshot = os.environ.get("DATACUBE_OWS_CFG_SNAPSHOT")
+        if snapshot:
+            cfg = load_config_snapshot(snapshot)
+            if log and cfg:
+                log.info("Configuration loaded from snapshot %s", snapshot)
+        if cfg is None:
+            cfg = get_config()
     return cfg
 
 
@@ -0,0 +1,556 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Server-side cache of rendered map tiles.
+
+Tiles are cached for WMTS GetTile requests, and for WMS GetMap requests that are exactly aligned
+with a tile in one of the configured tile matrix sets.  Tiles are keyed by layer, style, tile matrix
+set, tile matrix (zoom level), row, column, time, format and the layer's ranges version (which
+changes whenever update_ranges changes the layer's dates or extents).
+
+The cache is configured with the $OWS_TILE_CACHE environment variable:
+
+* file:///path/to/dir   - one file per tile in a local directory
+* sqlite:///path/to/file - a single SQLite (MBTiles-style) database file
+
+Caches are shared between worker processes and are limited in size by $OWS_TILE_CACHE_MAX_SIZE
+(in bytes).  When the limit is exceeded, the least recently used tiles are evicted.
+
+Tile caching is enabled per layer by the layer's WMS dataset_cache_rules: tiles are only cached
+for layers with dataset cache rules, and are kept for as long as those rules allow clients to
+cache them (i.e. for the max-age of the response).
+
+If a tile matrix set has a metatile_size greater than one, a cache miss renders the whole
+metatile (a block of metatile_size x metatile_size tiles) in a single pass, and the neighbouring
+tiles are added to the cache.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import timezone
+from io import BytesIO
+from time import monotonic, sleep, time
+from typing import Iterator, List, Mapping, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore[assignment]
+
+from dateutil.parser import parse
+from flask import has_request_context, request
+from PIL import Image
+from werkzeug.http import parse_etags
+
+from datacube_ows.ogc_utils import ConfigException
+from datacube_ows.utils import default_to_utc
+
+_LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+# Fraction of the maximum size to evict down to, so eviction does not run on every write.
+EVICT_TO = 0.9
+
+MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+# Maximum time to wait for another worker process to render a tile, and polling interval (seconds).
+LOCK_TIMEOUT = 60.0
+LOCK_POLL_INTERVAL = 0.05
+
+
+class TileKey(NamedTuple):
+    layer: str
+    style: str
+    tile_matrix_set: str
+    tile_matrix: int
+    row: int
+    col: int
+    time: str
+    format: str
+    ranges_version: str
+
+    def digest(self) -> str:
+        return hashlib.sha256(json.dumps(list(self)).encode("utf-8")).hexdigest()
+
+
+class CachedTile(NamedTuple):
+    body: bytes
+    headers: Mapping[str, str]
+    expires: float
+
+
+class TileCache:
+    """
+    Base class for tile cache storage backends.
+    """
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.max_size = max_size
+
+    def get(self, key: TileKey) -> Optional[CachedTile]:
+        """
+        Retrieve a cached tile.
+
+        :param key: The tile key
+        :return: The cached tile, or None if the tile is not cached (or has expired)
+        """
+        raise NotImplementedError()
+
+    def put(self, key: TileKey, tile: CachedTile) -> None:
+        """
+        Store a tile in the cache, evicting least recently used tiles if the cache is too large.
+        """
+        raise NotImplementedError()
+
+
+class FilesystemTileCache(TileCache):
+    """
+    Tile cache storing one file per tile in a local directory.
+
+    Each file contains a single line of JSON metadata (headers and expiry time), followed by
+    the tile image.  File modification times record the last access, for eviction.
+    """
+    def __init__(self, path: str, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        super().__init__(max_size)
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = None
+
+    def tile_path(self, key: TileKey) -> str:
+        digest = key.digest()
+        return os.path.join(self.path, digest[:2], digest + ".tile")
+
+    def get(self, key: TileKey) -> Optional[CachedTile]:
+        path = self.tile_path(key)
+        try:
+            with open(path, "rb") as fp:
+                meta = json.loads(fp.readline())
+                body = fp.read()
+        except (OSError, ValueError):
+            return None
+        if meta["expires"] < time():
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return CachedTile(body, meta["headers"], meta["expires"])
+
+    def put(self, key: TileKey, tile: CachedTile) -> None:
+        path = self.tile_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"headers": dict(tile.headers), "expires": tile.expires}).encode("utf-8") + b"\n" + tile.body
+        # Write atomically, so concurrent readers never see a partial tile.
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = self.disk_usage()
+            else:
+                self._size += len(data)
+            if self._size > self.max_size:
+                self._size = self.evict()
+
+    def tile_files(self) -> List[Tuple[float, int, str]]:
+        files = []
+        for dirpath, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if not filename.endswith(".tile"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def disk_usage(self) -> int:
+        return sum(size for _, size, _ in self.tile_files())
+
+    def evict(self) -> int:
+        """
+        Evict least recently used tiles until the cache is under the size limit.
+
+        The directory is re-scanned, as it may be shared with other processes.
+
+        :return: The cache size after eviction.
+        """
+        files = sorted(self.tile_files())
+        size = sum(f[1] for f in files)
+        target = self.max_size * EVICT_TO
+        for _, fsize, path in files:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= fsize
+        return size
+
+
+class SQLiteTileCache(TileCache):
+    """
+    Tile cache storing all tiles in a single SQLite database file.
+
+    The tiles table follows the MBTiles layout (zoom_level, tile_column, tile_row, tile_data),
+    with additional columns for the rest of the tile key, the response headers and cache
+    bookkeeping.  Each thread uses its own connection.
+    """
+    def __init__(self, path: str, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        super().__init__(max_size)
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._size = None
+        conn = self.conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tiles (
+                    tile_key TEXT PRIMARY KEY,
+                    layer TEXT, style TEXT, tile_matrix_set TEXT, time TEXT, format TEXT,
+                    zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,
+                    tile_data BLOB,
+                    headers TEXT,
+                    size INTEGER,
+                    expires REAL,
+                    accessed REAL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS tiles_accessed ON tiles (accessed)")
+
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: TileKey) -> Optional[CachedTile]:
+        conn = self.conn()
+        digest = key.digest()
+        row = conn.execute("SELECT tile_data, headers, expires FROM tiles WHERE tile_key = ?",
+                           (digest,)).fetchone()
+        if row is None or row[2] < time():
+            return None
+        with conn:
+            conn.execute("UPDATE tiles SET accessed = ? WHERE tile_key = ?", (time(), digest))
+        return CachedTile(bytes(row[0]), json.loads(row[1]), row[2])
+
+    def put(self, key: TileKey, tile: CachedTile) -> None:
+        conn = self.conn()
+        now = time()
+        with conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO tiles
+                    (tile_key, layer, style, tile_matrix_set, time, format,
+                     zoom_level, tile_column, tile_row, tile_data, headers, size, expires, accessed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                         (key.digest(), key.layer, key.style, key.tile_matrix_set, key.time, key.format,
+                          key.tile_matrix, key.col, key.row,
+                          sqlite3.Binary(tile.body), json.dumps(dict(tile.headers)), len(tile.body),
+                          tile.expires, now))
+        # The size is tracked approximately, and recalculated before evicting, as the
+        # database may be shared with other processes.
+        with self._lock:
+            if self._size is None:
+                self._size = self.disk_usage(conn)
+            else:
+                self._size += len(tile.body)
+            if self._size > self.max_size:
+                with conn:
+                    self._size = self.evict(conn)
+
+    def disk_usage(self, conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT coalesce(sum(size), 0) FROM tiles").fetchone()[0]
+
+    def evict(self, conn: sqlite3.Connection) -> int:
+        """
+        Evict expired tiles, then least recently used tiles until the cache is under the size limit.
+
+        :return: The cache size after eviction.
+        """
+        target = self.max_size * EVICT_TO
+        # Expired tiles first, then least recently used.
+        conn.execute("DELETE FROM tiles WHERE expires < ?", (time(),))
+        size = self.disk_usage(conn)
+        for digest, tsize in conn.execute("SELECT tile_key, size FROM tiles ORDER BY accessed").fetchall():
+            if size <= target:
+                break
+            conn.execute("DELETE FROM tiles WHERE tile_key = ?", (digest,))
+            size -= tsize
+        return size
+
+
+def create_tile_cache(url: str, max_size: int = DEFAULT_MAX_SIZE) -> TileCache:
+    """
+    Create a tile cache from a URL.
+
+    :param url: file:///path/to/dir or sqlite:///path/to/file
+    :param max_size: The maximum size of the cache, in bytes
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return FilesystemTileCache(parsed.path, max_size)
+    if parsed.scheme == "sqlite":
+        return SQLiteTileCache(parsed.path, max_size)
+    raise ConfigException(f"Unsupported tile cache URL (must be file:// or sqlite://): {url}")
+
+
+_tile_cache: Optional[TileCache] = None
+_tile_cache_pid: Optional[int] = None
+_tile_cache_lock = threading.Lock()
+
+
+def get_tile_cache(cfg) -> Optional[TileCache]:
+    """
+    Get the tile cache for this process (created on first use).
+
+    :param cfg: The global OWSConfig object
+    :return: The tile cache, or None if tile caching is not configured.
+    """
+    global _tile_cache, _tile_cache_pid  # pylint: disable=global-statement
+    if not cfg.tile_cache_url:
+        return None
+    if _tile_cache is not None and _tile_cache_pid == os.getpid():
+        return _tile_cache
+    with _tile_cache_lock:
+        if _tile_cache is None or _tile_cache_pid != os.getpid():
+            _tile_cache = create_tile_cache(cfg.tile_cache_url, cfg.tile_cache_max_size)
+            _tile_cache_pid = os.getpid()
+        return _tile_cache
+
+
+def response_max_age(headers: Mapping[str, str]) -> int:
+    """
+    The max-age of a response, from its cache-control header (0 if not cacheable).
+    """
+    for hdr, val in headers.items():
+        if hdr.lower() == "cache-control":
+            m = MAX_AGE_RE.search(val)
+            if m:
+                return int(m.group(1))
+    return 0
+
+
+def aligned_tile(cfg, args) -> Optional[Tuple["datacube_ows.tile_matrix_sets.TileMatrixSet", int, int, int]]:
+    """
+    Identify the tile matrix set tile exactly matching a WMS GetMap request, if any.
+
+    :param cfg: The global OWSConfig object
+    :param args: The (lower-cased) GetMap request arguments
+    :return: A tuple of (tile matrix set, tile matrix, row, col), or None if the request is not tile-aligned.
+    """
+    crs = args.get("crs", args.get("srs"))
+    try:
+        width = int(args.get("width", ""))
+        height = int(args.get("height", ""))
+        bbox = [float(c) for c in args.get("bbox", "").split(",")]
+    except ValueError:
+        return None
+    if len(bbox) != 4:
+        return None
+    for tms in cfg.tile_matrix_sets.values():
+        if tms.crs_name != crs or tuple(tms.tile_size) != (width, height):
+            continue
+        if tms.crs_cfg["vertical_coord_first"]:
+            x_min, y_min = bbox[1], bbox[2]
+        else:
+            x_min, y_min = bbox[0], bbox[3]
+        for tile_matrix, scale_denominator in enumerate(tms.scale_set):
+            tile_span = [scale_denominator * 0.00028 * u * ts for u, ts in zip(tms.unit_coefficients, tms.tile_size)]
+            col = round((x_min - tms.matrix_origin[0]) / tile_span[0])
+            row = round((y_min - tms.matrix_origin[1]) / tile_span[1])
+            tolerance = abs(tile_span[0]) * 1e-6
+            if all(abs(a - b) <= tolerance
+                   for a, b in zip(bbox, tms.wms_bbox_coords(tile_matrix, row, col))):
+                return tms, tile_matrix, row, col
+    return None
+
+
+def tile_time(layer, time_arg: Optional[str]) -> str:
+    """
+    Normalise the time parameter of a tile request, so equivalent requests share a cache key.
+
+    An empty time is resolved to the time rendered for requests without a time parameter (the latest
+    available time), and single dates (or datetimes, for sub-day layers) are converted to ISO format.
+    Lists and ranges of times are left unchanged.
+
+    :param layer: The OWSNamedLayer
+    :param time_arg: The time parameter of the request (may be None or empty)
+    :return: The normalised time string
+    """
+    if not time_arg:
+        times = layer.time_index
+        if not len(times):
+            return ""
+        return times[-1].isoformat()
+    if "," in time_arg or "/" in time_arg:
+        return time_arg
+    try:
+        parsed = parse(time_arg)
+    except (ValueError, OverflowError):
+        return time_arg
+    if layer.time_resolution.is_subday():
+        return default_to_utc(parsed).astimezone(timezone.utc).isoformat()
+    return parsed.date().isoformat()
+
+
+def tile_key(layer, style_name: Optional[str], tms, tile_matrix: int, row: int, col: int,
+             time_arg: Optional[str], format_: Optional[str]) -> TileKey:
+    if not style_name:
+        style_name = layer.default_style.name
+    return TileKey(layer.name, style_name, tms.identifier, tile_matrix, row, col,
+                   tile_time(layer, time_arg), format_ or "", layer.ranges_version or "")
+
+
+def cached_tile_response(cfg, layer, key: TileKey, render):
+    """
+    Return a tile from the tile cache, or render it and add it to the cache.
+
+    :param cfg: The global OWSConfig object
+    :param layer: The OWSNamedLayer
+    :param key: The TileKey of the requested tile
+    :param render: A callable that renders the tile, returning a Flask response tuple
+    :return: A Flask response tuple
+    """
+    cache = get_tile_cache(cfg)
+    if cache is None or not layer.resource_limits.wms_cache_rules.use_caching:
+        return render()
+    tile = read_tile(cache, key)
+    if tile is not None:
+        return tile_response(tile)
+    with tile_lock(cfg.request_lock_dir, key):
+        if cfg.request_lock_dir:
+            # Another worker process may have rendered the tile while we waited for the lock.
+            tile = read_tile(cache, key)
+            if tile is not None:
+                return tile_response(tile)
+        resp = render()
+        store_tile(cache, key, resp)
+    return resp
+
+
+def read_tile(cache: TileCache, key: TileKey) -> Optional[CachedTile]:
+    try:
+        return cache.get(key)
+    except Exception as e:  # pylint: disable=broad-except
+        _LOG.warning("Tile cache read failed: %s", str(e))
+        return None
+
+
+def tile_response(tile: CachedTile):
+    etag = tile.headers.get("ETag")
+    if etag and has_request_context() \
+            and parse_etags(request.headers.get("If-None-Match")).contains_weak(etag.strip('"')):
+        return ("", 304, tile.headers)
+    return (tile.body, 200, tile.headers)
+
+
+@contextmanager
+def tile_lock(lock_dir: Optional[str], key: TileKey, timeout: float = LOCK_TIMEOUT) -> Iterator[None]:
+    """
+    Hold an exclusive lock file for a tile, so that only one worker process renders it at a time.
+
+    Waits at most timeout seconds for the lock, then proceeds without it.  Does nothing if
+    lock_dir is not set (or file locking is not supported on this platform).
+
+    :param lock_dir: The directory for lock files (shared by all worker processes)
+    :param key: The TileKey of the tile
+    :param timeout: The maximum time to wait for the lock, in seconds
+    """
+    if not lock_dir or fcntl is None:
+        yield
+        return
+    path = os.path.join(lock_dir, key.digest() + ".lock")
+    deadline = monotonic() + timeout
+    fd = None
+    while True:
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            fd = None
+            if monotonic() >= deadline:
+                _LOG.warning("Timed out waiting for tile lock %s", path)
+                break
+            sleep(LOCK_POLL_INTERVAL)
+            continue
+        # The previous holder removes the lock file on release - check we locked the current file.
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+        fd = None
+    try:
+        yield
+    finally:
+        if fd is not None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            os.close(fd)
+
+
+def store_tile(cache: TileCache, key: TileKey, resp) -> bool:
+    """
+    Store a rendered tile in the tile cache, if the response is cacheable.
+
+    :param cache: The tile cache
+    :param key: The TileKey of the tile
+    :param resp: The Flask response tuple of the rendered tile
+    :return: True if the tile was stored
+    """
+    body, status, headers = resp
+    if status != 200:
+        return False
+    max_age = response_max_age(headers)
+    if max_age <= 0:
+        return False
+    try:
+        cache.put(key, CachedTile(body, headers, time() + max_age))
+    except Exception as e:  # pylint: disable=broad-except
+        _LOG.warning("Tile cache write failed: %s", str(e))
+        return False
+    return True
+
+
+def split_metatile(body: bytes, n_rows: int, n_cols: int, tile_size: Tuple[int, int]) -> List[List[bytes]]:
+    """
+    Split a rendered PNG metatile into individual PNG tiles.
+
+    :param body: The PNG metatile
+    :param n_rows: The number of rows of tiles in the metatile
+    :param n_cols: The number of columns of tiles in the metatile
+    :param tile_size: The (width, height) of a tile, in pixels
+    :return: The PNG tiles, by row then column
+    """
+    width, height = tile_size
+    with Image.open(BytesIO(body)) as img:
+        img.load()
+        tiles = []
+        for r in range(n_rows):
+            tile_row = []
+            for c in range(n_cols):
+                out = BytesIO()
+                img.crop((c * width, r * height, (c + 1) * width, (r + 1) * height)).save(out, format="PNG")
+                tile_row.append(out.getvalue())
+            tiles.append(tile_row)
+    return tiles
@@ -3,6 +3,8 @@
 #
 # Copyright (c) 2017-2023 OWS Contributors
 # SPDX-License-Identifier: Apache-2.0
+import math
+
 from datacube_ows.config_utils import OWSConfigEntry
 from datacube_ows.ogc_utils import ConfigException
 
@@ -81,6 +83,9 @@ class TileMatrixSet(OWSConfigEntry):
         validate_2d_array(self.initial_matrix_exponents, identifier, "Initial matrix exponents", int)
         self.unit_coefficients = cfg.get("unit_coefficients", (1.0, -1.0))
         validate_2d_array(self.unit_coefficients, identifier, "Unit coefficients", float)
+        self.metatile_size = cfg.get("metatile_size", 1)
+        if not isinstance(self.metatile_size, int) or self.metatile_size < 1:
+            raise ConfigException(f"In tile matrix set {identifier}, metatile_size must be a positive integer")
 
     @property
     def crs_cfg(self):
@@ -107,6 +112,37 @@ class TileMatrixSet(OWSConfigEntry):
     def height_exponent(self, scale_no):
         return self.exponent(1, scale_no)
 
+    def matrix_size(self, tile_matrix):
+        # (width, height) of the tile matrix, in tiles
+        return 2 ** self.width_exponent(tile_matrix), 2 ** self.height_exponent(tile_matrix)
+
+    def tile_range(self, tile_matrix, left, bottom, right, top):
+        # Inclusive (min_row, max_row, min_col, max_col) of the tiles intersecting a bounding box
+        # in the CRS of the tile matrix set, clipped to the tile matrix.  None if no tiles intersect.
+        scale_denominator = self.scale_set[tile_matrix]
+        tile_span = [scale_denominator * 0.00028 * u * ts for u, ts in zip(self.unit_coefficients, self.tile_size)]
+        cols = sorted(((left - self.matrix_origin[0]) / tile_span[0], (right - self.matrix_origin[0]) / tile_span[0]))
+        rows = sorted(((top - self.matrix_origin[1]) / tile_span[1], (bottom - self.matrix_origin[1]) / tile_span[1]))
+        width, height = self.matrix_size(tile_matrix)
+        min_col = max(math.floor(cols[0]), 0)
+        max_col = min(math.ceil(cols[1]) - 1, width - 1)
+        min_row = max(math.floor(rows[0]), 0)
+        max_row = min(math.ceil(rows[1]) - 1, height - 1)
+        if min_col > max_col or min_row > max_row:
+            return None
+        return min_row, max_row, min_col, max_col
+
+    def metatile_range(self, tile_matrix, row, col):
+        # Inclusive (min_row, max_row, min_col, max_col) of the metatile containing a tile,
+        # clipped to the tile matrix.
+        width, height = self.matrix_size(tile_matrix)
+        min_row = row - row % self.metatile_size
+        min_col = col - col % self.metatile_size
+        return (
+            min_row, min(min_row + self.metatile_size, height) - 1,
+            min_col, min(min_col + self.metatile_size, width) - 1,
+        )
+
     def wms_bbox_coords(self, tile_matrix, row, col):
         # Convert WMTS params to coordinate window for WMS
         pixel = [col, row]
@@ -0,0 +1,158 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Compact, sorted storage of the available dates (or datetimes) of a layer.
+
+Dates are stored in the ranges tables both as a JSON list of ISO strings and packed as
+little-endian int64 microseconds since the Unix epoch (UTC).  The packed form is loaded
+directly into a sorted numpy datetime64 array, without parsing each date.
+"""
+import datetime
+from collections.abc import Sequence
+from typing import Any, Iterable, Iterator, Optional, Union, overload
+
+import numpy
+
+DateOrDatetime = Union[datetime.date, datetime.datetime]
+
+PACKED_DTYPE = numpy.dtype("<i8")
+
+
+class TimeIndex(Sequence):
+    """
+    An immutable, sorted sequence of the distinct dates of a layer, backed by a numpy datetime64 array.
+
+    Items are datetime.date objects, or timezone-aware (UTC) datetime.datetime objects for
+    sub-day resolution layers.  They are only converted to Python objects on access, and
+    membership tests and range lookups are binary searches.
+    """
+    def __init__(self, values: numpy.ndarray, subday: bool = False) -> None:
+        """
+        :param values: A sorted numpy array of distinct datetime64[us] (subday) or datetime64[D] values
+        :param subday: True for sub-day resolution layers
+        """
+        self.values = values
+        self.subday = subday
+
+    @classmethod
+    def from_dates(cls, dates: Iterable[DateOrDatetime], subday: bool = False) -> "TimeIndex":
+        """
+        Create a TimeIndex from (not necessarily sorted or distinct) dates or datetimes.
+        """
+        if subday:
+            values = numpy.array([_utc_naive(d) for d in dates], dtype="datetime64[us]")
+        else:
+            values = numpy.array(list(dates), dtype="datetime64[D]")
+        return cls(numpy.unique(values), subday)
+
+    @classmethod
+    def from_packed(cls, packed: Union[bytes, memoryview], subday: bool = False) -> "TimeIndex":
+        """
+        Create a TimeIndex from packed bytes, as returned by packed().
+        """
+        values = numpy.frombuffer(packed, dtype=PACKED_DTYPE).astype("datetime64[us]")
+        if not subday:
+            values = values.astype("datetime64[D]")
+        return cls(values, subday)
+
+    def packed(self) -> bytes:
+        """
+        The dates as little-endian int64 microseconds since the Unix epoch.
+        """
+        return self.values.astype("datetime64[us]").astype(PACKED_DTYPE).tobytes()
+
+    def _to_python(self, value: Any) -> DateOrDatetime:
+        if self.subday:
+            return value.replace(tzinfo=datetime.timezone.utc)
+        return value
+
+    def to_numpy(self, t: Any) -> Optional[numpy.datetime64]:
+        """
+        Convert a date or datetime to a value comparable with the index, or None if it is of the wrong type.
+
+        Sub-day indexes only contain timezone-aware datetimes, and other indexes only plain dates.
+        """
+        if self.subday:
+            if not isinstance(t, datetime.datetime) or t.tzinfo is None:
+                return None
+            return numpy.datetime64(_utc_naive(t), "us")
+        if not isinstance(t, datetime.date) or isinstance(t, datetime.datetime):
+            return None
+        return numpy.datetime64(t, "D")
+
+    def _bound(self, t: DateOrDatetime) -> numpy.datetime64:
+        # Range bounds are converted to the resolution of the index.  Naive datetimes are assumed to be UTC.
+        if self.subday:
+            if not isinstance(t, datetime.datetime):
+                t = datetime.datetime(t.year, t.month, t.day)
+            return numpy.datetime64(_utc_naive(t), "us")
+        if isinstance(t, datetime.datetime):
+            t = t.date()
+        return numpy.datetime64(t, "D")
+
+    def between(self, start: Optional[DateOrDatetime] = None,
+                end: Optional[DateOrDatetime] = None) -> "TimeIndex":
+        """
+        The times between start and end (inclusive), as a slice of the index.
+
+        :param start: The start of the range (or None for an open start)
+        :param end: The end of the range (or None for an open end)
+        :return: A TimeIndex (sharing the underlying array)
+        """
+        lo = 0 if start is None else int(numpy.searchsorted(self.values, self._bound(start), side="left"))
+        hi = len(self.values) if end is None else int(numpy.searchsorted(self.values, self._bound(end), side="right"))
+        return self[lo:max(lo, hi)]
+
+    def matches_second(self, dt: datetime.datetime) -> bool:
+        """
+        Check for a time in the same second as dt (i.e. using the sub-day second-rounding rules).
+
+        Equivalent to utils.find_matching_date.
+        """
+        start = dt.replace(microsecond=0)
+        return len(self.between(start, start + datetime.timedelta(microseconds=999999))) > 0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @overload
+    def __getitem__(self, idx: int) -> DateOrDatetime: ...
+
+    @overload
+    def __getitem__(self, idx: slice) -> "TimeIndex": ...
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return TimeIndex(self.values[idx], self.subday)
+        return self._to_python(self.values[idx].item())
+
+    def __iter__(self) -> Iterator[DateOrDatetime]:
+        for value in self.values.tolist():
+            yield self._to_python(value)
+
+    def __contains__(self, t: Any) -> bool:
+        value = self.to_numpy(t)
+        if value is None:
+            return False
+        i = numpy.searchsorted(self.values, value)
+        return bool(i < len(self.values) and self.values[i] == value)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, TimeIndex):
+            return self.subday == other.subday and numpy.array_equal(self.values, other.values)
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"TimeIndex({list(self)!r})"
+
+
+def _utc_naive(d: datetime.datetime) -> datetime.datetime:
+    # numpy datetime64 values are naive: convert timezone-aware datetimes to UTC.
+    if d.tzinfo is not None:
+        d = d.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return d
@@ -28,11 +28,13 @@ from datacube_ows.startup_utils import initialise_debugging
 @click.option("--schema", is_flag=True, default=False, help="Create or update the OWS database schema, including the spatio-temporal materialised views.")
 @click.option("--role", default=None, help="Role to grant database permissions to")
 @click.option("--merge-only/--no-merge-only", default=False, help="When used with a multiproduct layer, the ranges for underlying datacube products are not updated.")
+@click.option("-j", "--jobs", type=int, default=1, help="Number of ODC products to update concurrently, each in a separate process.")
+@click.option("--incremental", is_flag=True, default=False, help="With --schema: maintain an incrementally updated space-time table instead of materialised views.  With --views: only process datasets added or archived since the last refresh.  Otherwise: only merge datasets added since the last range update.")
 @click.option("--version", is_flag=True, default=False, help="Print version string and exit")
 @click.argument("layers", nargs=-1)
 def main(layers,
          merge_only,
-         schema, views, role, version):
+         schema, views, role, jobs, incremental, version):
     """Manage datacube-ows range tables.
 
     Valid invocations:
@@ -43,12 +45,28 @@ def main(layers,
     * update_ranges.py --views
         Refresh the materialised views
 
+    * update_ranges.py --schema --incremental --role myrole
+        As for --schema, but the space-time view is a regular table that is maintained
+        incrementally, rather than a materialised view.
+
+    * update_ranges.py --views --incremental
+        Incrementally update the space-time table with datasets added or archived since the last
+        refresh.  (The space-time table is always refreshed incrementally, if installed.)
+
     * One or more OWS or ODC layer names
         Update ranges for the specified LAYERS
 
     * No LAYERS (and neither the --views nor --schema options)
         (Update ranges for all configured OWS layers.
 
+    * --jobs N (with or without LAYERS)
+        Update the ranges of up to N ODC products concurrently.  Multi-product layers
+        are merged once all their underlying products have been updated.
+
+    * --incremental (with or without LAYERS)
+        Only merge the dates and extents of datasets added since the last range update.
+        Falls back to a full update of a product if any of its datasets have been archived.
+
     Uses the DATACUBE_OWS_CFG environment variable to find the OWS config file.
     """
     # --version
@@ -72,6 +90,9 @@ def main(layers,
     elif role and not schema:
         print("Sorry, role only makes sense for updating the schema")
         sys.exit(1)
+    elif jobs < 1:
+        print("Sorry, --jobs must be at least 1")
+        sys.exit(1)
 
     initialise_debugging()
 
@@ -81,13 +102,15 @@ def main(layers,
         print("Checking schema....")
         print("Creating or replacing WMS database schema...")
         create_schema(dc, role)
-        print("Creating or replacing materialised views...")
-        create_views(dc)
+        if incremental:
+            print("Creating or replacing incrementally maintained space-time table...")
+        else:
+            print("Creating or replacing materialised views...")
+        create_views(dc, incremental)
         print("Done")
         return 0
     elif views:
-        print("Refreshing materialised views...")
-        refresh_views(dc)
+        refresh_views(dc, incremental)
         print("Done")
         return 0
 
@@ -95,7 +118,7 @@ def main(layers,
     if not layers:
         layers = list(cfg.product_index.keys())
     try:
-        errors = add_ranges(dc, layers, merge_only)
+        errors = add_ranges(dc, layers, merge_only, jobs, incremental)
     except (psycopg2.errors.UndefinedColumn,
             sqlalchemy.exc.ProgrammingError) as e:
         print("ERROR: OWS schema or extent materialised views appear to be missing",
@@ -116,18 +139,42 @@ def main(layers,
     return 0
 
 
-def create_views(dc):
+def create_views(dc, incremental=False):
     try:
         from datacube.config import LocalConfig
         odc_cfg = LocalConfig.find()
         dbname = odc_cfg.get("db_database")
     except ImportError:
         dbname = os.environ.get("DB_DATABASE")
-    run_sql(dc, "extent_views/create", database=dbname)
+    if incremental:
+        run_sql(dc, "extent_views/create_incremental", database=dbname)
+    else:
+        run_sql(dc, "extent_views/create", database=dbname)
+
+
+def space_time_is_table(dc):
+    # True if the space-time view is an incrementally maintained table (rather than a materialised view)
+    conn = get_sqlconn(dc)
+    results = conn.execute(text("""
+        SELECT count(*)
+        FROM pg_tables
+        WHERE schemaname = 'public' AND tablename = 'space_time_view'
+    """))
+    is_table = list(results)[0][0] > 0
+    conn.close()
+    return is_table
 
 
-def refresh_views(dc):
-    run_sql(dc, "extent_views/refresh")
+def refresh_views(dc, incremental=False):
+    if space_time_is_table(dc):
+        print("Incrementally refreshing space-time table...")
+        run_sql(dc, "extent_views/refresh_incremental")
+    else:
+        if incremental:
+            print("Materialised views cannot be refreshed incrementally - "
+                  "run with '--schema --incremental' to switch to an incrementally maintained table")
+        print("Refreshing materialised views...")
+        run_sql(dc, "extent_views/refresh")
 
 
 def create_schema(dc, role):
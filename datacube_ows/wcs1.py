@@ -5,7 +5,10 @@
 # SPDX-License-Identifier: Apache-2.0
 from flask import render_template
 
+from datacube_ows.capabilities_cache import (cached_document,
+                                             capabilities_response)
 from datacube_ows.data import json_response
+from datacube_ows.etags import NotModified
 from datacube_ows.ogc_exceptions import WCS1Exception
 from datacube_ows.ogc_utils import cache_control_headers, get_service_base_url
 from datacube_ows.ows_configuration import get_config
@@ -33,7 +36,6 @@ def handle_wcs1(nocase_args):
 
 @log_call
 def get_capabilities(args):
-    # TODO: Handle updatesequence request parameter for cache consistency.
     section = args.get("section")
     if section:
         section = section.lower()
@@ -59,18 +61,20 @@ def get_capabilities(args):
     cfg = get_config()
     url = args.get('Host', args['url_root'])
     base_url = get_service_base_url(cfg.allowed_urls, url)
-    headers = cache_control_headers(cfg.wms_cap_cache_age)
-    headers["Content-Type"] = "application/xml"
-    return (
-        render_template("wcs_capabilities.xml",
-                        show_service=show_service,
-                        show_capability=show_capability,
-                        show_content_metadata=show_content_metadata,
-                        cfg=cfg,
-                        base_url=base_url),
-        200,
-        cfg.response_headers(headers)
-    )
+
+    def render(update_sequence):
+        return (
+            render_template("wcs_capabilities.xml",
+                            show_service=show_service,
+                            show_capability=show_capability,
+                            show_content_metadata=show_content_metadata,
+                            cfg=cfg,
+                            base_url=base_url,
+                            update_sequence=update_sequence),
+            "application/xml"
+        )
+    key = ("wcs", "1.0.0", base_url, show_service, show_capability, show_content_metadata)
+    return capabilities_response(cfg, args, key, render, WCS1Exception)
 
 
 @log_call
@@ -85,6 +89,7 @@ def desc_coverages(args):
         for c in coverages:
             p = cfg.product_index.get(c)
             if p and p.wcs:
+                p.ensure_ready()
                 products.append(p)
             else:
                 raise WCS1Exception("Invalid coverage: %s" % c,
@@ -92,15 +97,20 @@ def desc_coverages(args):
                                     locator="Coverage parameter")
     else:
         for p in cfg.product_index.values():
-            if p.ready and p.wcs:
+            if p.capabilities_ready and p.wcs:
+                p.ensure_ready()
                 products.append(p)
+
+    def render(update_sequence):
+        return render_template("wcs_desc_coverage.xml", cfg=cfg, products=products), "application/xml"
+
+    # Coverage descriptions list every available time, so are cached until the ranges are next updated.
+    doc = cached_document(cfg, ("wcs", "describecoverage", "1.0.0", tuple(p.name for p in products)), render)
     min_cache_age = min(p.resource_limits.wcs_desc_cache_rule for p in products)
     headers = cache_control_headers(min_cache_age)
-    headers["Content-Type"] = "application/xml"
+    headers["Content-Type"] = doc.content_type
     return (
-        render_template("wcs_desc_coverage.xml",
-                        cfg=cfg,
-                        products=products),
+        doc.body,
         200,
         cfg.response_headers(headers)
     )
@@ -110,8 +120,11 @@ def desc_coverages(args):
 def get_coverage(args):
     cfg = get_config()
     req = WCS1GetCoverageRequest(args)
-    qprof = QueryProfiler(req.ows_stats)
-    n_datasets, data = get_coverage_data(req, qprof)
+    qprof = QueryProfiler(req.ows_stats, "GetCoverage", req.product_name)
+    try:
+        n_datasets, data, etag = get_coverage_data(req, qprof)
+    except NotModified as e:
+        return e.response()
     if req.ows_stats:
         return json_response(qprof.profile())
     headers = {
@@ -119,11 +132,10 @@ def get_coverage(args):
         'content-disposition': 'attachment; filename=%s.%s' % (req.product_name, req.format.extension)
     }
     headers.update(req.product.resource_limits.wcs_cache_rules.cache_headers(n_datasets))
+    if etag:
+        headers["ETag"] = f'"{etag}"'
     return (
         req.format.renderer(req.version)(req, data),
         200,
-        cfg.response_headers({
-            "Content-Type": req.format.mime,
-            'content-disposition': 'attachment; filename=%s.%s' % (req.product_name, req.format.extension)
-        })
+        cfg.response_headers(headers)
     )
@@ -13,7 +13,8 @@ from ows.util import Version
 from rasterio import MemoryFile
 
 from datacube_ows.cube_pool import cube
-from datacube_ows.data import DataStacker
+from datacube_ows.data import DataStacker, etag_dataset_ids
+from datacube_ows.etags import check_not_modified, dataset_etag
 from datacube_ows.mv_index import MVSelectOpts
 from datacube_ows.ogc_exceptions import WCS1Exception
 from datacube_ows.ogc_utils import ConfigException
@@ -42,6 +43,7 @@ class WCS1GetCoverageRequest():
                                 WCS1Exception.COVERAGE_NOT_DEFINED,
                                 locator="COVERAGE parameter",
                                 valid_keys=list(cfg.product_index))
+        self.product.ensure_ready()
 
         # Argument: FORMAT (required) -> a supported format
         if "format" not in args:
@@ -148,7 +150,7 @@ class WCS1GetCoverageRequest():
                     continue
                 try:
                     time = parse(t).date()
-                    if time not in self.product.ranges["time_set"]:
+                    if time not in self.product.time_index:
                         raise WCS1Exception(
                             "Time value '%s' not a valid date for coverage %s" % (t, self.product_name),
                             WCS1Exception.INVALID_PARAMETER_VALUE,
@@ -313,6 +315,7 @@ def get_coverage_data(req, qprof):
                               req.geobox,
                               req.times,
                               bands=req.bands)
+        qprof["n_pixels"] = req.geobox.width * req.geobox.height
         qprof.start_event("count-datasets")
         n_datasets = stacker.datasets(dc.index, mode=MVSelectOpts.COUNT)
         qprof.end_event("count-datasets")
@@ -330,6 +333,7 @@ def get_coverage_data(req, qprof):
                     + "Please reduce the bounds of your request and try again.")
             stacker.resource_limited = True
             qprof["resource_limited"] = str(e)
+        etag = None
         if n_datasets == 0:
             # Return an empty coverage file with full metadata?
             qprof.start_event("build_empty_dataset")
@@ -384,11 +388,17 @@ def get_coverage_data(req, qprof):
             qprof.start_event("end_empty_dataset")
             qprof["write_action"] = "Write Empty"
 
-            return n_datasets, data
+            return n_datasets, data, etag
 
         qprof.start_event("fetch-datasets")
         datasets = stacker.datasets(index=dc.index)
         qprof.end_event("fetch-datasets")
+        ids_by_query = etag_dataset_ids(req.product, datasets, qprof)
+        if ids_by_query is not None:
+            etag = dataset_etag(req.product, None, req.args, ids_by_query, stacker.resource_limited)
+            headers = {"ETag": f'"{etag}"'}
+            headers.update(req.product.resource_limits.wcs_cache_rules.cache_headers(n_datasets))
+            check_not_modified(etag, get_config().response_headers(headers))
         if qprof.active:
             qprof["datasets"] = {str(q): ids for q, ids in stacker.datasets(dc.index, mode=MVSelectOpts.IDS).items()}
         qprof.start_event("load-data")
@@ -401,7 +411,7 @@ def get_coverage_data(req, qprof):
             if k not in sanitised_bands:
                 output = output.drop_vars([k])
         qprof["write_action"] = "Write Data"
-        return n_datasets, output
+        return n_datasets, output, etag
 
 
 def get_tiff(req, data):
@@ -16,7 +16,10 @@ from ows.wcs.v20.decoders import (kvp_decode_describe_coverage,
                                   kvp_decode_get_coverage)
 from ows.wcs.v21 import encoders as encoders_v21
 
+from datacube_ows.capabilities_cache import (cached_document,
+                                             capabilities_response)
 from datacube_ows.data import json_response
+from datacube_ows.etags import NotModified
 from datacube_ows.ogc_exceptions import WCS2Exception
 from datacube_ows.ogc_utils import (cache_control_headers,
                                     get_service_base_url, resp_headers)
@@ -79,74 +82,74 @@ def get_capabilities(args):
     if 'coveragesummary' in sections:
         include_coverage_summary = True
 
-    capabilities = ServiceCapabilities.with_defaults_v20(
-        service_url =base_url + '/wcs',
-        allowed_operations=[
-            'GetCapabilities', 'DescribeCoverage', 'GetCoverage'
-        ],
-        allow_post=False,
-        title=cfg.title,
-        abstract=cfg.abstract,
-        keywords=cfg.keywords,
-        fees=cfg.fees,
-        access_constraints=[cfg.access_constraints],
-        provider_name='',
-        provider_site='',
-        individual_name=cfg.contact_info.person,
-        organisation_name=cfg.contact_info.organisation,
-        position_name=cfg.contact_info.position,
-        phone_voice=cfg.contact_info.telephone,
-        phone_facsimile=cfg.contact_info.fax,
-        delivery_point=cfg.contact_info.address.address,
-        city=cfg.contact_info.address.city,
-        administrative_area=cfg.contact_info.address.state,
-        postal_code=cfg.contact_info.address.postcode,
-        country=cfg.contact_info.address.country,
-        electronic_mail_address=cfg.contact_info.email,
-        online_resource=base_url,
-        # hours_of_service=,
-        # contact_instructions=,
-        # role=,
-        coverage_summaries=[
-            CoverageSummary(
-                identifier=product.name,
-                coverage_subtype='RectifiedGridCoverage',
-                title=product.title,
-                wgs84_bbox=WGS84BoundingBox([
-                    product.ranges['lon']['min'], product.ranges['lat']['min'],
-                    product.ranges['lon']['max'], product.ranges['lat']['max'],
-                ])
-            )
-            for product in cfg.product_index.values()
-            if product.ready and not product.hide and product.wcs
-        ],
-        formats_supported=[
-            fmt.mime
-            for fmt in cfg.wcs_formats
-            if 2 in fmt.renderers
-        ],
-        crss_supported=[
-            crs  # TODO: conversion to URL format
-            for crs in cfg.published_CRSs
-        ],
-        interpolations_supported=None,  # TODO: find out interpolations
-    )
-    result = encoders_v20.xml_encode_capabilities(
-        capabilities,
-        include_service_identification=include_service_identification,
-        include_service_provider=include_service_provider,
-        include_operations_metadata=include_operations_metadata,
-        include_service_metadata=include_service_metadata,
-        include_coverage_summary=include_coverage_summary
-    )
+    def render(update_sequence):
+        capabilities = ServiceCapabilities.with_defaults_v20(
+            service_url =base_url + '/wcs',
+            allowed_operations=[
+                'GetCapabilities', 'DescribeCoverage', 'GetCoverage'
+            ],
+            allow_post=False,
+            title=cfg.title,
+            abstract=cfg.abstract,
+            keywords=cfg.keywords,
+            fees=cfg.fees,
+            access_constraints=[cfg.access_constraints],
+            provider_name='',
+            provider_site='',
+            individual_name=cfg.contact_info.person,
+            organisation_name=cfg.contact_info.organisation,
+            position_name=cfg.contact_info.position,
+            phone_voice=cfg.contact_info.telephone,
+            phone_facsimile=cfg.contact_info.fax,
+            delivery_point=cfg.contact_info.address.address,
+            city=cfg.contact_info.address.city,
+            administrative_area=cfg.contact_info.address.state,
+            postal_code=cfg.contact_info.address.postcode,
+            country=cfg.contact_info.address.country,
+            electronic_mail_address=cfg.contact_info.email,
+            online_resource=base_url,
+            # hours_of_service=,
+            # contact_instructions=,
+            # role=,
+            coverage_summaries=[
+                CoverageSummary(
+                    identifier=product.name,
+                    coverage_subtype='RectifiedGridCoverage',
+                    title=product.title,
+                    wgs84_bbox=WGS84BoundingBox([
+                        product.ranges['lon']['min'], product.ranges['lat']['min'],
+                        product.ranges['lon']['max'], product.ranges['lat']['max'],
+                    ])
+                )
+                for product in cfg.product_index.values()
+                if product.capabilities_ready and not product.hide and product.wcs
+            ],
+            formats_supported=[
+                fmt.mime
+                for fmt in cfg.wcs_formats
+                if 2 in fmt.renderers
+            ],
+            crss_supported=[
+                crs  # TODO: conversion to URL format
+                for crs in cfg.published_CRSs
+            ],
+            interpolations_supported=None,  # TODO: find out interpolations
+            update_sequence=update_sequence,
+        )
+        result = encoders_v20.xml_encode_capabilities(
+            capabilities,
+            include_service_identification=include_service_identification,
+            include_service_provider=include_service_provider,
+            include_operations_metadata=include_operations_metadata,
+            include_service_metadata=include_service_metadata,
+            include_coverage_summary=include_coverage_summary
+        )
+        return result.value, result.content_type
 
-    headers = cache_control_headers(cfg.wms_cap_cache_age)
-    headers["Content-Type"] = result.content_type
-    return (
-        result.value,
-        200,
-        cfg.response_headers(headers)
-    )
+    key = ("wcs", "2.0.1", base_url,
+           include_service_identification, include_service_provider, include_operations_metadata,
+           include_service_metadata, include_coverage_summary)
+    return capabilities_response(cfg, args, key, render, WCS2Exception)
 
 
 def create_coverage_description(cfg, product):
@@ -265,32 +268,39 @@ def desc_coverages(args):
     for coverage_id in request_obj.coverage_ids:
         product = cfg.product_index.get(coverage_id)
         if product and product.wcs:
+            product.ensure_ready()
             products.append(product)
         else:
             raise WCS2Exception("Invalid coverage: %s" % coverage_id,
                                 WCS2Exception.NO_SUCH_COVERAGE,
                                 locator=coverage_id)
 
-    coverage_descriptions = [
-        create_coverage_description(cfg, product)
-        for product in products
-    ]
-
     version = request_obj.version
 
     if version == (2, 0):
-        result = encoders_v20.xml_encode_coverage_descriptions(coverage_descriptions)
+        encode = encoders_v20.xml_encode_coverage_descriptions
     elif version == (2, 1):
-        result = encoders_v21.xml_encode_coverage_descriptions(coverage_descriptions)
+        encode = encoders_v21.xml_encode_coverage_descriptions
     else:
         raise WCS2Exception("Unsupported version: %s" % version,
                             WCS2Exception.INVALID_PARAMETER_VALUE,
                             locator="version")
+
+    def render(update_sequence):
+        result = encode([
+            create_coverage_description(cfg, product)
+            for product in products
+        ])
+        return result.value, result.content_type
+
+    # Coverage descriptions list every available time, so are cached until the ranges are next updated.
+    key = ("wcs", "describecoverage", version, tuple(product.name for product in products))
+    doc = cached_document(cfg, key, render)
     min_cache_age = min(p.resource_limits.wcs_desc_cache_rule for p in products)
     headers = cache_control_headers(min_cache_age)
-    headers["Content-Type"] = result.content_type
+    headers["Content-Type"] = doc.content_type
     return (
-        result.value,
+        doc.body,
         200,
         resp_headers(headers)
     )
@@ -299,8 +309,11 @@ def desc_coverages(args):
 @log_call
 def get_coverage(args, ows_stats=False, styles=None):
     request_obj = kvp_decode_get_coverage(args)
-    qprof = QueryProfiler(ows_stats)
-    output, headers = get_coverage_data(request_obj, styles, qprof)
+    qprof = QueryProfiler(ows_stats, "GetCoverage", request_obj.coverage_id)
+    try:
+        output, headers = get_coverage_data(request_obj, styles, qprof)
+    except NotModified as e:
+        return e.response()
     if ows_stats:
         return json_response(qprof.profile())
     return (
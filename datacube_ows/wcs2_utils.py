@@ -12,7 +12,8 @@ from ows.wcs.v20 import ScaleAxis, ScaleExtent, ScaleSize, Slice, Trim
 from rasterio import MemoryFile
 
 from datacube_ows.cube_pool import cube
-from datacube_ows.data import DataStacker
+from datacube_ows.data import DataStacker, etag_dataset_ids
+from datacube_ows.etags import check_not_modified, dataset_etag
 from datacube_ows.mv_index import MVSelectOpts
 from datacube_ows.ogc_exceptions import WCS2Exception
 from datacube_ows.ows_configuration import get_config
@@ -57,6 +58,7 @@ def get_coverage_data(request, styles, qprof):
                             WCS2Exception.NO_SUCH_COVERAGE,
                             locator="COVERAGE parameter",
                             valid_keys=list(cfg.product_index))
+    layer.ensure_ready()
 
     with cube() as dc:
         if not dc:
@@ -88,7 +90,7 @@ def get_coverage_data(request, styles, qprof):
         #
 
         scaler = WCSScaler(layer, subsetting_crs)
-        times = layer.ranges["times"]
+        times = layer.time_index
 
         subsets = request.subsets
 
@@ -125,16 +127,7 @@ def get_coverage_data(request, styles, qprof):
                     else:
                         low = parse(subset.low).date() if subset.low is not None else None
                         high = parse(subset.high).date() if subset.high is not None else None
-                    if low is not None:
-                        times = [
-                            time for time in times
-                            if time >= low
-                        ]
-                    if high is not None:
-                        times = [
-                            time for time in times
-                            if time <= high
-                        ]
+                    times = times.between(low, high)
                 elif isinstance(subset, Slice):
                     point = parse(subset.point).date()
                     times = [point]
@@ -261,6 +254,7 @@ def get_coverage_data(request, styles, qprof):
                               times,
                               bands=bands)
         qprof.end_event("setup")
+        qprof["n_pixels"] = scaler.size.x * scaler.size.y
         qprof.start_event("count-datasets")
         n_datasets = stacker.datasets(dc.index, mode=MVSelectOpts.COUNT)
         qprof.end_event("count-datasets")
@@ -288,6 +282,14 @@ def get_coverage_data(request, styles, qprof):
         qprof.start_event("fetch-datasets")
         datasets = stacker.datasets(dc.index)
         qprof.end_event("fetch-datasets")
+        etag = None
+        ids_by_query = etag_dataset_ids(layer, datasets, qprof)
+        if ids_by_query is not None:
+            etag = dataset_etag(layer, None, {"request": repr(request), "styles": styles},
+                                ids_by_query, stacker.resource_limited)
+            etag_headers = {"ETag": f'"{etag}"'}
+            etag_headers.update(layer.resource_limits.wcs_cache_rules.cache_headers(n_datasets))
+            check_not_modified(etag, cfg.response_headers(etag_headers))
         if qprof.active:
             qprof["datasets"] = {str(q): ids for q, ids in stacker.datasets(dc.index, mode=MVSelectOpts.IDS).items()}
 
@@ -316,6 +318,8 @@ def get_coverage_data(request, styles, qprof):
         'content-disposition': f'attachment; filename={request.coverage_id}.{fmt.extension}',
     }
     headers.update(layer.resource_limits.wcs_cache_rules.cache_headers(n_datasets))
+    if etag:
+        headers["ETag"] = f'"{etag}"'
     return output, headers
 
 
@@ -5,14 +5,22 @@
 # SPDX-License-Identifier: Apache-2.0
 from flask import render_template
 
-from datacube_ows.data import feature_info, get_map
+from datacube_ows.capabilities_cache import capabilities_response
+from datacube_ows.data import feature_info, get_map, time_series
 from datacube_ows.legend_generator import legend_graphic
 from datacube_ows.ogc_exceptions import WMSException
-from datacube_ows.ogc_utils import cache_control_headers, get_service_base_url
+from datacube_ows.ogc_utils import get_service_base_url
 from datacube_ows.ows_configuration import get_config
+from datacube_ows.request_coalescing import coalesced
+from datacube_ows.tile_cache import (aligned_tile, cached_tile_response,
+                                     get_tile_cache, tile_key)
 from datacube_ows.utils import log_call
+from datacube_ows.wmts import render_tile
 
-WMS_REQUESTS = ("GETMAP", "GETFEATUREINFO", "GETLEGENDGRAPHIC")
+WMS_REQUESTS = ("GETMAP", "GETFEATUREINFO", "GETTIMESERIES", "GETLEGENDGRAPHIC")
+
+# GetMap arguments that define an ad-hoc user band math style
+USER_STYLE_ARGS = ("code", "colorscheme", "colorscalerange")
 
 
 @log_call
@@ -24,9 +32,11 @@ def handle_wms(nocase_args):
     elif operation == "GETCAPABILITIES":
         return get_capabilities(nocase_args)
     elif operation == "GETMAP":
-        return get_map(nocase_args)
+        return coalesced(get_config(), nocase_args, get_tile_aligned_map)
     elif operation == "GETFEATUREINFO":
         return feature_info(nocase_args)
+    elif operation == "GETTIMESERIES":
+        return time_series(nocase_args)
     elif operation == "GETLEGENDGRAPHIC":
         return legend_graphic(nocase_args)
     else:
@@ -34,21 +44,43 @@ def handle_wms(nocase_args):
                            "Request parameter")
 
 
+def get_tile_aligned_map(args):
+    """
+    GetMap, served from the tile cache if the request is aligned with a tile matrix set tile.
+    """
+    cfg = get_config()
+    layers = args.get("layers", "").split(",")
+    if get_tile_cache(cfg) is None or len(layers) != 1 or args.get("ows_stats") \
+            or any(arg in args for arg in USER_STYLE_ARGS):
+        # User band math styles are not part of the tile cache key.
+        return get_map(args)
+    layer = cfg.product_index.get(layers[0])
+    if layer is None:
+        return get_map(args)
+    tile = aligned_tile(cfg, args)
+    if tile is None:
+        return get_map(args)
+    tms, tile_matrix, row, col = tile
+    key = tile_key(layer, args.get("styles"), tms, tile_matrix, row, col,
+                   args.get("time"), args.get("format"))
+    return cached_tile_response(cfg, layer, key, lambda: render_tile(cfg, tms, key, args))
+
+
 @log_call
 def get_capabilities(args):
-    # TODO: Handle updatesequence request parameter for cache consistency.
     # Note: Only WMS v1.3.0 is fully supported at this stage, so no version negotiation is necessary
     # Extract layer metadata from Datacube.
     cfg = get_config()
     url = args.get('Host', args['url_root'])
     base_url = get_service_base_url(cfg.allowed_urls, url)
-    headers = cache_control_headers(cfg.wms_cap_cache_age)
-    headers["Content-Type"] = "application/xml"
-    return (
-        render_template(
-            "wms_capabilities.xml",
-            cfg=cfg,
-            base_url=base_url),
-        200,
-        cfg.response_headers(headers)
-    )
+
+    def render(update_sequence):
+        return (
+            render_template(
+                "wms_capabilities.xml",
+                cfg=cfg,
+                base_url=base_url,
+                update_sequence=update_sequence),
+            "application/xml"
+        )
+    return capabilities_response(cfg, args, ("wms", "1.3.0", base_url), render, WMSException)
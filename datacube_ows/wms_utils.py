@@ -22,7 +22,7 @@ from datacube_ows.ows_configuration import get_config
 from datacube_ows.resource_limits import RequestScale
 from datacube_ows.styles import StyleDef
 from datacube_ows.styles.expression import ExpressionException
-from datacube_ows.utils import default_to_utc, find_matching_date
+from datacube_ows.utils import default_to_utc
 
 RESAMPLING_METHODS = {
     'nearest': Resampling.nearest,
@@ -140,6 +140,7 @@ def get_product_from_arg(args, argname="layers"):
                            WMSException.LAYER_NOT_DEFINED,
                            locator="Layer parameter",
                            valid_keys=list(cfg.product_index))
+    product.ensure_ready()
     return product
 
 
@@ -185,11 +186,9 @@ def parse_time_item(item, product):
     if len(times) > 1:
         # TODO WMS Time range selections (/ notation) are poorly and incompletely implemented.
         start, end = parse_wms_time_strings(times, with_tz=product.time_resolution.is_subday())
-        if product.time_resolution.is_subday():
-            matching_times = [t for t in product.ranges['times'] if start <= t <= end]
-        else:
+        if not product.time_resolution.is_subday():
             start, end = start.date(), end.date()
-            matching_times = [t for t in product.ranges['times'] if start <= t <= end]
+        matching_times = product.time_index.between(start, end)
         if matching_times:
             # default to the first matching time
             return matching_times[0]
@@ -236,13 +235,13 @@ def parse_time_item(item, product):
                 WMSException.INVALID_DIMENSION_VALUE,
                 locator="Time parameter")
     elif product.time_resolution.is_subday():
-        if not find_matching_date(time, product.ranges["times"]):
+        if not product.time_index.matches_second(default_to_utc(time)):
             raise WMSException(
                 "Time dimension value '%s' not valid for this layer" % times[0],
                 WMSException.INVALID_DIMENSION_VALUE,
                 locator="Time parameter")
     else:
-        if time not in product.ranges["time_set"]:
+        if time not in product.time_index:
             raise WMSException(
                 "Time dimension value '%s' not valid for this layer" % times[0],
                 WMSException.INVALID_DIMENSION_VALUE,
@@ -250,6 +249,34 @@ def parse_time_item(item, product):
     return time
 
 
+def get_time_series_times(args, product):
+    """
+    Resolve the time parameter of a time-series request to a sorted list of available layer times.
+
+    Accepts a comma separated list of single times and/or start/end ranges.  An empty time
+    parameter selects all available times for the layer.
+    """
+    times_raw = args.get('time', '')
+    if not times_raw:
+        return list(product.time_index)
+    times = set()
+    for item in times_raw.split(','):
+        parts = item.split('/')
+        if len(parts) == 1:
+            times.add(parse_time_item(item, product))
+            continue
+        start, end = parse_wms_time_strings(parts, with_tz=product.time_resolution.is_subday())
+        if not product.time_resolution.is_subday():
+            start, end = start.date(), end.date()
+        times.update(product.time_index.between(start, end))
+    if not times:
+        raise WMSException(
+            "No data available for time dimension value '%s' for this layer" % times_raw,
+            WMSException.INVALID_DIMENSION_VALUE,
+            locator="Time parameter")
+    return sorted(times)
+
+
 def parse_time_delta(delta_str):
     pattern = (r'P((?P<years>\d+)Y)?((?P<months>\d+)M)?((?P<days>\d+)D)?'
                r'(T(((?P<hours>\d+)H)?((?P<minutes>\d+)M)?((?P<seconds>\d+)S)?)?)?')
@@ -312,10 +339,13 @@ class GetParameters():
         # BBox, height and width parameters
         self.geobox = _get_geobox(args, self.crs)
         # Time parameter
-        self.times = get_times(args, self.product)
+        self.times = self.get_times(args)
 
         self.method_specific_init(args)
 
+    def get_times(self, args):
+        return get_times(args, self.product)
+
     def method_specific_init(self, args):
         pass
 
@@ -440,6 +470,10 @@ class GetFeatureInfoParameters(GetParameters):
         self.format = get_arg(args, "info_format", "info format", lower=True,
                               errcode=WMSException.INVALID_FORMAT,
                               permitted_values=["application/json", "text/html"])
+        self.parse_point(args)
+        self.style = single_style_from_args(self.product, args, required=False)
+
+    def parse_point(self, args):
         # Point coords
         if self.version == "1.1.1":
             coords = ["x", "y"]
@@ -455,7 +489,34 @@ class GetFeatureInfoParameters(GetParameters):
                                "%s parameter" % coords[0])
         self.i = int(i)
         self.j = int(j)
-        self.style = single_style_from_args(self.product, args, required=False)
+
+
+class GetTimeSeriesParameters(GetFeatureInfoParameters):
+    def get_times(self, args):
+        return get_time_series_times(args, self.product)
+
+    def method_specific_init(self, args):
+        self.format = get_arg(args, "info_format", "info format", lower=True,
+                              errcode=WMSException.INVALID_FORMAT,
+                              permitted_values=["application/json", "text/csv"])
+        self.parse_point(args)
+        if self.product.mosaic_date_func:
+            raise WMSException("Time series requests are not supported for mosaic layers",
+                               WMSException.INVALID_DIMENSION_VALUE,
+                               locator="Time parameter")
+        bands_raw = args.get("bands", "")
+        if bands_raw:
+            self.bands = []
+            for b in bands_raw.split(","):
+                try:
+                    self.bands.append(self.product.band_idx.locale_band(b))
+                except ConfigException:
+                    raise WMSException(f"Band {b} is not defined for layer {self.product.name}",
+                                       locator="Bands parameter",
+                                       valid_keys=self.product.band_idx.band_labels())
+        else:
+            self.bands = list(self.product.band_idx.band_cfg.keys())
+        self.ows_stats = bool(args.get("ows_stats"))
 
 
 # Solar angle correction functions
@@ -3,15 +3,25 @@
 #
 # Copyright (c) 2017-2023 OWS Contributors
 # SPDX-License-Identifier: Apache-2.0
+import hashlib
 import logging
 
 from flask import render_template
 
-from datacube_ows.data import feature_info, get_map
+from datacube_ows.capabilities_cache import capabilities_response
+from datacube_ows.cube_pool import cube
+from datacube_ows.data import DataStacker, feature_info, get_map
+from datacube_ows.mv_index import MVSelectOpts
 from datacube_ows.ogc_exceptions import WMSException, WMTSException
-from datacube_ows.ogc_utils import cache_control_headers, get_service_base_url
+from datacube_ows.ogc_utils import get_service_base_url
 from datacube_ows.ows_configuration import get_config
+from datacube_ows.request_coalescing import coalesced
+from datacube_ows.resource_limits import ResourceLimited
+from datacube_ows.tile_cache import (TileKey, cached_tile_response,
+                                     get_tile_cache, response_max_age,
+                                     split_metatile, store_tile, tile_key)
 from datacube_ows.utils import log_call
+from datacube_ows.wms_utils import GetMapParameters
 
 _LOG = logging.getLogger(__name__)
 
@@ -30,7 +40,7 @@ def handle_wmts(nocase_args):
     elif operation == "GETCAPABILITIES":
         return get_capabilities(nocase_args)
     elif operation == "GETTILE":
-        return get_tile(nocase_args)
+        return coalesced(get_config(), nocase_args, get_tile)
     elif operation == "GETFEATUREINFO":
         return get_feature_info(nocase_args)
     else:
@@ -40,7 +50,6 @@ def handle_wmts(nocase_args):
 
 @log_call
 def get_capabilities(args):
-    # TODO: Handle updatesequence request parameter for cache consistency.
     # Note: Only WMS v1.0.0 exists at this stage, so no version negotiation is necessary
     # Extract layer metadata from Datacube.
     cfg = get_config()
@@ -83,48 +92,36 @@ def get_capabilities(args):
                 raise WMTSException("Invalid section: %s" % section,
                                 WMTSException.INVALID_PARAMETER_VALUE,
                                 locator="Section parameter")
-    headers = cache_control_headers(cfg.wms_cap_cache_age)
-    headers["Content-Type"] = "application/xml"
-    return (
-        render_template(
-            "wmts_capabilities.xml",
-            cfg=cfg,
-            base_url=base_url,
-            show_service_id=show_service_id,
-            show_service_provider=show_service_provider,
-            show_ops_metadata=show_ops_metadata,
-            show_contents=show_contents,
-            show_themes=show_themes),
-        200,
-        cfg.response_headers(headers)
-    )
 
+    def render(update_sequence):
+        return (
+            render_template(
+                "wmts_capabilities.xml",
+                cfg=cfg,
+                base_url=base_url,
+                show_service_id=show_service_id,
+                show_service_provider=show_service_provider,
+                show_ops_metadata=show_ops_metadata,
+                show_contents=show_contents,
+                show_themes=show_themes,
+                update_sequence=update_sequence),
+            "application/xml"
+        )
+    key = ("wmts", "1.0.0", base_url,
+           show_service_id, show_service_provider, show_ops_metadata, show_contents, show_themes)
+    return capabilities_response(cfg, args, key, render, WMTSException)
 
-@log_call
-def wmts_args_to_wms(args, cfg):
-    layer = args.get("layer")
-    style = args.get("style")
-    format_ = args.get("format")
-    time = args.get("time", "")
+
+def tile_coords(args, cfg):
+    """
+    Parse and validate the tile matrix set, tile matrix, row and column of a WMTS request.
+
+    :return: A tuple of (TileMatrixSet, tile matrix, row, col)
+    """
     tileMatrixSet = args.get("tilematrixset")
     tileMatrix = args.get("tilematrix")
     row = args.get("tilerow")
     col = args.get("tilecol")
-
-    wms_args = {
-        "version": "1.3.0",
-        "service": "WMS",
-        "request": "GetMap",
-        "styles": style,
-        "layers": layer,
-        "time": time,
-        "width": 256,
-        "height": 256,
-        "format": format_,
-        "exceptions": "application/vnd.ogc.se_xml",
-        "requestid": args["requestid"]
-    }
-
     tms = cfg.tile_matrix_sets.get(tileMatrixSet)
     if not tms:
         for _tms in cfg.tile_matrix_sets.values():
@@ -135,8 +132,6 @@ def wmts_args_to_wms(args, cfg):
     if tms is None:
         raise WMTSException("Invalid Tile Matrix Set: " + tileMatrixSet)
 
-    wms_args["crs"] = tms.crs_name
-    crs_cfg = cfg.published_CRSs[tms.crs_name]
     try:
         tileMatrix = int(tileMatrix)
         if tileMatrix < 0 or tileMatrix >= len(tms.scale_set):
@@ -151,6 +146,32 @@ def wmts_args_to_wms(args, cfg):
         col = int(col)
     except ValueError:
         raise WMTSException(f"Invalid Tile Col: {col}")
+    return tms, tileMatrix, row, col
+
+
+@log_call
+def wmts_args_to_wms(args, cfg):
+    layer = args.get("layer")
+    style = args.get("style")
+    format_ = args.get("format")
+    time = args.get("time", "")
+
+    wms_args = {
+        "version": "1.3.0",
+        "service": "WMS",
+        "request": "GetMap",
+        "styles": style,
+        "layers": layer,
+        "time": time,
+        "width": 256,
+        "height": 256,
+        "format": format_,
+        "exceptions": "application/vnd.ogc.se_xml",
+        "requestid": args["requestid"]
+    }
+
+    tms, tileMatrix, row, col = tile_coords(args, cfg)
+    wms_args["crs"] = tms.crs_name
     wms_args["bbox"] = "%f,%f,%f,%f" % tms.wms_bbox_coords(tileMatrix, row, col)
 
     # GetFeatureInfo only args
@@ -172,7 +193,13 @@ def get_tile(args):
     wms_args = wmts_args_to_wms(args, cfg)
 
     try:
-        return get_map(wms_args)
+        layer = cfg.product_index.get(wms_args["layers"])
+        if layer is None or wms_args.get("ows_stats"):
+            return get_map(wms_args)
+        tms, tile_matrix, row, col = tile_coords(args, cfg)
+        key = tile_key(layer, wms_args["styles"], tms, tile_matrix, row, col,
+                       wms_args["time"], wms_args["format"])
+        return cached_tile_response(cfg, layer, key, lambda: render_tile(cfg, tms, key, wms_args))
     except WMSException as wmse:
         first_error = wmse.errors[0]
         e = WMTSException(first_error["msg"],
@@ -184,6 +211,87 @@ def get_tile(args):
         raise e
 
 
+def metatile_cacheable(meta_args) -> bool:
+    """
+    Check, before rendering, whether a metatile response would be cacheable.
+
+    Metatiles that match no datasets, exceed the layer's resource limits or are not covered by its
+    dataset cache rules are not worth rendering: only the requested tile could be returned.
+
+    :param meta_args: The GetMap arguments for the metatile
+    :return: True if the metatile response would be cacheable
+    """
+    params = GetMapParameters(meta_args)
+    stacker = DataStacker(params.product, params.geobox, params.times, params.resampling, style=params.style)
+    with cube() as dc:
+        if not dc:
+            return False
+        n_datasets = stacker.datasets(dc.index, mode=MVSelectOpts.COUNT)
+    resource_limits = params.product.resource_limits
+    try:
+        resource_limits.check_wms(n_datasets, params.zf, params.resources)
+    except ResourceLimited:
+        return False
+    return response_max_age(resource_limits.wms_cache_rules.cache_headers(n_datasets)) > 0
+
+
+def render_tile(cfg, tms, key: TileKey, wms_args):
+    """
+    Render a tile, via its metatile if the tile matrix set has a metatile_size greater than one.
+
+    The metatile is rendered with a single GetMap, and sliced into tiles.  The neighbouring tiles
+    are written to the tile cache and the requested tile is returned.  Only the single tile is rendered
+    if the metatile is too large, or if the metatile response would not be cacheable (e.g. because it
+    would hit resource limits that a single tile would not), which is checked with a dataset count
+    before rendering.
+
+    :param cfg: The global OWSConfig object
+    :param tms: The TileMatrixSet
+    :param key: The TileKey of the requested tile
+    :param wms_args: The GetMap arguments for the requested tile
+    :return: A Flask response tuple
+    """
+    cache = get_tile_cache(cfg)
+    if tms.metatile_size <= 1 or cache is None or "," in (wms_args.get("time") or ""):
+        return get_map(wms_args)
+    min_row, max_row, min_col, max_col = tms.metatile_range(key.tile_matrix, key.row, key.col)
+    n_rows = max_row - min_row + 1
+    n_cols = max_col - min_col + 1
+    width, height = tms.tile_size
+    if (n_rows == 1 and n_cols == 1) \
+            or n_cols * width > cfg.wms_max_width or n_rows * height > cfg.wms_max_height:
+        return get_map(wms_args)
+    top_left = tms.wms_bbox_coords(key.tile_matrix, min_row, min_col)
+    bottom_right = tms.wms_bbox_coords(key.tile_matrix, max_row, max_col)
+    meta_args = dict(wms_args)
+    meta_args["bbox"] = "%f,%f,%f,%f" % (
+        min(top_left[0], bottom_right[0]), min(top_left[1], bottom_right[1]),
+        max(top_left[2], bottom_right[2]), max(top_left[3], bottom_right[3]),
+    )
+    meta_args["width"] = n_cols * width
+    meta_args["height"] = n_rows * height
+    if not metatile_cacheable(meta_args):
+        return get_map(wms_args)
+    body, status, headers = get_map(meta_args)
+    if status != 200:
+        # Not an image, so no tile can be cut from it.
+        return get_map(wms_args)
+    # Only store the neighbouring tiles if the metatile response turned out to be cacheable after all.
+    store = response_max_age(headers) > 0
+    resp = None
+    for r, tile_row in enumerate(split_metatile(body, n_rows, n_cols, (width, height)), start=min_row):
+        for c, tile in enumerate(tile_row, start=min_col):
+            tile_headers = dict(headers)
+            # The metatile's dataset ETag does not identify a single tile, so use a content hash.
+            tile_headers["ETag"] = f'"{hashlib.sha256(tile).hexdigest()}"'
+            tile_resp = (tile, 200, tile_headers)
+            if (r, c) == (key.row, key.col):
+                resp = tile_resp
+            elif store:
+                store_tile(cache, key._replace(row=r, col=c), tile_resp)
+    return resp
+
+
 @log_call
 def get_feature_info(args):
     cfg = get_config()
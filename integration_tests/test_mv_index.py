@@ -131,3 +131,30 @@ def test_extent_and_spatial():
             dc.index, MVSelectOpts.COUNT, geom=small_geom, products=lyr.products
         )
         assert small_count <= all_count
+
+
+def test_solar_product_dates():
+    from datetime import timezone
+
+    from datacube.api.query import _convert_to_solar_time
+    from sqlalchemy import text
+
+    from datacube_ows.ows_configuration import TimeRes
+    from datacube_ows.product_ranges import product_dates
+    from datacube_ows.utils import get_sqlconn
+
+    cfg = get_config()
+    lyr = list(cfg.product_index.values())[0]
+    with cube() as dc:
+        conn = get_sqlconn(dc)
+        prodid = lyr.products[0].id
+        # Per-dataset calculation in Python
+        expected = set()
+        for dt1, dt2, lon in conn.execute(text("""
+                SELECT lower(temporal_extent), upper(temporal_extent), ST_X(ST_Centroid(spatial_extent))
+                FROM public.space_time_view
+                WHERE dataset_type_ref = :p_id"""), {"p_id": prodid}):
+            dt = (dt1 + (dt2 - dt1) / 2).astimezone(timezone.utc)
+            expected.add(_convert_to_solar_time(dt, lon).date())
+        assert product_dates(conn, prodid, TimeRes.SOLAR) == expected
+        conn.close()
@@ -62,3 +62,31 @@ def test_update_ranges_misuse_cases(runner, role_name, product_name):
     result = runner.invoke(main, ["--schema", product_name])
     assert "Sorry" in result.output
     assert result.exit_code == 1
+
+
+def test_update_ranges_jobs(runner):
+    result = runner.invoke(main, ["--jobs", "4"])
+    assert "ERROR" not in result.output
+    assert result.exit_code == 0
+
+    result = runner.invoke(main, ["--jobs", "0"])
+    assert "Sorry" in result.output
+    assert result.exit_code == 1
+
+
+def test_update_ranges_incremental(runner):
+    result = runner.invoke(main, ["--incremental"])
+    assert "ERROR" not in result.output
+    assert result.exit_code == 0
+
+    # Nothing added since the last update - ranges are unchanged
+    result = runner.invoke(main, ["--incremental"])
+    assert "Merging datasets added since" in result.output
+    assert result.exit_code == 0
+
+
+def test_update_views_incremental(runner):
+    # Materialised views are refreshed in full
+    result = runner.invoke(main, ["--views", "--incremental"])
+    assert "cannot be refreshed incrementally" in result.output
+    assert result.exit_code == 0
@@ -100,7 +100,8 @@ Features
         'console_scripts': [
             'datacube-ows=datacube_ows.wsgi:main',
             'datacube-ows-update=datacube_ows.update_ranges_impl:main',
-            'datacube-ows-cfg=datacube_ows.cfg_parser_impl:main'
+            'datacube-ows-cfg=datacube_ows.cfg_parser_impl:main',
+            'datacube-ows-seed=datacube_ows.seed_impl:main'
         ]
     },
     python_requires=">=3.8.0",
@@ -167,6 +167,11 @@ def minimal_global_cfg():
     global_cfg.folder_index = {
         "folder.existing_folder": MagicMock(),
     }
+    global_cfg.lazy_layer_init = False
+    global_cfg.layer_init_errors = None
+    global_cfg.preloaded_ranges = None
+    global_cfg.range_refresh_interval = 0
+    global_cfg.odc_product = lambda dc, name: dc.index.products.get_by_name(name)
     return global_cfg
 
 
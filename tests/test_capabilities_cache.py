@@ -0,0 +1,155 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import gzip
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask
+
+from datacube_ows.capabilities_cache import (capabilities_response,
+                                             clear_capabilities_cache)
+from datacube_ows.ogc_exceptions import WMSException
+
+
+@pytest.fixture
+def cap_cfg():
+    clear_capabilities_cache()
+    cfg = MagicMock()
+    cfg.range_refresh_interval = 0
+    cfg.product_index = {}
+    cfg.internationalised = False
+    cfg.cache_generation = "gen1"
+    cfg.wms_cap_cache_age = 0
+    cfg.response_headers = lambda d: d
+    cfg.compression_level = 6
+    cfg.compression_min_size = 1024
+    cfg.capabilities_cache_size = 16 * 1024 * 1024
+    return cfg
+
+
+@pytest.fixture
+def renderer():
+    render = MagicMock()
+    render.side_effect = lambda us: (f'<Capabilities updateSequence="{us}"/>', "application/xml")
+    return render
+
+
+def test_capabilities_cached(cap_cfg, renderer):
+    key = ("wms", "1.3.0", "http://localhost")
+    body, status, headers = capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    assert status == 200
+    etag = headers["ETag"].strip('"')
+    assert body == f'<Capabilities updateSequence="{etag}"/>'.encode("utf-8")
+    assert headers["Content-Type"] == "application/xml"
+    assert "Last-Modified" in headers
+    body2, _, headers2 = capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    assert body2 == body
+    assert renderer.call_count == 1
+    # Different base URL
+    capabilities_response(cap_cfg, {}, ("wms", "1.3.0", "http://otherhost"), renderer, WMSException)
+    assert renderer.call_count == 2
+    # Invalidated
+    cap_cfg.cache_generation = "gen2"
+    capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    assert renderer.call_count == 3
+
+
+def test_capabilities_not_cached_with_dynamic_layers(cap_cfg, renderer):
+    lyr = MagicMock()
+    lyr.dynamic = True
+    cap_cfg.product_index = {"lyr": lyr}
+    key = ("wms", "1.3.0", "http://localhost")
+    capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    assert renderer.call_count == 2
+    cap_cfg.range_refresh_interval = 60
+    capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    assert renderer.call_count == 3
+
+
+def test_capabilities_conditional(cap_cfg, renderer):
+    key = ("wms", "1.3.0", "http://localhost")
+    _, _, headers = capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    etag = headers["ETag"].strip('"')
+    with pytest.raises(WMSException) as e:
+        capabilities_response(cap_cfg, {"updatesequence": etag}, key, renderer, WMSException)
+    assert e.value.errors[0]["code"] == WMSException.CURRENT_UPDATE_SEQUENCE
+    _, status, _ = capabilities_response(cap_cfg, {"updatesequence": "older"}, key, renderer, WMSException)
+    assert status == 200
+    app = Flask("test_capabilities_cache")
+    with app.test_request_context(headers={"If-None-Match": headers["ETag"]}):
+        body, status, _ = capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    assert status == 304
+    assert body == ""
+    with app.test_request_context(headers={"If-None-Match": '"stale"'}):
+        _, status, _ = capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    assert status == 200
+
+
+def test_capabilities_compressed(cap_cfg, renderer):
+    renderer.side_effect = lambda us: (f'<Capabilities updateSequence="{us}">{"x" * 2000}</Capabilities>',
+                                       "application/xml")
+    key = ("wms", "1.3.0", "http://localhost")
+    app = Flask("test_capabilities_cache")
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        body, status, headers = capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+        body2, _, _ = capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["ETag"].endswith('-gzip"')
+    assert body2 is body
+    plain, _, _ = capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    assert gzip.decompress(body) == plain
+    with app.test_request_context(headers={"Accept-Encoding": "gzip", "If-None-Match": headers["ETag"]}):
+        _, status, _ = capabilities_response(cap_cfg, {}, key, renderer, WMSException)
+    assert status == 304
+
+
+def test_capabilities_cache_size(cap_cfg, renderer):
+    renderer.side_effect = lambda us: (f'<Capabilities updateSequence="{us}">{"x" * 1000}</Capabilities>',
+                                       "application/xml")
+    cap_cfg.capabilities_cache_size = 2500
+    key1 = ("wms", "1.3.0", "http://host1")
+    key2 = ("wms", "1.3.0", "http://host2")
+    key3 = ("wms", "1.3.0", "http://host3")
+    capabilities_response(cap_cfg, {}, key1, renderer, WMSException)
+    capabilities_response(cap_cfg, {}, key2, renderer, WMSException)
+    capabilities_response(cap_cfg, {}, key1, renderer, WMSException)
+    assert renderer.call_count == 2
+    # Third document exceeds the size limit: least recently used (key2) is evicted.
+    capabilities_response(cap_cfg, {}, key3, renderer, WMSException)
+    capabilities_response(cap_cfg, {}, key1, renderer, WMSException)
+    assert renderer.call_count == 3
+    capabilities_response(cap_cfg, {}, key2, renderer, WMSException)
+    assert renderer.call_count == 4
+    # Documents larger than the limit are never cached
+    cap_cfg.capabilities_cache_size = 500
+    capabilities_response(cap_cfg, {}, ("wms", "1.3.0", "http://host4"), renderer, WMSException)
+    capabilities_response(cap_cfg, {}, ("wms", "1.3.0", "http://host4"), renderer, WMSException)
+    assert renderer.call_count == 6
+
+
+def test_wcs1_coverage_descriptions_cached(cap_cfg, monkeypatch):
+    import datacube_ows.wcs1
+    lyr = MagicMock()
+    lyr.name = "layer"
+    lyr.wcs = True
+    lyr.dynamic = False
+    lyr.resource_limits.wcs_desc_cache_rule = 0
+    cap_cfg.product_index = {"layer": lyr}
+    render = MagicMock(return_value="<CoverageDescription/>")
+    monkeypatch.setattr(datacube_ows.wcs1, "get_config", lambda: cap_cfg)
+    monkeypatch.setattr(datacube_ows.wcs1, "render_template", render)
+    body, status, headers = datacube_ows.wcs1.desc_coverages({"coverage": "layer"})
+    assert body == b"<CoverageDescription/>"
+    assert headers["Content-Type"] == "application/xml"
+    datacube_ows.wcs1.desc_coverages({"coverage": "layer"})
+    assert render.call_count == 1
+    # Invalidated by a range update
+    cap_cfg.cache_generation = "gen2"
+    datacube_ows.wcs1.desc_coverages({"coverage": "layer"})
+    assert render.call_count == 2
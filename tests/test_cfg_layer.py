@@ -10,7 +10,8 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 from datacube_ows.ogc_utils import ConfigException
-from datacube_ows.ows_configuration import OWSFolder, OWSLayer, parse_ows_layer
+from datacube_ows.ows_configuration import (OWSFolder, OWSLayer, RangeState,
+                                            parse_ows_layer)
 from datacube_ows.resource_limits import ResourceLimited
 
 
@@ -168,6 +169,41 @@ def test_make_ready_catch_errors(minimal_global_cfg, minimal_dc):
     assert lyr.ready
 
 
+def test_make_layers_ready_concurrently(minimal_global_cfg, minimal_dc):
+    from datacube_ows.ows_configuration import OWSConfig
+    good = MagicMock()
+    good.name = "good"
+    good.named = True
+    bad = MagicMock()
+    bad.name = "bad"
+    bad.named = True
+    bad.make_ready.side_effect = ConfigException("KerPow!")
+    minimal_global_cfg.layer_init_threads = 4
+    minimal_global_cfg.root_layer_folder.named_layers.return_value = [good, bad]
+    OWSConfig.make_layers_ready(minimal_global_cfg, minimal_dc)
+    good.make_ready.assert_called_once()
+    bad.make_ready.assert_called_once()
+    assert minimal_global_cfg.layer_init_errors["good"] is None
+    assert "KerPow!" in str(minimal_global_cfg.layer_init_errors["bad"])
+
+    lyr = OWSFolder({
+        "title": "The Title",
+        "abstract": "The Abstract",
+        "layers": []
+    }, global_cfg=minimal_global_cfg)
+    lyr.unready_layers.extend([good, bad])
+    assert list(lyr.named_layers()) == [good, bad]
+    lyr.make_ready(minimal_dc)
+    # Layers are not re-initialised
+    good.make_ready.assert_called_once()
+    assert lyr.child_layers == [good]
+    assert lyr.unready_layers == [bad]
+
+    bad.make_ready.side_effect = KeyError("Unexpected")
+    with pytest.raises(KeyError):
+        OWSConfig.make_layers_ready(minimal_global_cfg, minimal_dc)
+
+
 def test_minimal_named_layer(minimal_layer_cfg, minimal_global_cfg, minimal_dc, mock_range):
     lyr = parse_ows_layer(minimal_layer_cfg,
                           global_cfg=minimal_global_cfg)
@@ -184,6 +220,119 @@ def test_minimal_named_layer(minimal_layer_cfg, minimal_global_cfg, minimal_dc,
     assert lyr.mosaic_date_func is None
 
 
+def test_lazy_named_layer(minimal_layer_cfg, minimal_global_cfg, minimal_dc, mock_range):
+    minimal_global_cfg.lazy_layer_init = True
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    with patch("datacube_ows.product_ranges.get_ranges") as get_rng:
+        get_rng.return_value = mock_range
+        lyr.make_ready(minimal_dc)
+    assert lyr.metadata_ready
+    assert lyr.capabilities_ready
+    assert not lyr.data_ready
+    assert not lyr.ready
+    assert lyr.default_time == mock_range["times"][-1]
+    with patch("datacube_ows.ows_configuration.cube") as cube:
+        cube.return_value.__enter__.return_value = minimal_dc
+        lyr.ensure_ready()
+        lyr.ensure_ready()
+    assert cube.call_count == 1
+    assert lyr.data_ready
+    assert lyr.ready
+    assert lyr.capabilities_ready
+    # Capabilities cached before initialisation are invalidated once
+    minimal_global_cfg.invalidate_caches.assert_called_once()
+
+
+def test_lazy_named_layer_failure(minimal_layer_cfg, minimal_global_cfg, minimal_dc, mock_range):
+    minimal_global_cfg.lazy_layer_init = True
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    with patch("datacube_ows.product_ranges.get_ranges") as get_rng:
+        get_rng.return_value = mock_range
+        lyr.make_ready(minimal_dc)
+    with patch("datacube_ows.ows_configuration.cube") as cube, \
+            patch.object(lyr, "make_data_ready", side_effect=ConfigException("Kaboom")) as mdr:
+        cube.return_value.__enter__.return_value = minimal_dc
+        for _ in range(3):
+            with pytest.raises(ConfigException) as e:
+                lyr.ensure_ready()
+            assert "Kaboom" in str(e.value)
+    # Failure is recorded: no further database work or cache invalidation
+    assert cube.call_count == 1
+    mdr.assert_called_once()
+    minimal_global_cfg.invalidate_caches.assert_called_once()
+    assert not lyr.capabilities_ready
+
+
+def test_ensure_ready_unavailable(minimal_layer_cfg, minimal_global_cfg):
+    minimal_global_cfg.lazy_layer_init = True
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    # Metadata initialisation failed (or never ran)
+    with patch("datacube_ows.ows_configuration.cube") as cube:
+        with pytest.raises(ConfigException) as e:
+            lyr.ensure_ready()
+    assert "not available" in str(e.value)
+    assert not cube.called
+    minimal_global_cfg.invalidate_caches.assert_not_called()
+
+
+def test_set_ranges_atomic(minimal_layer_cfg, minimal_global_cfg, minimal_dc, mock_range):
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    with patch("datacube_ows.product_ranges.get_ranges") as get_rng:
+        get_rng.return_value = mock_range
+        lyr.make_ready(minimal_dc)
+    old = lyr._range_state
+    new_range = dict(mock_range, times=mock_range["times"][:-1], end_time=mock_range["times"][-2])
+    lyr.set_ranges(new_range)
+    # The new state is published as a whole: the old state object is never modified
+    assert lyr._range_state is not old
+    assert old.ranges is mock_range
+    assert old.default_time == mock_range["times"][-1]
+    assert lyr.ranges is new_range
+    assert lyr.default_time == mock_range["times"][-2]
+    assert lyr.ranges_version != old.version
+    # Failed updates keep the previous default time
+    lyr.set_ranges(None)
+    assert lyr.ranges is None
+    assert lyr.bboxes == {}
+    assert lyr.default_time == mock_range["times"][-2]
+
+
+def test_preloaded_ranges_named_layer(minimal_layer_cfg, minimal_global_cfg, minimal_dc, mock_range):
+    minimal_global_cfg.preloaded_ranges = {"a_layer": mock_range}
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    with patch("datacube_ows.product_ranges.get_ranges") as get_rng:
+        lyr.make_ready(minimal_dc)
+    assert not get_rng.called
+    assert not lyr.hide
+    assert lyr.ranges is mock_range
+    assert lyr.default_time == mock_range["times"][-1]
+    assert "EPSG:4326" in lyr.bboxes
+    lyr.set_ranges(None)
+    assert lyr.hide
+    assert lyr.ranges is None
+    assert lyr.bboxes == {}
+    lyr.set_ranges(mock_range)
+    assert not lyr.hide
+    assert lyr.ranges is mock_range
+
+
+def test_parse_range_dates():
+    from datacube_ows.ows_configuration import TimeRes
+    from datacube_ows.product_ranges import parse_dates
+    assert parse_dates(TimeRes.SOLAR, ["2010-01-01", None, "2010-01-03"]) == [
+        datetime.date(2010, 1, 1), datetime.date(2010, 1, 3)
+    ]
+    assert parse_dates(TimeRes.SOLAR, []) == []
+    assert parse_dates(TimeRes.SUBDAY, ["2010-01-01T10:15:00+00:00"]) == [
+        datetime.datetime(2010, 1, 1, 10, 15, tzinfo=datetime.timezone.utc)
+    ]
+
+
 def test_duplicate_named_layer(minimal_layer_cfg, minimal_global_cfg, minimal_dc, mock_range):
     lyr = parse_ows_layer(minimal_layer_cfg,
                           global_cfg=minimal_global_cfg)
@@ -630,14 +779,14 @@ def test_time_range_reg_custom(minimal_layer_cfg, minimal_global_cfg):
         "end_date": "2021-01-10",
     }
     lyr = parse_ows_layer(minimal_layer_cfg, global_cfg=minimal_global_cfg)
-    lyr._ranges = {
+    lyr._range_state = RangeState(ranges={
         "times": [
             datetime.date(2021, 1, 5),
             datetime.date(2021, 1, 6),
             datetime.date(2021, 1, 7),
             datetime.date(2021, 1, 8),
         ]
-    }
+    })
     start, end = lyr.time_range()
     assert start == datetime.date(2021, 1, 1)
     assert end == datetime.date(2021, 1, 10)
@@ -650,12 +799,12 @@ def test_time_axis_representation_irreg(minimal_layer_cfg, minimal_global_cfg):
         "end_date": "2021-01-10",
     }
     lyr = parse_ows_layer(minimal_layer_cfg, global_cfg=minimal_global_cfg)
-    lyr._ranges = {
+    lyr._range_state = RangeState(ranges={
         "times": [
             datetime.date(2021, 1, 7),
             datetime.date(2021, 1, 8),
         ]
-    }
+    })
     assert lyr.time_axis_representation() == "2021-01-01/2021-01-10/P1D"
 
 
@@ -901,3 +1050,24 @@ def test_native_resolution_mismatch(minimal_global_cfg, minimal_layer_cfg, minim
     assert lyr.ready
     assert math.isclose(lyr.resolution_x, 0.001, rel_tol=1e-8)
     assert math.isclose(lyr.resolution_y, -0.001, rel_tol=1e-8)
+
+
+def test_parse_ranges_row_packed():
+    from datacube_ows.ows_configuration import TimeRes
+    from datacube_ows.product_ranges import pack_dates, parse_ranges_row
+    from datacube_ows.time_index import TimeIndex
+
+    cfg = MagicMock()
+    cfg.alias_bboxes.side_effect = lambda b: b
+    row = dict(lat_min=-1, lat_max=1, lon_min=-2, lon_max=2, bboxes={},
+              dates=["2010-01-01", "2010-01-03"])
+    from_json = parse_ranges_row(cfg, TimeRes.SOLAR, row)
+    row["dates_packed"] = pack_dates(TimeRes.SOLAR, row["dates"])
+    row["dates"] = []
+    from_packed = parse_ranges_row(cfg, TimeRes.SOLAR, row)
+    for ranges in (from_json, from_packed):
+        assert isinstance(ranges["times"], TimeIndex)
+        assert ranges["times"] == [datetime.date(2010, 1, 1), datetime.date(2010, 1, 3)]
+        assert ranges["start_time"] == datetime.date(2010, 1, 1)
+        assert ranges["end_time"] == datetime.date(2010, 1, 3)
+        assert datetime.date(2010, 1, 3) in ranges["time_set"]
@@ -0,0 +1,156 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from unittest.mock import patch
+
+from datacube_ows.config_snapshot import (config_hash, read_snapshot,
+                                          write_snapshot)
+from datacube_ows.ows_configuration import OWSConfig
+
+
+def test_config_hash(minimal_global_raw_cfg):
+    h = config_hash(minimal_global_raw_cfg)
+    assert h == config_hash(dict(reversed(list(minimal_global_raw_cfg.items()))))
+    minimal_global_raw_cfg["global"]["title"] = "A Different Title"
+    assert h != config_hash(minimal_global_raw_cfg)
+
+
+def test_snapshot_roundtrip(minimal_global_raw_cfg, minimal_dc, tmp_path):
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    cfg.make_ready(minimal_dc)
+    path = str(tmp_path / "snapshot.pickle")
+    write_snapshot(cfg, path, "cfghash", "token")
+    OWSConfig._instance = None
+
+    loaded = read_snapshot(path, "cfghash", "token")
+    assert loaded is not None
+    assert loaded.ready
+    assert loaded.title == "Test Title"
+    assert OWSConfig._instance is loaded
+    assert OWSConfig() is loaded
+
+
+def test_snapshot_runtime_settings(minimal_global_raw_cfg, minimal_dc, tmp_path, monkeypatch):
+    monkeypatch.setenv("OWS_PROFILE_SECRET", "s3cr3t-value")
+    monkeypatch.setenv("OWS_TILE_CACHE", "file:///writer/tiles")
+    monkeypatch.setenv("OWS_COMPRESSION_LEVEL", "9")
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    cfg.make_ready(minimal_dc)
+    assert cfg.profile_secret == "s3cr3t-value"
+    path = str(tmp_path / "snapshot.pickle")
+    write_snapshot(cfg, path, "cfghash", "token")
+    with open(path, "rb") as fp:
+        raw = fp.read()
+    assert b"s3cr3t-value" not in raw
+    assert b"/writer/tiles" not in raw
+    OWSConfig._instance = None
+
+    # Runtime settings are read from the environment of the loading process
+    monkeypatch.delenv("OWS_PROFILE_SECRET")
+    monkeypatch.setenv("OWS_TILE_CACHE", "file:///reader/tiles")
+    monkeypatch.delenv("OWS_COMPRESSION_LEVEL")
+    loaded = read_snapshot(path, "cfghash", "token")
+    assert loaded.profile_secret is None
+    assert loaded.tile_cache_url == "file:///reader/tiles"
+    assert loaded.compression_level == 6
+    assert loaded.title == "Test Title"
+
+
+def test_snapshot_stale(minimal_global_raw_cfg, minimal_dc, tmp_path):
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    cfg.make_ready(minimal_dc)
+    path = str(tmp_path / "snapshot.pickle")
+    write_snapshot(cfg, path, "cfghash", "token")
+    assert read_snapshot(path, "newhash", "token") is None
+    assert read_snapshot(path, "cfghash", "newtoken") is None
+    with patch("datacube_ows.config_snapshot.__version__", "0.0.0"):
+        assert read_snapshot(path, "cfghash", "token") is None
+
+
+def odc_product(name):
+    from datacube.model import MetadataType, Product
+    metadata_type = MetadataType({
+        "name": "eo3",
+        "description": "Test metadata type",
+        "dataset": {
+            "id": ["id"],
+            "sources": ["lineage", "source_datasets"],
+            "creation_dt": ["properties", "odc:processing_datetime"],
+            "label": ["label"],
+            "format": ["properties", "odc:file_format"],
+            "measurements": ["measurements"],
+            "grid_spatial": ["grid_spatial", "projection"],
+            "search_fields": {},
+        }
+    }, dataset_search_fields={})
+    return Product(metadata_type, {
+        "name": name,
+        "metadata_type": "eo3",
+        "description": "Test product",
+        "metadata": {"product": {"name": name}},
+        "measurements": [
+            {"name": band, "dtype": "int16", "nodata": -999, "units": "1"}
+            for band in ("band1", "band2", "band3", "band4")
+        ],
+        "storage": {"crs": "EPSG:4326", "resolution": {"latitude": -0.001, "longitude": 0.001}},
+    }, id_=1)
+
+
+def test_snapshot_roundtrip_layers(minimal_global_raw_cfg, minimal_layer_cfg, minimal_dc, mock_range,
+                                   tmp_path, monkeypatch):
+    import pickle
+    import threading
+
+    from datacube_ows.capabilities_cache import cached_document
+    from datacube_ows.range_refresher import start_range_refresher
+    from datacube_ows.time_index import TimeIndex
+
+    minimal_global_raw_cfg["layers"] = [minimal_layer_cfg]
+    # A real (picklable) ODC product
+    minimal_dc.index.products.get_by_name = lambda name: odc_product(name)
+    mock_range["times"] = mock_range["time_set"] = TimeIndex.from_dates(mock_range["times"])
+    monkeypatch.setenv("OWS_RANGE_REFRESH_INTERVAL", "3600")
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    with patch("datacube_ows.product_ranges.get_all_ranges") as get_all_ranges:
+        get_all_ranges.return_value = {"a_layer": mock_range}
+        cfg.make_ready(minimal_dc)
+    lyr = cfg.product_index["a_layer"]
+    assert lyr.ready and not lyr.hide
+    # Process-local state: a range refresher thread, a cached capabilities document and layer locks.
+    with patch("datacube_ows.range_refresher.RangeRefresher.run"):
+        refresher = start_range_refresher(cfg)
+    try:
+        cached_document(cfg, ("test", "snapshot"), lambda update_sequence: ("<doc/>", "application/xml"))
+        path = str(tmp_path / "snapshot.pickle")
+        write_snapshot(cfg, path, "cfghash", "token")
+    finally:
+        refresher.stop()
+    with open(path, "rb") as fp:
+        raw = fp.read()
+    # (Locks cannot be pickled at all, so they must have been excluded for the snapshot to be written.)
+    for process_local in (b"datacube_ows.range_refresher", b"datacube_ows.capabilities_cache",
+                          b"datacube_ows.cube_pool", b"sqlalchemy", b"threading"):
+        assert process_local not in raw
+    OWSConfig._instance = None
+
+    loaded = read_snapshot(path, "cfghash", "token")
+    assert loaded is not cfg
+    loaded_lyr = loaded.product_index["a_layer"]
+    assert loaded_lyr.ready
+    assert loaded_lyr.global_cfg is loaded
+    assert loaded_lyr.ranges_version == lyr.ranges_version
+    assert loaded_lyr.time_index == mock_range["times"]
+    assert loaded_lyr.default_time == mock_range["end_time"]
+    assert list(loaded_lyr.style_index) == ["band1"]
+    assert loaded_lyr.default_style.name == "band1"
+    assert loaded_lyr.style_index["band1"].product is loaded_lyr
+    assert isinstance(loaded_lyr._ready_lock, type(threading.Lock()))
+    # Layer locks are recreated, not shared
+    assert loaded_lyr._ready_lock is not lyr._ready_lock
+    assert pickle.loads(pickle.dumps(loaded)).product_index["a_layer"].name == "a_layer"
@@ -179,3 +179,32 @@ def test_tms_wms_bbox(wwwm_tms_cfg, tmsmin_global_cfg):
     assert a == pytest.approx(9705668.103538, 0.001)
     assert d == pytest.approx(-12210356.64638, 0.001)
     assert c == pytest.approx(10018754.17139, 0.001)
+
+
+def test_tile_range(wwwm_tms_cfg, tmsmin_global_cfg):
+    tms = TileMatrixSet("test", wwwm_tms_cfg, tmsmin_global_cfg)
+    assert tms.matrix_size(0) == (1, 1)
+    assert tms.matrix_size(3) == (8, 8)
+    # Whole world
+    assert tms.tile_range(3, -20037508.3427892, -20037508.3427892, 20037508.3427892, 20037508.3427892) == (0, 7, 0, 7)
+    # A single tile
+    left, bottom, right, top = tms.wms_bbox_coords(5, 11, 27)
+    assert tms.tile_range(5, left + 1.0, bottom + 1.0, right - 1.0, top - 1.0) == (11, 11, 27, 27)
+    # Outside the tile matrix
+    assert tms.tile_range(3, 30000000.0, 0.0, 40000000.0, 10.0) is None
+
+
+def test_metatile_size(wwwm_tms_cfg, tmsmin_global_cfg):
+    tms = TileMatrixSet("test", wwwm_tms_cfg, tmsmin_global_cfg)
+    assert tms.metatile_size == 1
+    assert tms.metatile_range(3, 5, 6) == (5, 5, 6, 6)
+    wwwm_tms_cfg["metatile_size"] = 4
+    tms = TileMatrixSet("test", wwwm_tms_cfg, tmsmin_global_cfg)
+    assert tms.metatile_range(3, 5, 6) == (4, 7, 4, 7)
+    # Clipped to the tile matrix
+    assert tms.metatile_range(1, 1, 0) == (0, 1, 0, 1)
+    for bad in (0, -2, 2.5, "4"):
+        wwwm_tms_cfg["metatile_size"] = bad
+        with pytest.raises(ConfigException) as excinfo:
+            TileMatrixSet("test", wwwm_tms_cfg, tmsmin_global_cfg)
+        assert "metatile_size must be a positive integer" in str(excinfo.value)
@@ -0,0 +1,101 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from datacube_ows.cube_pool import OWSQueuePool, configure_pool, pool_settings
+from datacube_ows.ogc_utils import ConfigException
+from datacube_ows.ows_metrics import db_connections_checked_out
+
+
+@pytest.fixture
+def fake_dc(tmp_path):
+    dc = MagicMock()
+    dc.index._db._engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    return dc
+
+
+def test_pool_settings_defaults(monkeypatch):
+    for var in ("OWS_DB_POOL_SIZE", "OWS_DB_POOL_MAX_OVERFLOW", "OWS_DB_POOL_TIMEOUT",
+                "OWS_DB_POOL_RECYCLE", "OWS_DB_POOL_PRE_PING"):
+        monkeypatch.delenv(var, raising=False)
+    assert pool_settings() == {
+        "pool_size": 5, "max_overflow": 10, "timeout": 30.0, "recycle": 60, "pre_ping": True,
+    }
+
+
+def test_pool_settings_env(monkeypatch):
+    monkeypatch.setenv("OWS_DB_POOL_SIZE", "16")
+    monkeypatch.setenv("OWS_DB_POOL_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("OWS_DB_POOL_TIMEOUT", "2.5")
+    monkeypatch.setenv("OWS_DB_POOL_RECYCLE", "300")
+    monkeypatch.setenv("OWS_DB_POOL_PRE_PING", "no")
+    assert pool_settings() == {
+        "pool_size": 16, "max_overflow": 0, "timeout": 2.5, "recycle": 300, "pre_ping": False,
+    }
+
+
+@pytest.mark.parametrize("var, val, msg", [
+    ("OWS_DB_POOL_SIZE", "lots", "must be a number"),
+    ("OWS_DB_POOL_SIZE", "0", "must be at least 1"),
+    ("OWS_DB_POOL_MAX_OVERFLOW", "-1", "must not be negative"),
+])
+def test_pool_settings_invalid(monkeypatch, var, val, msg):
+    monkeypatch.setenv(var, val)
+    with pytest.raises(ConfigException) as e:
+        pool_settings()
+    assert msg in str(e.value)
+
+
+def test_configure_pool(fake_dc):
+    engine = fake_dc.index._db._engine
+    connects = []
+    event.listen(engine, "connect", lambda dbapi_conn, rec: connects.append(dbapi_conn))
+    configure_pool(fake_dc, {"pool_size": 2, "max_overflow": 0, "timeout": 0.1, "recycle": 60, "pre_ping": True})
+    assert isinstance(engine.pool, OWSQueuePool)
+    assert engine.pool.size() == 2
+    before = db_connections_checked_out._value.get()
+    with engine.connect() as c1, engine.connect() as c2:
+        assert c1.execute(text("SELECT 1")).scalar() == 1
+        assert db_connections_checked_out._value.get() == before + 2
+        # Bounded: no overflow, checkout times out
+        with pytest.raises(Exception) as e:
+            engine.connect()
+        assert "QueuePool limit" in str(e.value)
+    assert db_connections_checked_out._value.get() == before
+    # New connections are still opened by the original engine's pool (and its connect events)
+    assert len(connects) == 2
+    # Settings and instrumentation survive pool recreation (e.g. after fork)
+    engine.pool = engine.pool.recreate()
+    assert isinstance(engine.pool, OWSQueuePool)
+    with engine.connect():
+        assert db_connections_checked_out._value.get() == before + 1
+
+
+def test_configure_pool_gauge_invalidate_detach(fake_dc):
+    engine = fake_dc.index._db._engine
+    configure_pool(fake_dc, {"pool_size": 2, "max_overflow": 0, "timeout": 0.1, "recycle": 60, "pre_ping": True})
+    before = db_connections_checked_out._value.get()
+    with engine.connect() as conn:
+        conn.invalidate()
+    assert db_connections_checked_out._value.get() == before
+    raw = engine.raw_connection()
+    assert db_connections_checked_out._value.get() == before + 1
+    raw.detach()
+    raw.close()
+    assert db_connections_checked_out._value.get() == before
+    # Detached connection no longer counts against the pool size
+    with engine.connect(), engine.connect():
+        assert db_connections_checked_out._value.get() == before + 2
+    assert db_connections_checked_out._value.get() == before
+
+
+def test_configure_pool_no_engine():
+    dc = MagicMock()
+    dc.index._db = None
+    configure_pool(dc)
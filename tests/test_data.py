@@ -322,3 +322,124 @@ def test_create_nodata(dummy_raw_calc_data):
     with pytest.raises(WMSException) as e:
         data_out = ds.create_nodata_filled_flag_bands(Dataset(), pbq)
     assert "Cannot add default flag data as there is no non-flag data available" in str(e.value)
+
+
+@pytest.fixture
+def time_series_env(monkeypatch):
+    from contextlib import contextmanager
+
+    from xarray import DataArray
+
+    from datacube_ows.data import MVSelectOpts
+    from datacube_ows.query_profiler import profile_span
+
+    product = MagicMock()
+    product.name = "layer"
+    product.time_resolution.is_subday.return_value = False
+    product.time_resolution.is_solar.return_value = False
+    product.band_idx.nodata_val.return_value = -999
+    product.band_idx.band_label.side_effect = lambda b: b.upper()
+    params = MagicMock()
+    params.product = product
+    params.bands = ["red", "green"]
+    params.times = [datetime.date(2021, 1, d) for d in (1, 2, 3)]
+    params.format = "application/json"
+    params.ows_stats = False
+    params.crsid = "EPSG:4326"
+    monkeypatch.setattr(datacube_ows.data, "GetTimeSeriesParameters", lambda args: params)
+    point = geometry.point(149.0, -35.0, "EPSG:4326")
+    geobox = geometry.GeoBox.from_geopolygon(point, (-0.001, 0.001), crs="EPSG:4326")
+    monkeypatch.setattr(datacube_ows.data, "point_geobox", lambda p: (point, geobox))
+    cfg = MagicMock()
+    cfg.published_CRSs = {"EPSG:4326": {"horizontal_coord": "longitude", "vertical_coord": "latitude"}}
+    cfg.response_headers = lambda d: d
+    monkeypatch.setattr(datacube_ows.data, "get_config", lambda: cfg)
+
+    @contextmanager
+    def fake_cube():
+        yield MagicMock()
+    monkeypatch.setattr(datacube_ows.data, "cube", fake_cube)
+
+    # Per-date datasets, and pixel values (None for nodata)
+    pixels = {1: (10, 20), 2: (-999, 21), 3: (12, 22)}
+    dss = np.empty(3, dtype=object)
+    for i, day in enumerate(pixels):
+        ds = MagicMock()
+        ds.day = day
+        ds.time.begin = datetime.datetime(2021, 1, day)
+        dss[i] = (ds,)
+    main_dss = DataArray(dss, dims=["time"], coords={"time": [np.datetime64(f"2021-01-0{d}") for d in pixels]})
+    pbq = MagicMock()
+    pbq.main = True
+    pbq.ignore_time = False
+
+    class FakeStacker:
+        loaded = []
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def datasets(self, index, point=None, mode=None):
+            if mode == MVSelectOpts.COUNT:
+                return len(pixels)
+            return {pbq: main_dss}
+
+        def data(self, slices):
+            with profile_span("load-slice"):
+                day = slices[pbq].values[0][0].day
+            self.loaded.append(day)
+            red, green = pixels[day]
+            return Dataset({
+                "red": (("time", "latitude", "longitude"), np.array([[[red]]])),
+                "green": (("time", "latitude", "longitude"), np.array([[[green]]])),
+            }, coords={"time": [np.datetime64(f"2021-01-0{day}")], "latitude": [-35.0], "longitude": [149.0]})
+    monkeypatch.setattr(datacube_ows.data, "DataStacker", FakeStacker)
+    return params, FakeStacker
+
+
+def test_time_series(time_series_env):
+    import json
+
+    from flask import Flask
+
+    params, stacker = time_series_env
+    with Flask("test_time_series").app_context():
+        body, status, headers = datacube_ows.data.time_series({})
+    assert status == 200
+    assert headers["Content-Type"] == "application/json"
+    result = json.loads(body)
+    assert result["layer"] == "layer"
+    assert result["lon"] == pytest.approx(149.0)
+    assert result["lat"] == pytest.approx(-35.0)
+    assert result["bands"] == ["RED", "GREEN"]
+    assert result["times"] == ["2021-01-01", "2021-01-02", "2021-01-03"]
+    assert result["values"] == {"RED": [10, None, 12], "GREEN": [20, 21, 22]}
+    assert sorted(stacker.loaded) == [1, 2, 3]
+
+    params.format = "text/csv"
+    body, status, headers = datacube_ows.data.time_series({})
+    assert headers["Content-Type"] == "text/csv"
+    assert body.splitlines() == ["time,RED,GREEN", "2021-01-01,10,20", "2021-01-02,,21", "2021-01-03,12,22"]
+
+
+def test_time_series_profiled(time_series_env):
+    import json
+
+    from flask import Flask, g
+
+    params, stacker = time_series_env
+    params.ows_stats = True
+    app = Flask("test_time_series")
+    # Spans recorded in worker threads are included in the profile
+    with app.app_context():
+        result = json.loads(datacube_ows.data.time_series({})[0])
+    loads = [e for e in result["traceEvents"] if e["name"] == "load-slice"]
+    assert len(loads) == 3
+    # Under cProfile, the reads are performed in the calling thread
+    stacker.loaded.clear()
+    with app.app_context():
+        g.ows_cprofile = True
+        result = json.loads(datacube_ows.data.time_series({})[0])
+    tids = {e["tid"] for e in result["traceEvents"] if e["name"] == "load-slice"}
+    assert tids == {e["tid"] for e in result["traceEvents"] if e["name"] == "query"}
+    assert sorted(stacker.loaded) == [1, 2, 3]
@@ -0,0 +1,88 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from flask import Flask
+from xarray import DataArray
+
+from datacube_ows.data import etag_dataset_ids
+from datacube_ows.etags import (NotModified, check_not_modified, dataset_etag,
+                                definition_hash)
+
+
+def cfg_entry(raw_cfg):
+    entry = MagicMock()
+    entry._raw_cfg = raw_cfg
+    return entry
+
+
+def query(key):
+    q = MagicMock()
+    q.key = key
+    return q
+
+
+def test_definition_hash():
+    assert definition_hash(cfg_entry({"a": 1, "b": [1, 2]})) == definition_hash(cfg_entry({"b": [1, 2], "a": 1}))
+    assert definition_hash(cfg_entry({"a": 1})) != definition_hash(cfg_entry({"a": 2}))
+    assert definition_hash(cfg_entry({"f": test_definition_hash})) == definition_hash(
+        cfg_entry({"f": test_definition_hash}))
+
+
+def test_dataset_etag():
+    layer = cfg_entry({"name": "layer"})
+    style = cfg_entry({"name": "style"})
+    q = query(((1,), ("red",)))
+    args = {"layers": "layer", "bbox": "0,0,1,1", "requestid": "1234"}
+    etag = dataset_etag(layer, style, args, {q: ["id1", "id2"]})
+    assert etag == dataset_etag(layer, style, dict(args, requestid="5678"), {q: ["id2", "id1"]})
+    assert etag != dataset_etag(layer, style, args, {q: ["id1", "id3"]})
+    assert etag != dataset_etag(layer, style, dict(args, bbox="0,0,2,2"), {q: ["id1", "id2"]})
+    assert etag != dataset_etag(layer, cfg_entry({"name": "other"}), args, {q: ["id1", "id2"]})
+    assert etag != dataset_etag(layer, style, args, {q: ["id1", "id2"]}, resource_limited=True)
+
+
+def test_check_not_modified():
+    app = Flask("test_etags")
+    with app.test_request_context(headers={"If-None-Match": '"abc"'}):
+        check_not_modified("def", {})
+        check_not_modified(None, {})
+        with pytest.raises(NotModified) as e:
+            check_not_modified("abc", {"ETag": '"abc"'})
+    body, status, headers = e.value.response()
+    assert status == 304
+    assert headers["ETag"] == '"abc"'
+    check_not_modified("abc", {})
+
+
+def dataset(ds_id):
+    ds = MagicMock()
+    ds.id = ds_id
+    return ds
+
+
+def test_etag_dataset_ids():
+    layer = MagicMock()
+    qprof = MagicMock()
+    qprof.active = False
+    layer.global_cfg.dataset_etags = True
+    main = np.empty(2, dtype=object)
+    main[0] = (dataset("id1"), dataset("id2"))
+    main[1] = (dataset("id3"),)
+    flags = np.empty(1, dtype=object)
+    flags[0] = (dataset("id4"),)
+    q_main, q_flags = query("main"), query("flags")
+    datasets = {q_main: DataArray(main, dims=["time"]), q_flags: DataArray(flags, dims=["time"])}
+    # Ids are taken from the fetched datasets (no index query)
+    assert etag_dataset_ids(layer, datasets, qprof) == {q_main: ["id1", "id2", "id3"], q_flags: ["id4"]}
+    # No ETags for profiled requests, or if ETags are disabled
+    qprof.active = True
+    assert etag_dataset_ids(layer, datasets, qprof) is None
+    qprof.active = False
+    layer.global_cfg.dataset_etags = False
+    assert etag_dataset_ids(layer, datasets, qprof) is None
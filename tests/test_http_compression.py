@@ -0,0 +1,68 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import gzip
+import zlib
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask, Response
+
+from datacube_ows.http_compression import (compress_response,
+                                           compressible_type,
+                                           negotiate_encoding)
+
+
+@pytest.fixture
+def comp_cfg():
+    cfg = MagicMock()
+    cfg.compression_level = 6
+    cfg.compression_min_size = 100
+    return cfg
+
+
+@pytest.fixture
+def app():
+    return Flask("test_http_compression")
+
+
+def test_compressible_type():
+    assert compressible_type("application/xml")
+    assert compressible_type("application/json; charset=utf-8")
+    assert compressible_type("text/html")
+    assert compressible_type("application/vnd.ogc.se_xml+xml")
+    assert not compressible_type("image/png")
+    assert not compressible_type("image/geotiff")
+    assert not compressible_type(None)
+
+
+def test_negotiate_encoding(comp_cfg, app):
+    with app.test_request_context(headers={"Accept-Encoding": "gzip, deflate"}):
+        assert negotiate_encoding(comp_cfg, "application/xml", 1000) == "gzip"
+        assert negotiate_encoding(comp_cfg, "application/xml", 10) is None
+        assert negotiate_encoding(comp_cfg, "image/png", 1000) is None
+        comp_cfg.compression_level = 0
+        assert negotiate_encoding(comp_cfg, "application/xml", 1000) is None
+    comp_cfg.compression_level = 6
+    with app.test_request_context(headers={"Accept-Encoding": "deflate"}):
+        assert negotiate_encoding(comp_cfg, "application/xml", 1000) == "deflate"
+    with app.test_request_context():
+        assert negotiate_encoding(comp_cfg, "application/xml", 1000) is None
+
+
+def test_compress_response(comp_cfg, app):
+    data = b"<xml>" + b"abc" * 1000 + b"</xml>"
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        resp = compress_response(Response(data, content_type="application/xml"), comp_cfg)
+        assert resp.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in resp.headers["Vary"]
+        assert gzip.decompress(resp.get_data()) == data
+        resp = compress_response(Response(data, content_type="image/png"), comp_cfg)
+        assert "Content-Encoding" not in resp.headers
+        assert resp.get_data() == data
+    with app.test_request_context(headers={"Accept-Encoding": "deflate"}):
+        resp = compress_response(Response(data, content_type="application/xml"), comp_cfg)
+        assert resp.headers["Content-Encoding"] == "deflate"
+        assert zlib.decompress(resp.get_data()) == data
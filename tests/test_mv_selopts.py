@@ -38,3 +38,22 @@ def test_count():
     sel = MVSelectOpts.COUNT.sel(stv)
     assert len(sel) == 1
     assert str(sel[0]) == "count(foo)"
+
+
+def test_group_date_expr():
+    from sqlalchemy.dialects import postgresql
+
+    from datacube_ows.mv_index import group_date_expr, st_view
+    from datacube_ows.ows_configuration import TimeRes
+
+    def compiled(tr):
+        return str(group_date_expr(st_view, tr).compile(dialect=postgresql.dialect()))
+
+    assert compiled(TimeRes.SUBDAY) == "timezone(%(timezone_1)s, lower(space_time_view.temporal_extent))"
+    assert compiled(TimeRes.SUMMARY).startswith("date(timezone(")
+    solar = compiled(TimeRes.SOLAR)
+    assert solar.startswith("date(timezone(")
+    assert "upper(space_time_view.temporal_extent)" in solar
+    # Longitude midpoint of the footprint, as for datacube.api.query.solar_day()
+    assert "ST_XMin(space_time_view.spatial_extent) + ST_XMax(space_time_view.spatial_extent)" in solar
+    assert "Centroid" not in solar
@@ -34,3 +34,100 @@ def test_qpf_info():
     qp["foo"] = "splunge"
     prof = qp.profile()
     assert prof["info"]["foo"] == "splunge"
+
+
+def test_qpf_metrics():
+    from prometheus_client import REGISTRY
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    stage_labels = {"operation": "GetMap", "layer": "lyr", "stage": "load-data"}
+    before = sample("ows_request_stage_seconds_count", **stage_labels)
+    before_ds = sample("ows_request_datasets_sum", operation="GetMap", layer="lyr")
+    qp = QueryProfiler(False, "GetMap", "lyr")
+    qp.start_event("load-data")
+    qp.end_event("load-data")
+    qp["n_datasets"] = 7
+    # Inactive profilers still record metrics, but return no profile
+    assert qp.profile() == {}
+    assert sample("ows_request_stage_seconds_count", **stage_labels) == before + 1
+    assert sample("ows_request_datasets_sum", operation="GetMap", layer="lyr") == before_ds + 7
+
+
+def test_qpf_nested_spans():
+    qp = QueryProfiler(True)
+    qp.start_event("load-data")
+    for i in range(3):
+        with qp.span("load-query", n=i) as span:
+            assert span.name == "load-query"
+            with qp.span("load-dataset", id="abc"):
+                pass
+    qp.end_event("load-data")
+    load = qp.root.children[0]
+    assert load.name == "load-data"
+    assert [s.attrs["n"] for s in load.children] == [0, 1, 2]
+    assert all(s.children[0].name == "load-dataset" for s in load.children)
+    prof = qp.profile()
+    # Repeated spans are summed
+    assert prof["profile"]["load-query"] == sum(s.duration for s in load.children)
+    assert prof["profile"]["load-query"] <= prof["profile"]["load-data"] <= prof["profile"]["query"]
+
+
+def test_qpf_inactive_spans():
+    qp = QueryProfiler(False)
+    with qp.span("foo") as span:
+        assert span is None
+    assert qp.root.children == []
+
+
+def test_qpf_trace_events():
+    import json
+    qp = QueryProfiler(True)
+    qp.start_event("foo")
+    with qp.span("bar", products="prod1"):
+        pass
+    qp.end_event("foo")
+    qp.start_event("never-ended")
+    prof = json.loads(json.dumps(qp.profile()))
+    assert prof["displayTimeUnit"] == "ms"
+    events = {e["name"]: e for e in prof["traceEvents"]}
+    assert set(events) == {"query", "foo", "bar"}
+    assert all(e["ph"] == "X" for e in events.values())
+    assert events["query"]["ts"] == 0
+    assert events["foo"]["ts"] <= events["bar"]["ts"]
+    assert events["bar"]["ts"] + events["bar"]["dur"] <= events["foo"]["ts"] + events["foo"]["dur"]
+    assert events["bar"]["args"] == {"products": "prod1"}
+
+
+def test_qpf_alloc_tracking():
+    import tracemalloc
+    qp = QueryProfiler(True)
+    tracemalloc.start()
+    try:
+        with qp.span("alloc"):
+            data = [bytearray(1000) for _ in range(100)]
+    finally:
+        tracemalloc.stop()
+    assert qp.root.children[0].attrs["alloc_bytes"] >= 100000
+    assert data
+
+
+def test_profile_span():
+    from flask import Flask
+
+    from datacube_ows.query_profiler import current_profiler, profile_span
+
+    with profile_span("outside-request") as span:
+        assert span is None
+    app = Flask(__name__)
+    with app.app_context():
+        assert current_profiler() is None
+        with profile_span("not-profiled") as span:
+            assert span is None
+        qp = QueryProfiler(True)
+        assert current_profiler() is qp
+        with profile_span("mv_search", mode="COUNT"):
+            pass
+    assert qp.root.children[0].name == "mv_search"
+    assert qp.root.children[0].attrs == {"mode": "COUNT"}
@@ -0,0 +1,58 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from unittest.mock import MagicMock, patch
+
+from datacube_ows.range_refresher import RangeRefresher, start_range_refresher
+
+
+def refresher_cfg():
+    cfg = MagicMock()
+    static_lyr = MagicMock()
+    static_lyr.dynamic = False
+    dynamic_lyr = MagicMock()
+    dynamic_lyr.dynamic = True
+    cfg.product_index = {"static": static_lyr, "dynamic": dynamic_lyr}
+    return cfg, dynamic_lyr
+
+
+def test_refresh_on_change():
+    cfg, dynamic_lyr = refresher_cfg()
+    refresher = RangeRefresher(cfg, 10.0)
+    with patch("datacube_ows.range_refresher.cube") as cube, \
+         patch("datacube_ows.range_refresher.get_ranges_change_token") as get_token:
+        get_token.return_value = "token1"
+        assert refresher.refresh()
+        cfg.refresh_ranges.assert_called_once_with(cube.return_value.__enter__.return_value, [dynamic_lyr])
+        assert not refresher.refresh()
+        assert cfg.refresh_ranges.call_count == 1
+        get_token.return_value = "token2"
+        assert refresher.refresh()
+        assert cfg.refresh_ranges.call_count == 2
+
+
+def test_refresh_always():
+    cfg, _ = refresher_cfg()
+    refresher = RangeRefresher(cfg, 10.0, always=True)
+    with patch("datacube_ows.range_refresher.cube"), \
+         patch("datacube_ows.range_refresher.get_ranges_change_token") as get_token:
+        get_token.return_value = "token1"
+        assert refresher.refresh()
+        assert refresher.refresh()
+        assert cfg.refresh_ranges.call_count == 2
+
+
+def test_refresh_no_dynamic_layers():
+    cfg, dynamic_lyr = refresher_cfg()
+    dynamic_lyr.dynamic = False
+    refresher = RangeRefresher(cfg, 10.0)
+    assert not refresher.refresh()
+    assert not cfg.refresh_ranges.called
+
+
+def test_refresher_disabled():
+    cfg = MagicMock()
+    cfg.range_refresh_interval = 0
+    assert start_range_refresher(cfg) is None
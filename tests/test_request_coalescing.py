@@ -0,0 +1,92 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from threading import Event, Thread
+from time import sleep
+from unittest.mock import MagicMock
+
+import pytest
+
+from datacube_ows.request_coalescing import (SingleFlight, coalesced,
+                                             coalescing_key)
+
+
+def run_concurrently(flight, key, fn, n):
+    results = [None] * n
+    errors = [None] * n
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [Thread(target=call, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    release = Event()
+    calls = []
+
+    def render():
+        calls.append(1)
+        release.wait(5)
+        return (b"png", 200, {"Content-Type": "image/png"})
+
+    threads, results, errors = run_concurrently(flight, "key", render, 5)
+    # Let all threads reach the flight before releasing the leader
+    while flight._flights.get("key") is None or flight._flights["key"].waiters < 4:
+        sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert errors == [None] * 5
+    assert all(r == (b"png", 200, {"Content-Type": "image/png"}) for r in results)
+    # Each waiter gets its own headers dictionary
+    assert len({id(r[2]) for r in results}) == 5
+    # Completed flights are not reused
+    assert flight.do("key", lambda: "new") == "new"
+
+
+def test_single_flight_shares_exception():
+    flight = SingleFlight()
+    release = Event()
+
+    def render():
+        release.wait(5)
+        raise ValueError("render failed")
+
+    threads, results, errors = run_concurrently(flight, "key", render, 3)
+    while flight._flights.get("key") is None or flight._flights["key"].waiters < 2:
+        sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert not flight._flights
+
+
+def test_coalescing_key():
+    args = {"layers": "a", "styles": "", "bbox": "1,2,3,4", "requestid": "123", "url_root": "http://x/"}
+    key = coalescing_key(args)
+    assert key == coalescing_key({**args, "requestid": "456", "host": "y"})
+    assert key != coalescing_key({**args, "bbox": "1,2,3,5"})
+
+
+@pytest.mark.parametrize("enabled, args", [
+    (False, {"layers": "a"}),
+    (True, {"layers": "a", "ows_stats": "yes"}),
+])
+def test_coalesced_bypass(enabled, args):
+    cfg = MagicMock()
+    cfg.request_coalescing = enabled
+    fn = MagicMock(return_value="resp")
+    assert coalesced(cfg, args, fn) == "resp"
+    fn.assert_called_once_with(args)
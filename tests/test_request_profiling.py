@@ -0,0 +1,116 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import pstats
+from time import time
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask
+
+import datacube_ows.request_profiling
+from datacube_ows.request_profiling import profile_signature, profiled_request
+
+
+@pytest.fixture
+def profile_cfg(monkeypatch, tmp_path):
+    cfg = MagicMock()
+    cfg.profile_dir = str(tmp_path)
+    cfg.profile_secret = "s3cr3t"
+    cfg.profile_sample_rate = 0.0
+    cfg.response_headers = lambda d: d
+    monkeypatch.setattr(datacube_ows.request_profiling, "get_config", lambda: cfg)
+    return cfg
+
+
+@pytest.fixture
+def profiled_client():
+    app = Flask(__name__)
+
+    @app.route("/")
+    @profiled_request
+    def view():
+        return "image", 200, {"Content-Type": "image/png"}
+
+    return app.test_client()
+
+
+@pytest.fixture
+def expires():
+    return int(time()) + 600
+
+
+def test_profile_signature():
+    args = {"request": "GetMap", "layers": "lyr"}
+    sig = profile_signature("s3cr3t", args, 1700000000)
+    # Parameter names are case-insensitive and profiling parameters are not signed
+    assert profile_signature("s3cr3t", {"LAYERS": "lyr", "Request": "GetMap", "ows_profile": sig,
+                                        "ows_profile_return": "yes", "ows_profile_expires": "1700000000"},
+                             1700000000) == sig
+    assert profile_signature("s3cr3t", {"request": "GetMap", "layers": "lyr2"}, 1700000000) != sig
+    assert profile_signature("other", args, 1700000000) != sig
+    # The expiry time is signed
+    assert profile_signature("s3cr3t", args, 1700000001) != sig
+
+
+def test_unprofiled_request(profile_cfg, profiled_client, tmp_path):
+    rv = profiled_client.get("/?request=GetMap&layers=lyr")
+    assert rv.data == b"image"
+    assert not list(tmp_path.iterdir())
+
+
+def test_signed_request(profile_cfg, profiled_client, tmp_path, expires):
+    sig = profile_signature("s3cr3t", {"request": "GetMap", "layers": "lyr"}, expires)
+    rv = profiled_client.get(f"/?request=GetMap&layers=lyr&ows_profile={sig}&ows_profile_expires={expires}")
+    assert rv.data == b"image"
+    profiles = list(tmp_path.iterdir())
+    assert len(profiles) == 1
+    assert "-getmap-lyr-" in profiles[0].name
+    assert pstats.Stats(str(profiles[0])).total_calls > 0
+
+
+def test_signed_request_return(profile_cfg, profiled_client, tmp_path, expires):
+    sig = profile_signature("s3cr3t", {"request": "GetMap", "layers": "lyr"}, expires)
+    rv = profiled_client.get(f"/?request=GetMap&layers=lyr&ows_profile={sig}&ows_profile_expires={expires}"
+                             "&ows_profile_return=yes")
+    assert rv.headers["Content-Type"] == "text/plain"
+    assert b"cumulative" in rv.data
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_bad_signature(profile_cfg, profiled_client, tmp_path, expires):
+    sig = profile_signature("s3cr3t", {"request": "GetMap", "layers": "lyr"}, expires)
+    rv = profiled_client.get(f"/?request=GetMap&layers=other&ows_profile={sig}&ows_profile_expires={expires}"
+                             "&ows_profile_return=yes")
+    assert rv.data == b"image"
+    assert not list(tmp_path.iterdir())
+    # Expiry time changed
+    rv = profiled_client.get(f"/?request=GetMap&layers=lyr&ows_profile={sig}&ows_profile_expires={expires + 1}"
+                             "&ows_profile_return=yes")
+    assert rv.data == b"image"
+    assert not list(tmp_path.iterdir())
+    profile_cfg.profile_secret = None
+    rv = profiled_client.get(f"/?request=GetMap&layers=lyr&ows_profile={sig}&ows_profile_expires={expires}"
+                             "&ows_profile_return=yes")
+    assert rv.data == b"image"
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("expiry", ["", "&ows_profile_expires=soon", "&ows_profile_expires={expired}"])
+def test_expired_signature(profile_cfg, profiled_client, tmp_path, expiry):
+    expired = int(time()) - 1
+    sig = profile_signature("s3cr3t", {"request": "GetMap", "layers": "lyr"}, expired)
+    rv = profiled_client.get(f"/?request=GetMap&layers=lyr&ows_profile={sig}&ows_profile_return=yes"
+                             + expiry.format(expired=expired))
+    assert rv.data == b"image"
+    assert not list(tmp_path.iterdir())
+
+
+def test_sampled_request(profile_cfg, profiled_client, tmp_path):
+    profile_cfg.profile_sample_rate = 1.0
+    rv = profiled_client.get("/?request=GetMap&layers=lyr&ows_profile_return=yes")
+    # Sampled requests are saved, but never returned
+    assert rv.data == b"image"
+    assert len(list(tmp_path.iterdir())) == 1
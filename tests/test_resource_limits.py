@@ -47,3 +47,17 @@ def test_degree_to_metres():
     )
     assert xres > 1.0
     assert yres > 1.0
+
+
+def test_check_time_series():
+    from unittest.mock import MagicMock
+    global_cfg = MagicMock()
+    global_cfg.wcs_default_descov_age = 0
+    rules = datacube_ows.resource_limits.OWSResourceManagementRules(global_cfg, {}, "test")
+    rules.check_time_series(1000000)
+    rules = datacube_ows.resource_limits.OWSResourceManagementRules(
+        global_cfg, {"wms": {"max_time_series_datasets": 10}}, "test")
+    rules.check_time_series(10)
+    with pytest.raises(datacube_ows.resource_limits.ResourceLimited) as e:
+        rules.check_time_series(11)
+    assert "too many datasets" in str(e.value)
@@ -0,0 +1,128 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import datetime
+from contextlib import contextmanager
+from unittest.mock import MagicMock
+
+import click
+import pytest
+
+import datacube_ows.seed_impl
+import datacube_ows.tile_cache
+from datacube_ows.seed_impl import (CACHED, EMPTY, RENDERED, SeedTile, batched,
+                                    parse_zoom_levels, seed_batch,
+                                    seed_tiles_for_layer)
+from datacube_ows.tile_cache import (FilesystemTileCache, cached_tile_response,
+                                     tile_key, tile_time)
+from datacube_ows.tile_matrix_sets import TileMatrixSet
+from datacube_ows.time_index import TimeIndex
+
+
+@pytest.fixture
+def tms():
+    tms = MagicMock()
+    tms.identifier = "tms"
+    tms.scale_set = [1.0] * 10
+    tms.metatile_size = 1
+    tms.tile_range.side_effect = lambda tm, *extent: (0, tm, 0, 1) if tm else None
+    return tms
+
+
+def test_parse_zoom_levels(tms):
+    assert list(parse_zoom_levels("3", tms)) == [3]
+    assert list(parse_zoom_levels("2-5", tms)) == [2, 3, 4, 5]
+    for bad in ("x", "5-2", "0-10", "-1"):
+        with pytest.raises(click.BadParameter):
+            parse_zoom_levels(bad, tms)
+
+
+def test_seed_tiles_for_layer(tms):
+    layer = MagicMock()
+    layer.name = "layer"
+    tiles = list(seed_tiles_for_layer(layer, ["s1", "s2"], tms, [0, 1], (0.0, 0.0, 1.0, 1.0), ["2020-01-01"]))
+    # zoom 0 has no tiles, zoom 1 has 2x2 tiles, for each of 2 styles
+    assert len(tiles) == 8
+    assert {(t.style, t.tile_matrix, t.row, t.col) for t in tiles} == {
+        (s, 1, r, c) for s in ("s1", "s2") for r in (0, 1) for c in (0, 1)
+    }
+    assert tiles[0].wmts_args()["tilematrixset"] == "tms"
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
+
+
+@pytest.fixture
+def seed_env(tmp_path, monkeypatch):
+    cfg = MagicMock()
+    cfg.published_CRSs = {
+        "EPSG:3857": {
+            "geographic": False,
+            "horizontal_coord": "x",
+            "vertical_coord": "y",
+            "vertical_coord_first": False
+        },
+    }
+    tms = TileMatrixSet("WholeWorld_WebMercator",
+                        TileMatrixSet.default_tm_sets["WholeWorld_WebMercator"], cfg)
+    cfg.tile_matrix_sets = {"WholeWorld_WebMercator": tms}
+    cfg.request_lock_dir = None
+    layer = MagicMock()
+    layer.name = "layer"
+    layer.ranges_version = "v1"
+    layer.default_style.name = "style"
+    layer.resource_limits.wms_cache_rules.use_caching = True
+    layer.time_resolution.is_subday.return_value = False
+    layer.time_index = TimeIndex.from_dates([datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)])
+    cfg.product_index = {"layer": layer}
+    cache = FilesystemTileCache(str(tmp_path / "tiles"), max_size=1000000)
+    rendered = []
+    n_datasets = {"n": 1}
+
+    def render_tile(cfg, tms, key, wms_args):
+        rendered.append(wms_args)
+        return b"png:" + wms_args["time"].encode(), 200, {"Cache-Control": "max-age=60",
+                                                          "Content-Type": "image/png"}
+
+    @contextmanager
+    def cube():
+        yield MagicMock()
+
+    stacker = MagicMock()
+    stacker.return_value.datasets.side_effect = lambda *args, **kwargs: n_datasets["n"]
+    monkeypatch.setattr(datacube_ows.seed_impl, "get_config", lambda: cfg)
+    monkeypatch.setattr(datacube_ows.seed_impl, "get_tile_cache", lambda cfg: cache)
+    monkeypatch.setattr(datacube_ows.tile_cache, "get_tile_cache", lambda cfg: cache)
+    monkeypatch.setattr(datacube_ows.seed_impl, "GetMapParameters", MagicMock())
+    monkeypatch.setattr(datacube_ows.seed_impl, "DataStacker", stacker)
+    monkeypatch.setattr(datacube_ows.seed_impl, "cube", cube)
+    monkeypatch.setattr(datacube_ows.seed_impl, "render_tile", render_tile)
+    return cfg, layer, tms, cache, rendered, n_datasets
+
+
+def test_seed_batch(seed_env):
+    cfg, layer, tms, cache, rendered, n_datasets = seed_env
+    tiles = [SeedTile("layer", "style", tms.identifier, 2, 1, col, tile_time(layer, None)) for col in range(3)]
+    assert seed_batch(tiles) == {RENDERED: 3}
+    assert len(rendered) == 3
+    assert seed_batch(tiles) == {CACHED: 3}
+    assert len(rendered) == 3
+    assert seed_batch(tiles, force=True) == {RENDERED: 3}
+    n_datasets["n"] = 0
+    assert seed_batch([tiles[0]._replace(row=0)]) == {EMPTY: 1}
+    assert len(rendered) == 6
+
+
+def test_seeded_default_time_served(seed_env):
+    cfg, layer, tms, cache, rendered, n_datasets = seed_env
+    seed_batch([SeedTile("layer", "style", tms.identifier, 2, 1, 1, tile_time(layer, None))])
+    assert rendered[0]["time"] == "2020-01-02"
+    # A request without a time (e.g. WMTS GetTile) is served the seeded tile
+    render = MagicMock()
+    key = tile_key(layer, "style", tms, 2, 1, 1, "", "image/png")
+    assert cached_tile_response(cfg, layer, key, render)[0] == b"png:2020-01-02"
+    render.assert_not_called()
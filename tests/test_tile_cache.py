@@ -0,0 +1,367 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import datetime
+from io import BytesIO
+from threading import Thread
+from time import sleep, time
+from unittest.mock import MagicMock
+
+import pytest
+from PIL import Image
+
+from datacube_ows.ogc_utils import ConfigException
+from datacube_ows.tile_cache import (CachedTile, FilesystemTileCache,
+                                     SQLiteTileCache, TileKey, aligned_tile,
+                                     cached_tile_response, create_tile_cache,
+                                     response_max_age, split_metatile,
+                                     tile_key, tile_lock, tile_time)
+from datacube_ows.tile_matrix_sets import TileMatrixSet
+from datacube_ows.time_index import TimeIndex
+
+
+def make_key(row=0, col=0, ranges_version="v1"):
+    return TileKey("layer", "style", "WholeWorld_WebMercator", 3, row, col, "2020-01-01", "image/png",
+                   ranges_version)
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def tile_cache(request, tmp_path):
+    if request.param == "file":
+        return FilesystemTileCache(str(tmp_path / "tiles"), max_size=1000)
+    return SQLiteTileCache(str(tmp_path / "tiles.sqlite"), max_size=1000)
+
+
+def test_cache_get_put(tile_cache):
+    key = make_key()
+    assert tile_cache.get(key) is None
+    tile_cache.put(key, CachedTile(b"tiledata", {"Content-Type": "image/png"}, time() + 60))
+    tile = tile_cache.get(key)
+    assert tile.body == b"tiledata"
+    assert tile.headers["Content-Type"] == "image/png"
+    assert tile_cache.get(make_key(col=1)) is None
+    assert tile_cache.get(make_key(ranges_version="v2")) is None
+
+
+def test_cache_expiry(tile_cache):
+    key = make_key()
+    tile_cache.put(key, CachedTile(b"tiledata", {}, time() - 1))
+    assert tile_cache.get(key) is None
+
+
+def test_cache_eviction(tile_cache):
+    for col in range(20):
+        tile_cache.put(make_key(col=col), CachedTile(b"x" * 100, {}, time() + 60))
+    cached = [col for col in range(20) if tile_cache.get(make_key(col=col)) is not None]
+    assert 0 < len(cached) < 20
+    # Most recently written tiles are retained.
+    assert 19 in cached
+
+
+def test_create_tile_cache(tmp_path):
+    assert isinstance(create_tile_cache(f"file://{tmp_path}/tiles"), FilesystemTileCache)
+    assert isinstance(create_tile_cache(f"sqlite://{tmp_path}/tiles.db"), SQLiteTileCache)
+    with pytest.raises(ConfigException) as e:
+        create_tile_cache("s3://bucket/tiles")
+    assert "Unsupported tile cache URL" in str(e.value)
+
+
+def test_response_max_age():
+    assert response_max_age({"Cache-Control": "public, max-age=3600"}) == 3600
+    assert response_max_age({"cache-control": "no-cache"}) == 0
+    assert response_max_age({"Content-Type": "image/png"}) == 0
+
+
+@pytest.fixture
+def tms_cfg():
+    cfg = MagicMock()
+    cfg.published_CRSs = {
+        "EPSG:3857": {
+            "geographic": False,
+            "horizontal_coord": "x",
+            "vertical_coord": "y",
+            "vertical_coord_first": False
+        },
+    }
+    tms = TileMatrixSet("WholeWorld_WebMercator",
+                        TileMatrixSet.default_tm_sets["WholeWorld_WebMercator"], cfg)
+    cfg.tile_matrix_sets = {"WholeWorld_WebMercator": tms}
+    cfg.request_lock_dir = None
+    return cfg
+
+
+def test_aligned_tile(tms_cfg):
+    tms = tms_cfg.tile_matrix_sets["WholeWorld_WebMercator"]
+    bbox = ",".join(str(c) for c in tms.wms_bbox_coords(5, 11, 27))
+    args = {"crs": "EPSG:3857", "width": "256", "height": "256", "bbox": bbox}
+    assert aligned_tile(tms_cfg, args) == (tms, 5, 11, 27)
+
+
+def test_not_aligned_tile(tms_cfg):
+    tms = tms_cfg.tile_matrix_sets["WholeWorld_WebMercator"]
+    bbox = tms.wms_bbox_coords(5, 11, 27)
+    args = {"crs": "EPSG:3857", "width": "256", "height": "256",
+            "bbox": ",".join(str(c + 100.0) for c in bbox)}
+    assert aligned_tile(tms_cfg, args) is None
+    args["bbox"] = ",".join(str(c) for c in bbox)
+    args["width"] = "512"
+    assert aligned_tile(tms_cfg, args) is None
+    args["width"] = "256"
+    args["crs"] = "EPSG:4326"
+    assert aligned_tile(tms_cfg, args) is None
+    args["crs"] = "EPSG:3857"
+    args["bbox"] = "notabbox"
+    assert aligned_tile(tms_cfg, args) is None
+
+
+def test_tile_time():
+    layer = MagicMock()
+    layer.time_resolution.is_subday.return_value = False
+    layer.time_index = TimeIndex.from_dates([datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)])
+    # No time: the latest time, as rendered by GetMap
+    assert tile_time(layer, None) == tile_time(layer, "") == "2020-01-02"
+    assert tile_time(layer, "2020-01-02T00:00:00") == "2020-01-02"
+    assert tile_time(layer, "2020-01-01,2020-01-02") == "2020-01-01,2020-01-02"
+    assert tile_time(layer, "notadate") == "notadate"
+    layer.time_index = TimeIndex.from_dates([], subday=True)
+    assert tile_time(layer, "") == ""
+    layer.time_resolution.is_subday.return_value = True
+    assert tile_time(layer, "2020-01-02T10:00:00Z") == tile_time(layer, "2020-01-02T20:00:00+10:00") \
+           == "2020-01-02T10:00:00+00:00"
+
+
+def test_tile_key_time(tms_cfg):
+    layer = MagicMock()
+    layer.name = "layer"
+    layer.ranges_version = "v1"
+    layer.time_resolution.is_subday.return_value = False
+    layer.time_index = TimeIndex.from_dates([datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)])
+    tms = tms_cfg.tile_matrix_sets["WholeWorld_WebMercator"]
+    assert tile_key(layer, "style", tms, 5, 11, 27, "", "image/png") \
+           == tile_key(layer, "style", tms, 5, 11, 27, "2020-01-02", "image/png")
+    assert tile_key(layer, "style", tms, 5, 11, 27, "", "image/png") \
+           != tile_key(layer, "style", tms, 5, 11, 27, "2020-01-01", "image/png")
+
+
+def test_user_band_math_not_cached(tmp_path, tms_cfg, monkeypatch):
+    import datacube_ows.tile_cache
+    import datacube_ows.wms
+    monkeypatch.setattr(datacube_ows.tile_cache, "_tile_cache", None)
+    cfg = tms_cfg
+    cfg.tile_cache_url = f"file://{tmp_path}/tiles"
+    cfg.tile_cache_max_size = 1000000
+    layer = MagicMock()
+    layer.name = "layer"
+    layer.ranges_version = "v1"
+    layer.resource_limits.wms_cache_rules.use_caching = True
+    layer.time_resolution.is_subday.return_value = False
+    layer.time_index = TimeIndex.from_dates([datetime.date(2020, 1, 1)])
+    layer.default_style.name = "style"
+    cfg.product_index = {"layer": layer}
+    calls = []
+
+    def get_map(args):
+        calls.append(args)
+        return args.get("code", "default").encode(), 200, {"Cache-Control": "max-age=60"}
+
+    monkeypatch.setattr(datacube_ows.wms, "get_config", lambda: cfg)
+    monkeypatch.setattr(datacube_ows.wms, "get_map", get_map)
+    monkeypatch.setattr(datacube_ows.wms, "render_tile", lambda cfg, tms, key, args: get_map(args))
+    tms = cfg.tile_matrix_sets["WholeWorld_WebMercator"]
+    args = {"layers": "layer", "styles": "", "crs": "EPSG:3857", "width": "256", "height": "256",
+            "bbox": ",".join(str(c) for c in tms.wms_bbox_coords(5, 11, 27)), "format": "image/png"}
+    assert datacube_ows.wms.get_tile_aligned_map(args)[0] == b"default"
+    assert datacube_ows.wms.get_tile_aligned_map(args)[0] == b"default"
+    # Served from the cache
+    assert len(calls) == 1
+    ubm_args = dict(args, colorscheme="viridis")
+    assert datacube_ows.wms.get_tile_aligned_map(dict(ubm_args, code="red"))[0] == b"red"
+    assert datacube_ows.wms.get_tile_aligned_map(dict(ubm_args, code="blue"))[0] == b"blue"
+    assert len(calls) == 3
+
+
+def test_cached_tile_response(tmp_path, tms_cfg, monkeypatch):
+    import datacube_ows.tile_cache
+    monkeypatch.setattr(datacube_ows.tile_cache, "_tile_cache", None)
+    cfg = tms_cfg
+    cfg.tile_cache_url = f"file://{tmp_path}/tiles"
+    cfg.tile_cache_max_size = 1000000
+    layer = MagicMock()
+    layer.name = "layer"
+    layer.ranges_version = "v1"
+    layer.resource_limits.wms_cache_rules.use_caching = True
+    key = tile_key(layer, "style", cfg.tile_matrix_sets["WholeWorld_WebMercator"], 5, 11, 27,
+                   "2020-01-01", "image/png")
+    render = MagicMock(return_value=(b"png", 200, {"Cache-Control": "max-age=60"}))
+    assert cached_tile_response(cfg, layer, key, render) == (b"png", 200, {"Cache-Control": "max-age=60"})
+    assert cached_tile_response(cfg, layer, key, render) == (b"png", 200, {"Cache-Control": "max-age=60"})
+    assert render.call_count == 1
+
+    layer.resource_limits.wms_cache_rules.use_caching = False
+    cached_tile_response(cfg, layer, key, render)
+    assert render.call_count == 2
+
+
+def png_bytes(img):
+    out = BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_split_metatile():
+    img = Image.new("RGBA", (512, 256))
+    img.paste((255, 0, 0, 255), (256, 0, 512, 256))
+    tiles = split_metatile(png_bytes(img), 1, 2, (256, 256))
+    assert len(tiles) == 1 and len(tiles[0]) == 2
+    with Image.open(BytesIO(tiles[0][0])) as left, Image.open(BytesIO(tiles[0][1])) as right:
+        assert left.size == right.size == (256, 256)
+        assert left.getpixel((10, 10)) == (0, 0, 0, 0)
+        assert right.getpixel((10, 10)) == (255, 0, 0, 255)
+
+
+def test_render_metatile(tmp_path, tms_cfg, monkeypatch):
+    import datacube_ows.tile_cache
+    import datacube_ows.wmts
+    from datacube_ows.wmts import render_tile
+    monkeypatch.setattr(datacube_ows.tile_cache, "_tile_cache", None)
+    cfg = tms_cfg
+    cfg.tile_cache_url = f"file://{tmp_path}/tiles"
+    cfg.tile_cache_max_size = 1000000
+    cfg.wms_max_width = cfg.wms_max_height = 512
+    tms = cfg.tile_matrix_sets["WholeWorld_WebMercator"]
+    tms.metatile_size = 2
+    calls = []
+
+    def get_map(args):
+        calls.append(args)
+        img = Image.new("RGBA", (args["width"], args["height"]))
+        return png_bytes(img), 200, {"Cache-Control": "max-age=60", "Content-Type": "image/png"}
+
+    monkeypatch.setattr(datacube_ows.wmts, "get_map", get_map)
+    monkeypatch.setattr(datacube_ows.wmts, "metatile_cacheable", lambda meta_args: True)
+    key = make_key(row=3, col=2)._replace(tile_matrix=5)
+    wms_args = {"bbox": "", "width": 256, "height": 256, "time": "2020-01-01"}
+    body, status, headers = render_tile(cfg, tms, key, wms_args)
+    assert status == 200
+    assert len(calls) == 1
+    assert calls[0]["width"] == 512 and calls[0]["height"] == 512
+    top_left = tms.wms_bbox_coords(5, 2, 2)
+    bottom_right = tms.wms_bbox_coords(5, 3, 3)
+    assert [float(c) for c in calls[0]["bbox"].split(",")] == pytest.approx(
+        [top_left[0], bottom_right[1], bottom_right[2], top_left[3]])
+    with Image.open(BytesIO(body)) as img:
+        assert img.size == (256, 256)
+    cache = datacube_ows.tile_cache.get_tile_cache(cfg)
+    # Neighbours are cached, the requested tile is returned (and cached by the caller)
+    for row, col in ((2, 2), (2, 3), (3, 3)):
+        assert cache.get(key._replace(row=row, col=col)) is not None
+    assert cache.get(key) is None
+
+    # Metatile too large - single tile rendered
+    calls.clear()
+    cfg.wms_max_width = 256
+    render_tile(cfg, tms, key, wms_args)
+    assert calls == [wms_args]
+
+
+def test_render_metatile_uncacheable(tmp_path, tms_cfg, monkeypatch):
+    import datacube_ows.tile_cache
+    import datacube_ows.wmts
+    from datacube_ows.wmts import render_tile
+    monkeypatch.setattr(datacube_ows.tile_cache, "_tile_cache", None)
+    cfg = tms_cfg
+    cfg.tile_cache_url = f"file://{tmp_path}/tiles"
+    cfg.tile_cache_max_size = 1000000
+    cfg.wms_max_width = cfg.wms_max_height = 512
+    tms = cfg.tile_matrix_sets["WholeWorld_WebMercator"]
+    tms.metatile_size = 2
+    calls = []
+    cacheable = {"metatile": False}
+
+    def get_map(args):
+        calls.append(args)
+        img = Image.new("RGBA", (args["width"], args["height"]))
+        return png_bytes(img), 200, {"Cache-Control": "no-cache", "Content-Type": "image/png"}
+
+    monkeypatch.setattr(datacube_ows.wmts, "get_map", get_map)
+    monkeypatch.setattr(datacube_ows.wmts, "metatile_cacheable", lambda meta_args: cacheable["metatile"])
+    key = make_key(row=3, col=2)._replace(tile_matrix=5)
+    wms_args = {"bbox": "", "width": 256, "height": 256, "time": "2020-01-01"}
+    # Known to be uncacheable before rendering: only the single tile is rendered
+    render_tile(cfg, tms, key, wms_args)
+    assert calls == [wms_args]
+
+    # Unexpectedly uncacheable: the tile is cut from the metatile, and nothing is re-rendered or cached
+    calls.clear()
+    cacheable["metatile"] = True
+    body, status, headers = render_tile(cfg, tms, key, wms_args)
+    assert len(calls) == 1
+    assert calls[0]["width"] == 512
+    with Image.open(BytesIO(body)) as img:
+        assert img.size == (256, 256)
+    cache = datacube_ows.tile_cache.get_tile_cache(cfg)
+    assert cache.get(key._replace(row=2, col=2)) is None
+
+
+def test_metatile_cacheable(monkeypatch):
+    from contextlib import contextmanager
+
+    import datacube_ows.wmts
+    from datacube_ows.resource_limits import ResourceLimited
+    from datacube_ows.wmts import metatile_cacheable
+    params = MagicMock()
+    limits = params.return_value.product.resource_limits
+    limits.wms_cache_rules.cache_headers.side_effect = lambda n: {"cache-control": f"max-age={60 if n else 0}"}
+    stacker = MagicMock()
+    n_datasets = {"n": 3}
+    stacker.return_value.datasets.side_effect = lambda *args, **kwargs: n_datasets["n"]
+
+    @contextmanager
+    def cube():
+        yield MagicMock()
+
+    monkeypatch.setattr(datacube_ows.wmts, "GetMapParameters", params)
+    monkeypatch.setattr(datacube_ows.wmts, "DataStacker", stacker)
+    monkeypatch.setattr(datacube_ows.wmts, "cube", cube)
+    assert metatile_cacheable({})
+    n_datasets["n"] = 0
+    assert not metatile_cacheable({})
+    n_datasets["n"] = 3
+    limits.check_wms.side_effect = ResourceLimited(["too many datasets"])
+    assert not metatile_cacheable({})
+
+
+def test_tile_lock(tmp_path):
+    key = make_key()
+    events = []
+
+    def worker():
+        with tile_lock(str(tmp_path), key):
+            events.append("start")
+            sleep(0.1)
+            events.append("end")
+
+    threads = [Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Never more than one holder at a time
+    assert events == ["start", "end"] * 3
+    # Lock files are removed on release
+    assert not list(tmp_path.iterdir())
+
+
+def test_tile_lock_timeout(tmp_path):
+    key = make_key()
+    with tile_lock(str(tmp_path), key):
+        start = time()
+        with tile_lock(str(tmp_path), key, timeout=0.2):
+            assert time() - start >= 0.2
+
+
+def test_tile_lock_disabled():
+    with tile_lock(None, make_key()):
+        pass
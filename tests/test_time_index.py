@@ -0,0 +1,90 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import datetime
+
+from datacube_ows.time_index import TimeIndex
+
+utc = datetime.timezone.utc
+
+
+def test_dates():
+    idx = TimeIndex.from_dates([datetime.date(2010, 1, 3), datetime.date(2010, 1, 1), datetime.date(2010, 1, 3)])
+    assert len(idx) == 2
+    assert idx == [datetime.date(2010, 1, 1), datetime.date(2010, 1, 3)]
+    assert idx[0] == datetime.date(2010, 1, 1)
+    assert idx[-1] == datetime.date(2010, 1, 3)
+    assert isinstance(idx[1:], TimeIndex)
+    assert idx[1:] == [datetime.date(2010, 1, 3)]
+    assert datetime.date(2010, 1, 3) in idx
+    assert datetime.date(2010, 1, 2) not in idx
+    assert datetime.date(2011, 1, 1) not in idx
+    # Datetimes are not dates
+    assert datetime.datetime(2010, 1, 3) not in idx
+    assert "2010-01-03" not in idx
+
+
+def test_subday():
+    times = [
+        datetime.datetime(2010, 1, 1, 10, 15, tzinfo=utc),
+        datetime.datetime(2010, 1, 1, 20, 15, tzinfo=datetime.timezone(datetime.timedelta(hours=10))),
+    ]
+    # The same instant in different timezones
+    idx = TimeIndex.from_dates(times, subday=True)
+    assert list(idx) == [datetime.datetime(2010, 1, 1, 10, 15, tzinfo=utc)]
+    assert idx[0].tzinfo == utc
+    assert times[0] in idx
+    assert times[1] in idx
+    assert datetime.datetime(2010, 1, 1, 10, 15) not in idx
+    assert datetime.date(2010, 1, 1) not in idx
+
+
+def test_packed():
+    dates = TimeIndex.from_dates([datetime.date(2010, 1, 1), datetime.date(2020, 6, 30)])
+    assert len(dates.packed()) == 16
+    assert TimeIndex.from_packed(dates.packed()) == dates
+    assert TimeIndex.from_packed(memoryview(dates.packed())) == dates
+    times = TimeIndex.from_dates([datetime.datetime(2010, 1, 1, 10, 15, 30, 123456, tzinfo=utc)], subday=True)
+    assert TimeIndex.from_packed(times.packed(), subday=True) == times
+    assert TimeIndex.from_packed(times.packed(), subday=True)[0].microsecond == 123456
+    assert TimeIndex.from_packed(b"") == []
+
+
+def test_between():
+    idx = TimeIndex.from_dates([datetime.date(2021, 1, d) for d in (6, 7, 8, 10)])
+    assert idx.between(datetime.date(2021, 1, 7), datetime.date(2021, 1, 9)) == [
+        datetime.date(2021, 1, 7), datetime.date(2021, 1, 8)
+    ]
+    assert idx.between(datetime.date(2021, 1, 8)) == [datetime.date(2021, 1, 8), datetime.date(2021, 1, 10)]
+    assert idx.between(end=datetime.date(2021, 1, 6)) == [datetime.date(2021, 1, 6)]
+    assert idx.between() == idx
+    assert not idx.between(datetime.date(2021, 1, 11))
+    assert not idx.between(datetime.date(2021, 1, 9), datetime.date(2021, 1, 7))
+    # Datetime bounds are truncated to dates
+    assert len(idx.between(datetime.datetime(2021, 1, 8, 12), datetime.datetime(2021, 1, 10, 1))) == 2
+
+
+def test_between_subday():
+    times = [datetime.datetime(2021, 1, 6, h, tzinfo=utc) for h in (1, 5, 23)]
+    idx = TimeIndex.from_dates(times, subday=True)
+    assert idx.between(datetime.datetime(2021, 1, 6, 1, tzinfo=utc),
+                       datetime.datetime(2021, 1, 6, 4, 59, tzinfo=utc)) == times[:1]
+    # Naive bounds are UTC, date bounds are midnight UTC
+    assert idx.between(datetime.datetime(2021, 1, 6, 2)) == times[1:]
+    assert idx.between(datetime.date(2021, 1, 6), datetime.date(2021, 1, 7)) == times
+
+
+def test_matches_second():
+    idx = TimeIndex.from_dates([
+        datetime.datetime(1991, 8, 3, 22, 15, 24, 543632, tzinfo=utc),
+        datetime.datetime(1996, 1, 23, 12, 15, 25, 723411, tzinfo=utc),
+        datetime.datetime(1996, 1, 23, 12, 15, 27, 12, tzinfo=utc),
+    ], subday=True)
+    assert idx.matches_second(datetime.datetime(1991, 8, 3, 22, 15, 24, 122234, tzinfo=utc))
+    assert idx.matches_second(datetime.datetime(1996, 1, 23, 12, 15, 25, tzinfo=utc))
+    assert idx.matches_second(datetime.datetime(1996, 1, 23, 12, 15, 27, 999999, tzinfo=utc))
+    assert not idx.matches_second(datetime.datetime(1996, 1, 23, 12, 15, 26, 723411, tzinfo=utc))
+    assert not idx.matches_second(datetime.datetime(2016, 1, 23, 12, 15, 26, tzinfo=utc))
+    assert not TimeIndex.from_dates([], subday=True).matches_second(datetime.datetime(2016, 1, 23, tzinfo=utc))
@@ -8,7 +8,8 @@ import datetime
 import pytest
 from affine import Affine
 
-from datacube_ows.ows_configuration import OWSConfig, OWSProductLayer
+from datacube_ows.ows_configuration import (OWSConfig, OWSProductLayer,
+                                            RangeState)
 from datacube_ows.wcs_scaler import (SpatialParameter, WCSScaler,
                                      WCSScalerUnknownDimension)
 
@@ -123,7 +124,7 @@ def layer_crs_geom():
     times = [datetime.date(2013, 1, 1), datetime.date(2014, 1, 1), datetime.date(2015, 1, 1),
               datetime.date(2016, 1, 1), datetime.date(2017, 1, 1), datetime.date(2018, 1, 1)]
     product_layer.dynamic = False
-    product_layer._ranges = {
+    product_layer._range_state = RangeState(ranges={
         'lat': {
             'min': -34.5250413940276,
             'max': -33.772472435988
@@ -154,7 +155,7 @@ def layer_crs_geom():
                 'right': 157.105656164263, 'bottom': -45.761684927317
             }
         }
-    }
+    })
     return product_layer
 
 
@@ -4,7 +4,7 @@
 # Copyright (c) 2017-2023 OWS Contributors
 # SPDX-License-Identifier: Apache-2.0
 import datetime
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, PropertyMock
 
 import pytest
 from datacube.utils import geometry
@@ -12,6 +12,7 @@ from datacube.utils import geometry
 import datacube_ows.wms_utils
 from datacube_ows.ogc_exceptions import WMSException
 from datacube_ows.ows_configuration import TimeRes
+from datacube_ows.time_index import TimeIndex
 
 
 def test_parse_time_delta():
@@ -53,6 +54,10 @@ def test_parse_wms_time_strings_with_present():
 def dummy_product():
     dummy = MagicMock()
     dummy.time_resolution = TimeRes.parse("solar")
+    # As for OWSNamedLayer.time_index
+    type(dummy).time_index = PropertyMock(
+        side_effect=lambda: TimeIndex.from_dates(dummy.ranges["times"], dummy.time_resolution.is_subday())
+    )
     return dummy
 
 
@@ -245,6 +250,33 @@ def test_parse_item_2(dummy_product):
     assert "not valid for this layer" in str(e.value)
 
 
+def test_get_time_series_times(dummy_product):
+    dummy_product.ranges = {
+        "times": [
+            datetime.date(2021, 1, 6),
+            datetime.date(2021, 1, 7),
+            datetime.date(2021, 1, 8),
+            datetime.date(2021, 1, 10),
+        ]
+    }
+    dummy_product.ranges["time_set"] = set(dummy_product.ranges["times"])
+    dummy_product.regular_time_axis = False
+
+    times = datacube_ows.wms_utils.get_time_series_times({}, dummy_product)
+    assert times == dummy_product.ranges["times"]
+
+    times = datacube_ows.wms_utils.get_time_series_times({"time": "2021-01-07/2021-01-09"}, dummy_product)
+    assert times == [datetime.date(2021, 1, 7), datetime.date(2021, 1, 8)]
+
+    times = datacube_ows.wms_utils.get_time_series_times({"time": "2021-01-10,2021-01-06/2021-01-07,2021-01-07"},
+                                                         dummy_product)
+    assert times == [datetime.date(2021, 1, 6), datetime.date(2021, 1, 7), datetime.date(2021, 1, 10)]
+
+    with pytest.raises(WMSException) as e:
+        datacube_ows.wms_utils.get_time_series_times({"time": "2010-01-01/2010-01-08"}, dummy_product)
+    assert "No data available for time dimension value" in str(e.value)
+
+
 def test_get_geobox():
     from datacube_ows.ows_configuration import OWSConfig
     mock_cfg = MagicMock()